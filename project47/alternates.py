@@ -0,0 +1,86 @@
+from collections.abc import Mapping
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AlternatesIndex(Mapping):
+    """Which locations can be used in place of each other, stored as compressed arrays
+
+    Every location belongs to exactly one group (most groups are just the one location). The members of group g are
+    members[indptr[g]:indptr[g + 1]], and group_of[node] gives the group of a location. So finding the alternates of a
+    location is two array lookups, rather than searching the customer list.
+
+    This is a Mapping from each location to the list of its alternates (not including itself), so it can be passed
+    anywhere the old {location: [alternates]} dict was used, such as the rerouting functions.
+
+    Attributes
+    ----------
+    members : np.array
+        The locations in each group, one group after another
+    indptr : np.array
+        Where each group starts in members. Has one more entry than the number of groups.
+    group_of : np.array
+        The group each location is in
+    """
+
+    def __init__(self, members, indptr, group_of):
+        self.members = members
+        self.indptr = indptr
+        self.group_of = group_of
+
+    @classmethod
+    def from_customers(cls, customers):
+        """Builds the index from the alternates sets of the customers. Linear in the number of customers.
+
+        Alternates that aren't in the customer list (eg they've been delivered already) are left out.
+        """
+        position = {id(c): k for k, c in enumerate(customers)}
+        group_of = np.full(len(customers), -1, dtype=int)
+        members = []
+        indptr = [0]
+        for k, c in enumerate(customers):
+            if group_of[k] >= 0:
+                continue
+            group = sorted(
+                set(position[id(a)] for a in c.alternates if id(a) in position) | {k}
+            )
+            group_of[group] = len(indptr) - 1
+            members.extend(group)
+            indptr.append(len(members))
+        return cls(np.array(members, dtype=int), np.array(indptr, dtype=int), group_of)
+
+    def group(self, node):
+        """All the locations in the same group as node, including node"""
+        g = self.group_of[node]
+        return self.members[self.indptr[g] : self.indptr[g + 1]]
+
+    def groups(self, from_end=False):
+        """Every group, as lists of locations
+
+        Groups are in order of their first location. With from_end, they are in the order multiday has always passed them
+        to the route optimizer instead; working back from the last customer, the group of each one not already seen.
+        """
+        order = range(len(self.indptr) - 1)
+        if from_end:
+            # The members of each group are sorted, so the last is the largest
+            order = np.argsort(-self.members[self.indptr[1:] - 1], kind="stable")
+        return [
+            self.members[self.indptr[g] : self.indptr[g + 1]].tolist() for g in order
+        ]
+
+    def __getitem__(self, node):
+        if not 0 <= node < len(self.group_of):
+            raise KeyError(node)
+        return [int(k) for k in self.group(node) if k != node]
+
+    def __contains__(self, node):
+        return 0 <= node < len(self.group_of)
+
+    def __iter__(self):
+        return iter(range(len(self.group_of)))
+
+    def __len__(self):
+        return len(self.group_of)
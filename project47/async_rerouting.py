@@ -0,0 +1,133 @@
+from project47.simulation import rerouting_new
+from project47.local_repair import late_stops
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RerouteRequest:
+    """A reroute that has been sent off to the solver
+
+    Attributes
+    ----------
+    future : concurrent.futures.Future
+        Resolves to the new route
+    ready_time : number
+        The simulated time the new route reaches the vehicle
+    hold : bool
+        Whether the vehicle waits where it is until the route arrives
+    """
+
+    def __init__(self, future, ready_time, hold):
+        self.future = future
+        self.ready_time = ready_time
+        self.hold = hold
+
+    def result(self):
+        """Waits for the solver if needed, and returns the new route"""
+        return self.future.result()
+
+
+class AsyncRerouter:
+    """Runs reroutes in a thread or process pool, so the simulation doesn't stop while the solver runs
+
+    Policies call this like any other rerouter. Instead of waiting for the solver, it submits the reroute to the pool
+    and straight away returns an interim route: the old plan with any stops that are already too late removed.
+    The new route reaches the vehicle `latency` seconds of simulated time later, which models how long a real
+    dispatcher takes to send out a new plan.
+
+    Swapping the new route in is done by `simulation.EventSimulator`, so this needs to be passed to that as well.
+    Vehicles are stepped in time order there, so reroutes for different vehicles overlap, and run concurrently in the pool.
+    The result is only collected when the simulated latency is up, so the outcome doesn't depend on how fast the solver was.
+    Until it has been passed to a simulator, nothing would collect the results, so each reroute is solved before
+    returning instead. With plain `sim` this just behaves like the rerouter it wraps.
+
+    The default pool uses threads. For the OR-tools solver a ProcessPoolExecutor is usually faster, but the rerouter then
+    has to be picklable (so a module level function like `rerouting_new`, rather than a closure).
+
+    Attributes
+    ----------
+    rerouter : function
+        The rerouting function to run in the pool. Same signature as `rerouting_new`.
+    latency : number
+        Simulated time between asking for a reroute and getting the new route
+    hold : bool
+        If true, vehicles wait where they are until the new route arrives. Otherwise they keep following the interim route.
+    executor : concurrent.futures.Executor
+    requests : int
+        The number of reroutes submitted
+    simulator : EventSimulator
+        The simulator that swaps in the new routes. Set by the simulator, None until then.
+    """
+
+    def __init__(
+        self,
+        rerouter=rerouting_new,
+        latency=60,
+        hold=False,
+        executor=None,
+        workers=None,
+    ):
+        self.rerouter = rerouter
+        self.latency = latency
+        self.hold = hold
+        self.executor = (
+            executor if executor is not None else ThreadPoolExecutor(workers)
+        )
+        self.requests = 0
+        self.simulator = None
+        self._new = []
+
+    def __call__(
+        self,
+        i,
+        route,
+        distance_matrix,
+        time_matrix,
+        time_windows,
+        current_time,
+        alternates={},
+        **kwargs
+    ):
+        if kwargs.get("return_obj", False) or self.simulator is None:
+            return self.rerouter(
+                i,
+                route,
+                distance_matrix,
+                time_matrix,
+                time_windows,
+                current_time,
+                alternates,
+                **kwargs
+            )
+        # The policies edit the time windows in place, so the solver gets its own copy
+        future = self.executor.submit(
+            self.rerouter,
+            i,
+            list(route),
+            distance_matrix,
+            time_matrix,
+            np.array(time_windows),
+            current_time,
+            alternates,
+            **kwargs
+        )
+        self._new.append(RerouteRequest(future, current_time + self.latency, self.hold))
+        self.requests += 1
+        logger.debug("Reroute submitted, ready at %s", current_time + self.latency)
+
+        remaining = list(route[i:])
+        late = set(late_stops(remaining, time_matrix, time_windows, current_time))
+        late.discard(len(remaining) - 1)
+        return [loc for k, loc in enumerate(remaining) if k not in late]
+
+    def drain(self):
+        """Returns the requests submitted since the last call"""
+        new, self._new = self._new, []
+        return new
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,228 @@
+from project47.routing import *
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def presence_matrix(customers):
+    """Packs the presence arrays of all customers into a single matrix
+
+    Customers can have presence arrays of different lengths, so shorter arrays are padded with False.
+    Anything past the end of a customers presence array counts as not present, which is the same as `Customer.visit`.
+
+    Parameters
+    ----------
+    customers : list
+        List of customer objects
+
+    Returns
+    -------
+    presence : np.array
+        n x max_slots boolean matrix
+    intervals : np.array
+        The presence interval of each customer
+    lengths : np.array
+        The length of each customers presence array
+    """
+    lengths = np.array([len(c.presence) for c in customers], dtype=int)
+    intervals = np.array([c.presence_interval for c in customers], dtype=float)
+    presence = np.zeros((len(customers), max(lengths.max(initial=0), 1)), dtype=bool)
+    for i, c in enumerate(customers):
+        presence[i, : lengths[i]] = np.asarray(c.presence, dtype=bool)
+    return presence, intervals, lengths
+
+
+def route_arrays(
+    s: RoutingSolution,
+    distance_matrix,
+    time_matrix,
+    time_windows,
+    wait,
+    multipliers=None,
+):
+    """Flattens the routes of a solution, and computes the arrival time at every stop.
+
+    None of the non-rerouting policies make decisions based on random outcomes, so the arrival times
+    are the same for every replication. They only need to be computed once.
+
+    With random travel times, the arrival times are computed for all replications at once instead, with a leading
+    replication axis on times and arrivals.
+
+    Parameters
+    ----------
+    s : RoutingSolution
+    distance_matrix : np.array
+        nxn matrix of distances
+    time_matrix : np.array
+        nxn matrix of times
+    time_windows : np.array or dict
+        nx2 matrix of time windows, or a dict mapping each location to its window
+    wait : bool
+        If true, vehicles wait for the time window to open if they are early (same as `wait_policy`)
+    multipliers : np.array (Optional)
+        replications x stops travel time multipliers, for the arc into each stop in nodes. See travel_noise.py.
+
+    Returns
+    -------
+    nodes : np.array
+        The node for every stop, excluding the start of each route
+    starts : np.array
+        Index into nodes where each vehicles stops begin
+    distances : list
+        Cumulative distance for each vehicle, in the same format as `sim`
+    times : list
+        Cumulative time for each vehicle, in the same format as `sim`. With multipliers, a list of these for each replication.
+    arrivals : np.array
+        Arrival time at every stop in nodes. With multipliers, replications x stops.
+    """
+    if isinstance(time_windows, dict):
+        time_windows = [time_windows[i] for i in range(len(time_matrix))]
+    time_windows = np.asarray(time_windows)
+    nodes = []
+    starts = []
+    arrivals = []
+    distances = []
+    times = []
+    for route in s.routes:
+        route = np.asarray(route, dtype=int)
+        starts.append(sum(len(n) for n in nodes))
+        nodes.append(route[1:])
+
+        distance = np.concatenate(
+            ([0], np.cumsum(distance_matrix[route[:-1], route[1:]]))
+        )
+        travel = time_matrix[route[:-1], route[1:]]
+        if multipliers is not None:
+            travel = travel * multipliers[:, starts[-1] : starts[-1] + len(route) - 1]
+        # Cumulative along the last axis, so this works with or without the replication axis
+        time = np.concatenate(
+            (np.zeros(travel.shape[:-1] + (1,)), np.cumsum(travel, axis=-1)), axis=-1
+        )
+        if wait:
+            # Waiting at a stop delays every later stop by the same amount, so the arrival time is
+            # the travel time plus the largest wait required so far.
+            early = time_windows[route, 0] - time
+            early[..., 0] = 0
+            time = time + np.maximum.accumulate(np.maximum(early, 0), axis=-1)
+        distances.append(distance.tolist())
+        times.append(time)
+        arrivals.append(time[..., 1:])
+
+    if multipliers is None:
+        times = [time.tolist() for time in times]
+    else:
+        times = [[time[r].tolist() for time in times] for r in range(len(multipliers))]
+    if len(nodes) == 0:
+        arrivals = np.zeros((0,) if multipliers is None else (len(multipliers), 0))
+        return np.array([], dtype=int), np.array([], dtype=int), [], times, arrivals
+    return (
+        np.concatenate(nodes),
+        np.array(starts, dtype=int),
+        distances,
+        times,
+        np.concatenate(arrivals, axis=-1),
+    )
+
+
+def batch_sim(
+    s: RoutingSolution,
+    distance_matrix,
+    time_matrix,
+    time_windows,
+    customers,
+    rg: np.random.Generator,
+    replications=1,
+    wait=False,
+    noise=None,
+):
+    """Simulates many replications of a set of routes at once
+
+    This only works for policies that never reroute; currently `base_policy` (wait=False) and `wait_policy` (wait=True).
+    As the vehicles never change what they do, the arrival time at each stop is fixed, and only the success of each delivery
+    is random. So we compute the arrival times once, look up whether each customer is present in a presence matrix,
+    and then draw all the random numbers for all replications in a single call.
+
+    The results are statistically the same as calling `sim` with the matching policy `replications` times, but they won't
+    be identical, as the random numbers are drawn in a different order.
+
+    With noise, travel times are random too. As with `travel_noise.NoisyTimes` for `sim`, each arc gets one multiplier per
+    replication, however many times it is travelled. The multipliers for every arc used in every replication are drawn in one go,
+    and the arrival times computed for all replications together. Only the arcs in the routes are drawn, rather than the whole
+    matrix, so again the values won't match `sim` with the same rg, just their distribution.
+
+    Parameters
+    ----------
+    s : RoutingSolution
+        The solution for a single day for the routes each vehicle travels
+    distance_matrix : np.array
+        nxn matrix of distances
+    time_matrix : np.array
+        nxn matrix of times
+    time_windows : np.array or dict
+        nx2 matrix of time windows. First column is time window starts, second is ends. Can also be a dict
+        mapping each location to its window.
+    customers : list
+        List of customer objects
+    rg : np.random.Generator
+        Controls the stream of random numbers
+    replications : int
+        The number of replications to simulate
+    wait : bool
+        Whether to wait for time windows to open, as in `wait_policy`
+    noise : LognormalNoise (Optional)
+        Random travel times, see travel_noise.py
+
+    Returns
+    -------
+    list
+        A list with a (distances, times, futile, delivered) tuple for each replication, in the same format `sim` returns.
+        The distances lists are shared between replications, as they are always the same. So are the times, unless there is noise.
+    """
+    logger.debug("Start batch simulation, %i replications", replications)
+    multipliers = None
+    if noise is not None:
+        # The arc into each stop, in the same order as route_arrays flattens them
+        arcs = [
+            (route[k], route[k + 1])
+            for route in s.routes
+            for k in range(len(route) - 1)
+        ]
+        arcs = np.array(arcs, dtype=int).reshape((-1, 2))
+        # One draw for each distinct arc, shared by every stop it leads to
+        unique, arc_index = np.unique(arcs, axis=0, return_inverse=True)
+        multipliers = noise.sample_arcs(
+            unique[:, 0], unique[:, 1], rg, (replications,)
+        )[:, arc_index.reshape(-1)]
+    nodes, starts, distances, times, arrivals = route_arrays(
+        s, distance_matrix, time_matrix, time_windows, wait, multipliers
+    )
+    presence, intervals, lengths = presence_matrix(customers)
+    responsiveness = np.array([c.responsiveness for c in customers], dtype=float)
+
+    # Same indexing as Customer.visit. Broadcast nodes in case there are arrivals for each replication.
+    slots = (arrivals.astype(int) // intervals[nodes]).astype(int)
+    present = slots < lengths[nodes]
+    stop_nodes = np.broadcast_to(nodes, present.shape)
+    present[present] = presence[stop_nodes[present], slots[present]]
+
+    u = rg.random((replications, len(nodes)))
+    success = present & (u < responsiveness[nodes])
+
+    # Futile count per vehicle is the difference of the running count at the route boundaries
+    ends = np.append(starts[1:], len(nodes)).astype(int)
+    failed = np.zeros((replications, len(nodes) + 1))
+    np.cumsum(~success, axis=1, out=failed[:, 1:])
+    futile = failed[:, ends] - failed[:, starts]
+
+    results = []
+    not_depo = nodes != 0
+    for r in range(replications):
+        delivered = nodes[success[r] & not_depo].tolist()
+        results.append(
+            (distances, times if noise is None else times[r], futile[r], delivered)
+        )
+
+    logger.debug("End batch simulation")
+    return results
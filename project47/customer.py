@@ -1,4 +1,5 @@
 import numpy as np
+import math
 
 
 class Customer:
@@ -22,6 +23,11 @@ class Customer:
         The width of each entry in the presence array, in time
     rg : np.random.Generator
         A random bitstream to draw random numbers from
+    call_rg : np.random.Generator
+        The random bitstream for answering calls. Defaults to rg. Keeping these separate means calling a customer doesn't change
+        the outcome of visiting them, see `common_random.CommonRandomNumbers`.
+    key : tuple
+        A stable identifier for the customer, used to pick their random streams. None unless set.
     alternates : list[Customer]
         Alternate customers that the same package could be delivered to instead
     """
@@ -35,6 +41,7 @@ class Customer:
         presence=np.array([1]),
         presence_interval=28800,
         rg=np.random.Generator(np.random.PCG64(123)),
+        call_rg=None,
     ):
         self.lat = lat
         self.lon = lon
@@ -44,6 +51,8 @@ class Customer:
         self.presence_interval = presence_interval
         self.alternates = set([self])
         self.rg = rg
+        self.call_rg = rg if call_rg is None else call_rg
+        self.key = None
 
     def add_alternate(self, c):
         """Adds an alternative delivery customer
@@ -67,13 +76,15 @@ class Customer:
                     alternate.alternates = self.alternates
                     added = True
 
-    def visit(self, time):
+    def visit(self, time, rg=None):
         """Called to determine whether a customer successfully recieves a package.
 
         Parameters
         ----------
         time : int
             The time the visit takes place
+        rg : np.random.Generator (Optional)
+            The stream to draw from, defaults to self.rg
 
         Returns
         -------
@@ -83,7 +94,76 @@ class Customer:
         indp = int(time) // self.presence_interval
         if indp >= len(self.presence):
             return False
-        return bool(self.presence[indp]) and self.rg.random() < self.responsiveness
+        if rg is None:
+            rg = self.rg
+        return bool(self.presence[indp]) and rg.random() < self.responsiveness
+
+    def next_present_slots(self):
+        """For each slot in the presence array, the first slot at or after it where the customer is present
+
+        Slots with nobody present after them map to len(presence). Recomputed if presence is replaced.
+        """
+        if getattr(self, "_next_present_for", None) is not self.presence:
+            present = np.asarray(self.presence, dtype=bool)
+            n = len(present)
+            # Index of each present slot, or n, then a reverse running minimum
+            idx = np.where(present, np.arange(n), n)
+            self._next_present = np.minimum.accumulate(idx[::-1])[::-1]
+            self._next_present_for = self.presence
+        return self._next_present
+
+    def poll(self, first, last, step=5, rg=None):
+        """Visits at first, first + step, ... up to last, stopping at the first success
+
+        This has the same outcome distribution as calling `visit` at each of those times in turn, but uses one random draw.
+        Each visit while present succeeds with probability responsiveness, so the number of present visits up to and
+        including the first success is geometric. We draw that number, then count through the present slots to find
+        which visit it lands on, using `next_present_slots` to skip over the slots where the customer is out.
+
+        Parameters
+        ----------
+        first : number
+            The time of the first visit
+        last : number
+            The time of the last visit
+        step : number
+            The time between visits
+        rg : np.random.Generator (Optional)
+            The stream to draw from, defaults to self.rg
+
+        Returns
+        -------
+        time : number
+            The time of the successful visit, or of the last visit if none succeeded
+        success : bool
+        """
+        if rg is None:
+            rg = self.rg
+        n_visits = int(math.floor((last - first) / step)) + 1
+        if n_visits <= 0 or self.responsiveness <= 0:
+            return last, False
+        m = rg.geometric(self.responsiveness)
+        next_present = self.next_present_slots()
+        interval = self.presence_interval
+        k = 0
+        while k < n_visits:
+            # Same slot as `visit` uses. Slot s covers times from ceil(s * interval) up to ceil((s + 1) * interval).
+            slot = int(int(first + k * step) // interval)
+            if slot >= len(next_present):
+                break
+            slot = next_present[slot]
+            if slot >= len(next_present):
+                break
+            k = max(k, math.ceil((math.ceil(slot * interval) - first) / step))
+            end = math.ceil((math.ceil((slot + 1) * interval) - first) / step)
+            end = min(end, n_visits)
+            if k >= end:
+                continue
+            if m <= end - k:
+                return first + (k + m - 1) * step, True
+            m -= end - k
+            k = end
+        return first + (n_visits - 1) * step, False
 
     def get_time_window(self, options=[[0, 1]]):
         """Finds the best time window for a customer
@@ -127,14 +207,14 @@ class Customer:
         bool
             True if customer responds saying delivery will be successful
         """
-        if self.rg.random() < self.call_responsiveness:
-            return self.visit(arrival_time)
+        if self.call_rg.random() < self.call_responsiveness:
+            return self.visit(arrival_time, self.call_rg)
         else:
             return False
 
     def call_ahead_tw(self, arrival_time, options=[]):
         """Experimental function to call ahead and get a new, more accurate time-window for delivery"""
-        if self.rg.random() < self.call_responsiveness:
+        if self.call_rg.random() < self.call_responsiveness:
             return self.get_time_window(options)
         else:
             return [0, 1]  # Minimum width time window. [0,0] may break ortools.
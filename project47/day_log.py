@@ -0,0 +1,277 @@
+from project47.routing import *
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# For columns that are integers when every value is a whole number, and floats otherwise
+NUMBER = (np.int64, np.float64)
+
+# The columns of each table, and their types
+TABLES = {
+    # One row per day (and replication)
+    "records": {
+        "day": np.int32,
+        "number_of_packages": np.int64,
+        "number_of_vehicles": np.int32,
+        "collection_dist": NUMBER,
+        "replications": np.int32,  # 0 if not set
+    },
+    # One row per vehicle per record
+    "vehicles": {
+        "record": np.int64,
+        "distance": NUMBER,
+        "time": NUMBER,
+        "attempted": np.int32,
+        "futile": np.int32,
+    },
+    # One row per package per record. Delivered packages come first, in the order they were delivered.
+    "packages": {
+        "record": np.int64,
+        "delivered": bool,
+        "days_taken": np.int32,
+        "tw_start": np.int64,
+        "tw_end": np.int64,
+    },
+    # One row per collection point per record
+    "collection_points": {
+        "record": np.int64,
+        "packages": np.int32,
+        "removed": np.int32,
+    },
+}
+
+
+def _column_type(dtype, value=None):
+    """The type to store a column as. NUMBER columns are integers unless value has fractions in it.
+
+    This goes by the values rather than their dtype, as the simulators return float arrays even for integer matrices.
+    """
+    if dtype is not NUMBER:
+        return dtype
+    if value is None or np.issubdtype(value.dtype, np.integer):
+        return NUMBER[0]
+    if np.all(np.mod(value, 1) == 0):
+        return NUMBER[0]
+    return NUMBER[1]
+
+
+def _numbers(array):
+    """A NUMBER column as a list, typed by its own values. Joining chunks makes the whole column float if any are."""
+    return array.astype(_column_type(NUMBER, array)).tolist()
+
+
+class DayLog:
+    """Columnar record of what happened each day of a multiday run
+
+    Each day (and replication) adds a row to the records table, and rows for each of its vehicles, packages and collection
+    points to the other tables, with a record column saying which day they belong to. Everything is worked out with array
+    operations on a delivered mask, so adding a day is linear in the number of packages, however big the backlog gets.
+
+    Columns are kept as lists of array chunks, and only joined when they're needed. They can be saved as typed arrays
+    with `save`, or turned back into the dicts `collect_data` has always produced with `to_json`.
+
+    Attributes
+    ----------
+    columns : dict
+        Maps each table name to a dict of column name to a list of chunks. See TABLES for the columns.
+    """
+
+    def __init__(self):
+        self.columns = {
+            table: {name: [] for name in columns} for table, columns in TABLES.items()
+        }
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(
+        self,
+        day: int,
+        solution: RoutingSolution,
+        distances: list,
+        times: list,
+        futile: np.array,
+        delivered: list,
+        arrival_days: np.array,
+        time_windows: np.array,
+        collection_point_packages: list,
+        collection_point_removed_packages: list,
+        collection_dist: int,
+    ):
+        """Adds the data for a single day. See `multiday_simulation.collect_data` for the parameters.
+
+        Returns
+        -------
+        int
+            The index of the new record
+        """
+        k = self._size
+        arrival_days = np.asarray(arrival_days)
+        if isinstance(time_windows, dict):
+            time_windows = [time_windows[i] for i in range(len(arrival_days))]
+        time_windows = np.asarray(time_windows).reshape((-1, 2))
+
+        self._add(
+            "records",
+            1,
+            day=day,
+            number_of_packages=len(arrival_days) - 1,
+            number_of_vehicles=len(solution.routes),
+            collection_dist=collection_dist,
+            replications=0,
+        )
+
+        n = len(solution.routes)
+        self._add(
+            "vehicles",
+            n,
+            record=k,
+            distance=[veh_dists[-1] for veh_dists in distances],
+            time=[veh_times[-1] for veh_times in times],
+            # -2 for depo at start and end
+            attempted=[len(route) - 2 for route in solution.routes],
+            futile=futile,
+        )
+
+        # Delivered packages in the order they were delivered, then the rest in order. The depo isn't a package.
+        done = np.asarray(delivered, dtype=int).reshape(-1)
+        done = done[done != 0]
+        mask = np.zeros(len(arrival_days), dtype=bool)
+        mask[done] = True
+        mask[0] = True
+        packages = np.concatenate((done, np.flatnonzero(~mask)))
+        self._add(
+            "packages",
+            len(packages),
+            record=k,
+            delivered=np.arange(len(packages)) < len(done),
+            days_taken=(day - arrival_days[packages]).astype(np.int64),
+            tw_start=time_windows[packages, 0].astype(np.int64),
+            tw_end=time_windows[packages, 1].astype(np.int64),
+        )
+
+        self._add(
+            "collection_points",
+            len(collection_point_packages),
+            record=k,
+            packages=collection_point_packages,
+            removed=collection_point_removed_packages,
+        )
+        self._size += 1
+        return k
+
+    def _add(self, table, n, **values):
+        for name, dtype in TABLES[table].items():
+            value = np.asarray(values[name])
+            self.columns[table][name].append(
+                np.broadcast_to(value.astype(_column_type(dtype, value)), (n,))
+            )
+
+    def set_replications(self, first, n):
+        """Sets the number of replications for every record from first on"""
+        chunks = self.columns["records"]["replications"]
+        column = np.concatenate(chunks)
+        column[first:] = n
+        chunks[:] = [column]
+
+    def tables(self):
+        """Every table, as dicts of column name to array. The chunks are joined up, so later calls are quick."""
+        result = {}
+        for table, columns in self.columns.items():
+            result[table] = {}
+            for name, chunks in columns.items():
+                if len(chunks) != 1:
+                    array = (
+                        np.concatenate(chunks)
+                        if chunks
+                        else np.zeros(0, _column_type(TABLES[table][name]))
+                    )
+                    chunks[:] = [array]
+                result[table][name] = chunks[0]
+        return result
+
+    def save(self, path):
+        """Saves every column as a typed array in a .npz file, named table.column"""
+        np.savez_compressed(
+            path,
+            **{
+                "%s.%s" % (table, name): array
+                for table, columns in self.tables().items()
+                for name, array in columns.items()
+            },
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Reads a log saved with `save`"""
+        log = cls()
+        with np.load(path) as data:
+            for key in data.files:
+                table, name = key.split(".")
+                log.columns[table][name] = [data[key]]
+        log._size = len(log.columns["records"]["day"][0])
+        return log
+
+    def to_json(self):
+        """Every record, in the layout `collect_data` returns, ready for json.dump"""
+        tables = self.tables()
+        # Where each record's rows start in the other tables
+        bounds = {
+            table: np.searchsorted(
+                tables[table]["record"], np.arange(self._size + 1)
+            ).tolist()
+            for table in ["vehicles", "packages", "collection_points"]
+        }
+        data = []
+        for k in range(self._size):
+            rows = {
+                table: {
+                    name: array[bounds[table][k] : bounds[table][k + 1]]
+                    for name, array in tables[table].items()
+                }
+                for table in bounds
+            }
+            data.append(self._record(tables["records"], k, **rows))
+        return data
+
+    def record(self, k):
+        """A single record, in the layout `collect_data` returns"""
+        tables = self.tables()
+        rows = {}
+        for table in ["vehicles", "packages", "collection_points"]:
+            start, end = np.searchsorted(tables[table]["record"], [k, k + 1])
+            rows[table] = {
+                name: array[start:end] for name, array in tables[table].items()
+            }
+        return self._record(tables["records"], k, **rows)
+
+    @staticmethod
+    def _record(records, k, vehicles, packages, collection_points):
+        delivered = packages["delivered"]
+        tw = np.stack((packages["tw_start"], packages["tw_end"]), axis=1)
+        data = {
+            "day": int(records["day"][k]),
+            "number_of_packages": int(records["number_of_packages"][k]),
+            "number_of_vehicles": int(records["number_of_vehicles"][k]),
+            "distances": _numbers(vehicles["distance"]),
+            "times": _numbers(vehicles["time"]),
+            "deliveries_attempted": vehicles["attempted"].tolist(),
+            "futile_deliveries": vehicles["futile"].tolist(),
+            "delivered_packages": {
+                "days_taken": packages["days_taken"][delivered].tolist(),
+                "time_window": tw[delivered].tolist(),
+            },
+            "undelivered_packages": {
+                "days_taken": packages["days_taken"][~delivered].tolist(),
+                "time_window": tw[~delivered].tolist(),
+            },
+            "collection_point_packages": collection_points["packages"].tolist(),
+            "collection_point_removed_packages": collection_points["removed"].tolist(),
+            "collection_dist": _numbers(records["collection_dist"][k : k + 1])[0],
+        }
+        if records["replications"][k] > 0:
+            data["replications"] = int(records["replications"][k])
+        return data
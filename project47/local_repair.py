@@ -0,0 +1,175 @@
+from project47.simulation import rerouting_new, wrap_rerouting
+from project47.time_slack import schedule, ForwardSlack
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def late_stops(route, time_matrix, time_windows, current_time, day_length=28800):
+    """Positions in the route that can't be reached within their time window
+
+    The start is never late, the end only has to be reached before the end of the day.
+    This is the same set of constraints that `rerouting_new` gives the solver.
+    """
+    arrivals = schedule(route, time_matrix, time_windows, current_time)
+    late = arrivals > np.asarray(time_windows)[np.asarray(route, dtype=int), 1]
+    late[0] = False
+    late[-1] = arrivals[-1] > day_length
+    return np.flatnonzero(late)
+
+
+def route_cost(route, time_matrix):
+    """Total travel time along the route, which is the objective `rerouting_new` uses"""
+    route = np.asarray(route, dtype=int)
+    return time_matrix[route[:-1], route[1:]].sum()
+
+
+def route_slack(route, time_matrix, time_windows, current_time):
+    """How much delay the route can take before one of its stops (not counting the start and end) can't be made
+
+    This is the forward slack from `time_slack.ForwardSlack`, so waiting for time windows to open counts towards it.
+    inf if there are no stops.
+    """
+    if len(route) <= 2:
+        return np.inf
+    slack = ForwardSlack(route, time_matrix, time_windows, 0, current_time)
+    return slack.slack[1:-1].min()
+
+
+def improve_route(route, time_matrix, time_windows, current_time, max_passes=2):
+    """Improves a feasible route with 2-opt and relocate moves, keeping it feasible
+
+    The start and end of the route are fixed. Uses first improvement, and stops after max_passes
+    passes without change, or when no move improves the route.
+    """
+    route = list(route)
+    best = route_cost(route, time_matrix)
+    n = len(route)
+    for _ in range(max_passes):
+        improved = False
+        # 2-opt: reverse route[a:b]
+        for a in range(1, n - 2):
+            for b in range(a + 2, n):
+                candidate = route[:a] + route[a:b][::-1] + route[b:]
+                cost = route_cost(candidate, time_matrix)
+                if cost < best and not len(
+                    late_stops(candidate, time_matrix, time_windows, current_time)
+                ):
+                    route, best, improved = candidate, cost, True
+        # relocate: move route[a] to before position b
+        for a in range(1, n - 1):
+            for b in range(1, n - 1):
+                if b == a or b == a + 1:
+                    continue
+                rest = route[:a] + route[a + 1 :]
+                pos = b if b < a else b - 1
+                candidate = rest[:pos] + [route[a]] + rest[pos:]
+                cost = route_cost(candidate, time_matrix)
+                if cost < best and not len(
+                    late_stops(candidate, time_matrix, time_windows, current_time)
+                ):
+                    route, best, improved = candidate, cost, True
+        if not improved:
+            break
+    return route
+
+
+def repair_route(
+    i, route, time_matrix, time_windows, current_time, alternates={}, max_drops=1
+):
+    """Tries to fix the remaining route with small local edits
+
+    The first late stop is dropped, until the route is feasible, or more than max_drops stops would have to be dropped.
+    Moving a late stop further along the route can't help, as (with the triangle inequality) it would only be reached later.
+    Stops with alternate locations are never dropped here, as the solver might be able to use an alternate instead.
+
+    Returns
+    -------
+    list
+        The repaired route starting at route[i], or None if it couldn't be repaired within the limits
+    """
+    remaining = list(route[i:])
+    drops = 0
+    while True:
+        late = late_stops(remaining, time_matrix, time_windows, current_time)
+        if len(late) == 0:
+            return remaining
+        k = late[0]
+        if k == len(remaining) - 1:
+            return None  # Can't get back to the end in time
+        node = remaining[k]
+        if len(alternates.get(node, [])) > 0 or drops >= max_drops:
+            return None
+        remaining = remaining[:k] + remaining[k + 1 :]
+        drops += 1
+
+
+def repair_rerouting(rerouter=rerouting_new, max_drops=1, improve=True, min_slack=0):
+    """Rerouting that tries cheap local repairs before calling the full solver
+
+    Most of the time a vehicle reroutes because the next stop is late or the customer didn't answer. Dropping
+    that stop, and tidying up the order with 2-opt and relocate moves, is usually enough, and is much quicker than an OR-tools solve.
+    The full solver is only used if the repair can't find a feasible route without dropping more than max_drops stops,
+    or if the repaired route is too tight, with less than min_slack to spare at some stop.
+
+    Parameters
+    ----------
+    rerouter : function
+        The rerouting function to fall back on. Must have the same signature as `rerouting_new`.
+    max_drops : int
+        The most stops the repair is allowed to drop. Each dropped stop costs a lot in the solver, so if we need to drop more than this,
+        it's worth checking whether the solver can find an order that keeps them.
+    improve : bool
+        Whether to run 2-opt and relocate on the repaired route
+    min_slack : number
+        The least slack (see `route_slack`) the repaired route needs. A route that only just makes its time windows will
+        probably lose a stop to the next delay, so it can be worth asking the solver for something with more room.
+
+    Returns
+    -------
+    function
+        Used as the rerouter for a policy, in place of the rerouter it falls back on.
+        `f.stats` counts how many reroutes were repaired, and how many went to the solver.
+    """
+
+    def f(
+        i,
+        route,
+        distance_matrix,
+        time_matrix,
+        time_windows,
+        current_time,
+        alternates={},
+        **kwargs
+    ):
+        res = repair_route(
+            i, route, time_matrix, time_windows, current_time, alternates, max_drops
+        )
+        if res is not None:
+            if improve:
+                res = improve_route(res, time_matrix, time_windows, current_time)
+            if (
+                min_slack <= 0
+                or route_slack(res, time_matrix, time_windows, current_time)
+                >= min_slack
+            ):
+                f.stats["repair"] += 1
+                logger.debug("Rerouting repaired locally")
+                return [int(loc) for loc in res]
+        f.stats["solver"] += 1
+        logger.debug("Local repair failed, using full rerouting")
+        return rerouter(
+            i,
+            route,
+            distance_matrix,
+            time_matrix,
+            time_windows,
+            current_time,
+            alternates,
+            **kwargs
+        )
+
+    f.stats = {"repair": 0, "solver": 0}
+    return wrap_rerouting(f, rerouter)
@@ -1,6 +1,9 @@
 import numpy as np
 from project47.routing import *
 from project47.customer import Customer
+from project47.alternates import AlternatesIndex
+from project47.day_log import DayLog
+from project47.package_ledger import PackageLedger
 from project47.data import get_sample, read_data
 from project47.flp_data import *
 from numpy.random import Generator, PCG64
@@ -15,7 +18,6 @@ import time
 import logging
 
 logger = logging.getLogger(__name__)
-logger.setLevel("DEBUG")
 
 
 def collect_data(
@@ -33,6 +35,8 @@ def collect_data(
 ):
     """Takes the data for a single day and structures it in a dictionary so that we can save it as json
 
+    multiday records days into a `day_log.DayLog` instead, which produces these with `to_json`.
+
     Parameters
     ----------
     day : int
@@ -56,67 +60,22 @@ def collect_data(
     collection_dist : list
         The distance travelled by customers to get to the collection point
     """
-    data = {}
-    """
-    time_delivered = []
-    for d in delivered:
-        if d != 0:
-            found = False
-            for i, route in enumerate(solution.routes):
-                for j, node in enumerate(route):
-                    if node == d:
-                        time_delivered.append(times[i][j])
-                        found = True
-                        break
-                if found:
-                    break
-            if not found:
-                time_delivered.append(
-                    -1
-                )  # Error. Hopefully negative time is obviously wrong."""
-
-    data = {
-        "day": day,
-        "number_of_packages": int(
-            len(arrival_days) - 1
-        ),  # This could potentially be higher than the number of deliveries in the routes
-        "number_of_vehicles": int(
-            len(solution.routes)
-        ),  # is it number of used vehicles or just a total number? ## Either way, I think we don't actually need this; we can get it from other info
-        "distances": [int(veh_dists[-1]) for veh_dists in distances],
-        "times": [int(veh_times[-1]) for veh_times in times],
-        "deliveries_attempted": [
-            int(len(route) - 2) for route in solution.routes
-        ],  # {[1,3,6,0,0]}, # successful deliveries or total deliveries? ## Attempted, so total. -2 for depo at start and end.
-        "futile_deliveries": [int(f) for f in futile],
-        "delivered_packages": {
-            "days_taken": [
-                int(day - arrival_days[i]) for i in delivered if i != 0
-            ],  # [1,4,2,7,32,2],
-            # "time_delivered": [int(t) for t in time_delivered],
-            "time_window": [
-                [int(time_windows[i][0]), int(time_windows[i][1])]
-                for i in delivered
-                if i != 0
-            ],  # [[2,4],[2,3],[2,3],[1,4],[1,2]]
-        },
-        "undelivered_packages": {
-            "days_taken": [
-                int(day - arrival_days[i])
-                for i in range(len(arrival_days))
-                if i != 0 and i not in delivered
-            ],  # [12,54,21,43,21],
-            "time_window": [
-                [int(time_windows[i][0]), int(time_windows[i][1])]
-                for i in range(len(arrival_days))
-                if i != 0 and i not in delivered
-            ],  # [[3,7],[2,7],[5,9],[1,3],[4,5]]
-        },
-        "collection_point_packages": collection_point_packages,
-        "collection_point_removed_packages": collection_point_removed_packages,
-        "collection_dist": collection_dist,
-    }
-
+    # The record for a single day is built the same way as the whole log, so the two always match
+    log = DayLog()
+    log.append(
+        day,
+        solution,
+        distances,
+        times,
+        futile,
+        delivered,
+        arrival_days,
+        time_windows,
+        collection_point_packages,
+        collection_point_removed_packages,
+        collection_dist,
+    )
+    data = log.record(0)
     return data
 
 
@@ -138,6 +97,11 @@ def multiday(
     futile_count_threshold=1,
     cap=20,
     tlim=1e10,
+    batch_simulator=None,
+    crn=None,
+    stopping=None,
+    columnar=False,
+    pass_alternates=False,
 ):
     """Multiday Sim
 
@@ -182,6 +146,22 @@ def multiday(
         The capacity of the collection points
     tlim : int
         The time to run the simulation for. Helps us stop the simulation if we get an extreme buildup of packages
+    batch_simulator : function (Optional)
+        Simulates all replications of a day at once. Takes the same inputs as simulator, plus the number of replications,
+        and returns a list of the simulator outputs. If set, this is used instead of simulator. See `batch_simulation.batch_sim`.
+    crn : CommonRandomNumbers (Optional)
+        If set, each customer gets their own random streams for each day and replication, so running this again with a different
+        simulator (policy) replays the same customer behaviour. See `common_random.CommonRandomNumbers`. Not used by batch_simulator.
+    stopping : SequentialStopping (Optional)
+        If set, replications are run in batches until the confidence intervals on its metrics are tight enough, and replications is ignored.
+        Batches use batch_simulator if that is set. The number of replications used is saved as "replications" in each day's data.
+        See `stopping.SequentialStopping`.
+    columnar : bool (Optional)
+        If set, returns the `day_log.DayLog` the days are recorded in, which can be saved as typed arrays.
+        Otherwise returns a list with a dict for each day (and replication) in the `collect_data` layout, ready for json.
+    pass_alternates : bool (Optional)
+        If set, simulator is also given the day's `alternates.AlternatesIndex` as alternates=, to hand on to the policy.
+        Otherwise each policy builds its own from the customers.
     """
     start = time.time()
     logger.debug("Start multiday sim")
@@ -202,24 +182,39 @@ def multiday(
 
     for day in range(n_days):
         customers, new_time_windows = sample_generator(rg)
+        for j, c in enumerate(customers):
+            c.key = (1, day, j)
         latitudes_per_day.append([c.lat for c in customers])
         longitudes_per_day.append([c.lon for c in customers])
         time_windows_per_day.append(new_time_windows)
         customers_per_day.append(customers)
 
-    data = []
+    log = DayLog()
     n_depots = depots.shape[1]
-    delivery_time_windows = np.array(
-        [[day_start, day_end] for i in range(n_depots)]
-    )  # These are our beliefs about the time windows, not their true value
-    arrival_days = np.zeros(n_depots)
-    futile_count = np.zeros(n_depots)
-    customers = np.array(
-        [
-            Customer(depots[0, 0], depots[1, 0], 1, 1, rg=rg)
-            for i in range(len(depots[0]))
-        ]
+    # Everything we know about the packages in the system, with the depots first. See package_ledger.py.
+    # The time windows are our beliefs about the time windows, not their true value.
+    ledger = PackageLedger()
+    customers = [
+        Customer(depots[0, 0], depots[1, 0], 1, 1, rg=rg) for i in range(len(depots[0]))
+    ]
+    for i, c in enumerate(customers):
+        c.key = (0, i)
+    ledger.insert(
+        n_depots,
+        time_windows=[day_start, day_end],
+        arrival_days=0,
+        customers=customers,
     )
+
+    def columns():
+        """The columns for the packages currently in the system, in position order"""
+        return (
+            ledger["time_windows"],
+            ledger["arrival_days"],
+            ledger["futile_count"],
+            ledger["customers"],
+        )
+
     packages_at_collection = []
     collection_point_removed_packages = 0
     if collection_points and k != 0:  # choose the number of collection points
@@ -231,7 +226,7 @@ def multiday(
         packages_at_collection = [{} for i in range(k)]
         # collection_point_removed_packages = [0 for i in range(k)]
     for day in range(n_days):
-        logger.debug("Start day %i" % day)
+        logger.debug("Start day %i", day)
         collection_point_removed_packages = [0 for i in range(k)]
         # Generate data
         new_time_windows, new_customers = (
@@ -239,14 +234,17 @@ def multiday(
             customers_per_day[day],
         )
 
-        delivery_time_windows = np.vstack((delivery_time_windows, new_time_windows))
-        arrival_days = np.append(arrival_days, [day for _ in range(len(new_customers))])
-        futile_count = np.append(futile_count, np.zeros(len(new_customers)))
-        customers = np.append(customers, new_customers)
+        ledger.insert(
+            len(new_customers),
+            time_windows=np.reshape(new_time_windows, (-1, 2)),
+            arrival_days=day,
+            customers=new_customers,
+        )
+        delivery_time_windows, arrival_days, futile_count, customers = columns()
 
-        logger.debug("Number of incoming packages: %i" % len(new_customers))
+        logger.debug("Number of incoming packages: %i", len(new_customers))
         logger.debug(
-            "Current number of packages: %i" % (len(customers) - 1)
+            "Current number of packages: %i", len(customers) - 1
         )  # -1 for depo
 
         logger.debug("Calculating distance and time matrix")
@@ -333,19 +331,17 @@ def multiday(
 
                             # packages_at_collection[min_ind][customers[i]] = 0
             # Remove packages sent to collection points from customers
-            delivery_time_windows = delivery_time_windows[undelivered]
-            arrival_days = arrival_days[undelivered]
-            futile_count = futile_count[undelivered]
-            customers = customers[undelivered]
+            ledger.keep(undelivered)
 
             cp_customers = np.array([])
             # add collection point as a customer if there is package allocated to it
             for cp in range(k):
                 if len(customer_to_cp[cp]) != 0:
-                    cp_customers = np.append(
-                        cp_customers,
-                        Customer(sol_fac_lat[cp], sol_fac_lon[cp], 1, 1, rg=rg),
+                    cp_customer = Customer(
+                        sol_fac_lat[cp], sol_fac_lon[cp], 1, 1, rg=rg
                     )
+                    cp_customer.key = (2, day, cp)
+                    cp_customers = np.append(cp_customers, cp_customer)
             # customers = np.append(customers, new_customers)
 
             # cp_customers = np.array(
@@ -356,18 +352,13 @@ def multiday(
             #     ]
             # )
             if len(cp_customers) > 0:
-                cp_time_windows = np.array(
-                    [[day_start, day_end] for i in range(len(cp_customers))]
-                )
-
-                delivery_time_windows = np.vstack(
-                    (delivery_time_windows, cp_time_windows)
-                )
-                customers = np.append(customers, cp_customers)
-                futile_count = np.append(futile_count, np.zeros(len(cp_customers)))
-                arrival_days = np.append(
-                    arrival_days, [day for _ in range(len(cp_customers))]
+                ledger.insert(
+                    len(cp_customers),
+                    time_windows=[day_start, day_end],
+                    arrival_days=day,
+                    customers=cp_customers,
                 )
+            delivery_time_windows, arrival_days, futile_count, customers = columns()
 
         # Get times and distances
         dm, tm = dist_and_time(customers)
@@ -381,16 +372,8 @@ def multiday(
         logger.debug("Compute alternate locations")
 
         # Setup list of alternate locations
-        alternate_locations = []
-        temp = customers.tolist()
-        while len(temp) > 0:
-            c = temp.pop()
-            location_index = []
-            for a in c.alternates:
-                location_index.append(customers.tolist().index(a))
-                if a in temp:
-                    temp.remove(a)
-            alternate_locations.append(location_index)
+        alternates_index = AlternatesIndex.from_customers(customers)
+        alternate_locations = alternates_index.groups(from_end=True)
 
         logger.debug("Optimise routes")
 
@@ -414,44 +397,72 @@ def multiday(
             plt.show(block=False)
             plt.pause(0.001)
 
-        futile_count[[i for i in range(len(customers)) if i not in unscheduled]] += 1
+        scheduled = np.ones(len(customers), dtype=bool)
+        scheduled[np.asarray(unscheduled, dtype=int)] = False
+        ledger.add("futile_count", scheduled, 1)
 
         # logger.debug(routes)
-        logger.debug("Unscheduled: %s" % unscheduled)
+        logger.debug("Unscheduled: %s", unscheduled)
 
         logger.debug("Start simulations")
 
-        for i in range(replications):
-            logger.debug("Replication %i" % i)
-            # Simulate behaviour
-            distances, times, futile, delivered = simulator(
-                routes, dm, tm, delivery_time_windows, customers, rg
-            )
-            logger.debug("Delivered: %s" % delivered)
-
-            # Data collection to save
-            data.append(
-                collect_data(
-                    day,
+        def replicate(i):
+            if crn is not None:
+                crn.assign(customers, day, i)
+            if pass_alternates:
+                return simulator(
                     routes,
-                    distances,
-                    times,
-                    futile,
-                    delivered,
-                    arrival_days,
+                    dm,
+                    tm,
                     delivery_time_windows,
-                    [len(l) for l in packages_at_collection],
-                    collection_point_removed_packages,
-                    collection_dist,
+                    customers,
+                    rg,
+                    alternates=alternates_index,
+                )
+            return simulator(routes, dm, tm, delivery_time_windows, customers, rg)
+
+        def run_batch(first, n):
+            if batch_simulator is not None:
+                return batch_simulator(
+                    routes, dm, tm, delivery_time_windows, customers, rg, n
                 )
+            return (replicate(i) for i in range(first, first + n))
+
+        if stopping is not None:
+            results = stopping.run(run_batch, routes)
+        else:
+            results = run_batch(0, replications)
+
+        day_start_index = len(log)
+        for i, result in enumerate(results):
+            logger.debug("Replication %i", i)
+            # Simulate behaviour
+            distances, times, futile, delivered = result
+            logger.debug("Delivered: %s", delivered)
+
+            # Data collection to save
+            log.append(
+                day,
+                routes,
+                distances,
+                times,
+                futile,
+                delivered,
+                arrival_days,
+                delivery_time_windows,
+                [len(l) for l in packages_at_collection],
+                collection_point_removed_packages,
+                collection_dist,
             )
 
+        if stopping is not None:
+            # The number of replications varies from day to day, so it's recorded with each one
+            log.set_replications(day_start_index, len(log) - day_start_index)
+
         # Remove delivered packages, using just the last result
         undelivered = np.ones(len(customers), dtype=bool)
-        for alternates in alternate_locations:  # Remove all alternate locations as well
-            for package in delivered:
-                if package in alternates:
-                    undelivered[alternates] = False
+        for package in delivered:  # Remove all alternate locations as well
+            undelivered[alternates_index.group(package)] = False
         undelivered[[i for i in range(n_depots)]] = True
 
         # # get the undelivered list for collection point
@@ -482,10 +493,11 @@ def multiday(
                 #     customer_to_cp[-i - 1],
                 # )
 
-        delivery_time_windows = delivery_time_windows[undelivered]
-        arrival_days = arrival_days[undelivered]
-        futile_count = futile_count[undelivered]
-        customers = customers[undelivered]
+        # The policies (and route_optimizer) can edit the time windows in place, and the edits carry over to the next day
+        ledger.set("time_windows", delivery_time_windows)
+        ledger.keep(undelivered)
+        # Most of the day's packages have just gone, so this is usually worth doing
+        ledger.compact(min_garbage=0.5)
         # if count_cp_undelivered:
         #     # stick the undelivered collection pacakges on
         #     delivery_time_windows = np.vstack((delivery_time_windows, new_time_windows))
@@ -493,13 +505,13 @@ def multiday(
         #     futile_count = np.append(futile_count, new_futile_count)
         #     customers = np.append(customers, new_customers)
 
-        logger.debug(
-            "Number of remaining Packages: %i" % (len(customers) - 1)
-        )  # -1 for depo
+        logger.debug("Number of remaining Packages: %i", len(ledger) - 1)  # -1 for depo
         if time.time() - start > tlim:
             break
 
-    return data
+    if columnar:
+        return log
+    return log.to_json()
 
 
 def collection_point_example(unscheduled, futile_count, dm, tm, customers, rg):
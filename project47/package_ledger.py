@@ -0,0 +1,191 @@
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The columns multiday keeps for each package, as (dtype, shape of each row)
+COLUMNS = {
+    "time_windows": (np.float64, (2,)),
+    "arrival_days": (np.float64, ()),
+    "futile_count": (np.float64, ()),
+    "customers": (object, ()),
+}
+
+
+class PackageLedger:
+    """Struct of arrays store for the packages in the system, with stable ids
+
+    multiday used to keep a separate array for each column, and rebuild all of them with np.append, np.vstack and masking
+    every time packages came or went. Here every column is preallocated, and grows by doubling, so adding packages is
+    amortized O(1) each. Removing packages just clears their active flag. The removed rows are only dropped when
+    `compact` is called, which moves everything left to the front in one pass per column.
+
+    The active packages are numbered 0, 1, ... in the order they were added; these positions line up with the distance
+    and time matrices, the routes, and everything else built for the day. Positions change as packages are removed, but
+    every package also gets an id when it's added, which never changes. `ids_at` and `positions_of` convert between the two.
+
+    Attributes
+    ----------
+    data : dict
+        Maps each column name to its storage array. Only the first size rows are used, and only the active ones mean anything.
+    ids : np.array
+        The id of each row of storage. Always increasing.
+    active : np.array
+        Whether each row of storage is still in the system
+    size : int
+        The number of rows of storage used
+    next_id : int
+        The id the next package will get
+    """
+
+    def __init__(self, capacity=64, columns=COLUMNS):
+        self.columns = columns
+        capacity = max(int(capacity), 1)
+        self.data = {
+            name: np.zeros((capacity,) + shape, dtype=dtype)
+            for name, (dtype, shape) in columns.items()
+        }
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.next_id = 0
+        self._rows = None
+
+    @property
+    def capacity(self):
+        return len(self.ids)
+
+    @property
+    def rows(self):
+        """The storage row of each active package, in position order"""
+        if self._rows is None:
+            self._rows = np.flatnonzero(self.active[: self.size])
+        return self._rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, name):
+        """The values of a column for the active packages, in position order. This is a copy."""
+        return self.data[name][self.rows]
+
+    def _grow(self, n):
+        capacity = max(2 * self.capacity, self.size + n)
+        for name, array in self.data.items():
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[: self.size] = array[: self.size]
+            self.data[name] = grown
+        for name in ["ids", "active"]:
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[: self.size] = array[: self.size]
+            setattr(self, name, grown)
+
+    def insert(self, n, **values):
+        """Adds n packages, after all the current ones
+
+        Parameters
+        ----------
+        n : int
+            The number of packages
+        values
+            The value of each column for the new packages, as an array with a row for each package, or a single value for all of them.
+            Columns that aren't given are zero.
+
+        Returns
+        -------
+        np.array
+            The ids of the new packages
+        """
+        if self.size + n > self.capacity:
+            self._grow(n)
+        new = slice(self.size, self.size + n)
+        for name, value in values.items():
+            self.data[name][new] = value
+        ids = np.arange(self.next_id, self.next_id + n)
+        self.ids[new] = ids
+        self.active[new] = True
+        self.size += n
+        self.next_id += n
+        self._rows = None
+        return ids
+
+    def keep(self, mask):
+        """Removes every package where mask is False
+
+        Parameters
+        ----------
+        mask : np.array
+            bool for each active package, in position order
+
+        Returns
+        -------
+        np.array
+            The new position of each package, or -1 for those removed. Use this to update anything indexed by position.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        self.active[self.rows[~mask]] = False
+        self._rows = None
+        remap = np.cumsum(mask) - 1
+        remap[~mask] = -1
+        return remap
+
+    def remove(self, positions):
+        """Removes the packages at the given positions. See `keep`."""
+        mask = np.ones(len(self), dtype=bool)
+        mask[positions] = False
+        return self.keep(mask)
+
+    def set(self, name, values):
+        """Sets a column for all the active packages, in position order. The inverse of `__getitem__`."""
+        self.data[name][self.rows] = values
+
+    def add(self, name, positions, value):
+        """Adds value to a column for the packages at the given positions (an index or a mask)"""
+        self.data[name][self.rows[positions]] += value
+
+    def ids_at(self, positions):
+        """The ids of the packages at the given positions"""
+        return self.ids[self.rows[positions]]
+
+    def positions_of(self, ids):
+        """The current positions of the packages with the given ids, or -1 for any that have been removed"""
+        ids = np.asarray(ids, dtype=np.int64)
+        row = np.searchsorted(self.ids[: self.size], ids)
+        row = np.minimum(row, max(self.size - 1, 0))
+        found = (self.size > 0) & (self.ids[row] == ids) & self.active[row]
+        positions = np.searchsorted(self.rows, row)
+        return np.where(found, positions, -1)
+
+    def compact(self, min_garbage=0.0):
+        """Drops the storage for removed packages, moving the active ones to the front
+
+        Positions and ids don't change. Linear in the number of rows of storage, so only worth doing once enough has been removed.
+
+        Parameters
+        ----------
+        min_garbage : float
+            Only compact if at least this fraction of the used storage is removed packages
+
+        Returns
+        -------
+        bool
+            Whether anything was done
+        """
+        rows = self.rows
+        m = len(rows)
+        if self.size == 0 or (self.size - m) / self.size < max(min_garbage, 1e-12):
+            return False
+        for name, array in self.data.items():
+            array[:m] = array[rows]
+            if array.dtype == object:
+                # Let go of the removed customers
+                array[m : self.size] = None
+        self.ids[:m] = self.ids[rows]
+        self.active[:m] = True
+        self.active[m : self.size] = False
+        logger.debug("Compacted package ledger from %i to %i rows", self.size, m)
+        self.size = m
+        self._rows = None
+        return True
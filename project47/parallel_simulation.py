@@ -0,0 +1,240 @@
+from project47.routing import *
+from project47.simulation import sim
+from project47.common_random import CommonRandomNumbers
+from project47.shared_arrays import SharedArray, worker_pool, worker_state, local_state
+from numpy.random import Generator, PCG64, SeedSequence
+from copy import copy
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def vehicle_seeds(rg, n):
+    """Independent seeds for each vehicle, derived from the master generator
+
+    Only a single number is drawn from rg, so it advances the same amount whatever n is.
+    """
+    return SeedSequence(int(rg.integers(2**63))).spawn(n)
+
+
+def _run_vehicle(state, route, seed, replication):
+    """Simulates a single vehicle with its own random stream
+
+    Policies can edit the time windows, so each vehicle gets a fresh copy. Otherwise the result
+    would depend on which vehicles happened to run in the same worker before it. Customer streams from crn
+    are reassigned for the same reason.
+    """
+    rg = Generator(PCG64(seed))
+    customers = state["customers"]
+    if state["crn"] is None:
+        for c in customers:
+            c.rg = c.call_rg = rg
+    else:
+        state["crn"].assign(customers, state["day"], replication)
+    update_function = state["policy"](
+        state["dm"],
+        state["tm"],
+        copy(state["time_windows"]),
+        customers,
+        rg,
+        **state["policy_args"],
+    )
+    distances, times, futile, delivered = sim(RoutingSolution([route]), update_function)
+    return distances[0], times[0], futile[0], delivered
+
+
+def _worker_run_vehicle(route, seed, replication):
+    return _run_vehicle(worker_state, route, seed, replication)
+
+
+class ParallelSimulator:
+    """Runs `sim` with each vehicle in a separate worker process, for as many replications as needed
+
+    None of the policies share anything between vehicles, so the vehicles can be simulated independently.
+    This is worth it when rerouting is used, as each reroute holds up the whole loop in `sim`.
+
+    The worker pool, and the distance and time matrices in shared memory, are set up once here and used for every
+    call to `run`, so only the routes and seeds are sent for each replication. Call `close` (or use this as a context
+    manager) when done. Each vehicle gets its own random stream, spawned from a single draw from rg. This means the
+    results are the same whatever the number of workers, but they won't match `sim` with the same rg, as that uses one
+    stream for everything.
+
+    With crn, customers get their own streams from it instead, as multiday does, and only the policy uses the vehicle's
+    stream. Then the results match `sim` after `CommonRandomNumbers.assign`, for policies that don't use rg themselves,
+    as long as no customer is in more than one route.
+
+    The policy closures can't be sent to other processes, so this takes the policy function itself (eg `base_policy`),
+    and builds the closure in the worker. Anything else passed to the policy (such as a rerouter) needs to be picklable too.
+
+    Parameters
+    ----------
+    policy : function
+        Called as policy(distance_matrix, time_matrix, time_windows, customers, rg, **policy_args) to make the update function
+    distance_matrix : np.array
+    time_matrix : np.array
+    time_windows : np.array or dict
+    customers : list
+        List of customer objects. The workers get their own copies, with rg and call_rg replaced by the vehicle's stream,
+        or by their streams from crn.
+    workers : int (Optional)
+        The number of worker processes. Defaults to the number of cpus. With 1 everything is run in this process.
+    policy_args : dict (Optional)
+        Extra keyword arguments for the policy
+    crn : CommonRandomNumbers (Optional)
+        Where the customers' streams come from, see above
+    day : int
+        Which day's streams to use from crn
+    """
+
+    def __init__(
+        self,
+        policy,
+        distance_matrix,
+        time_matrix,
+        time_windows,
+        customers,
+        workers=None,
+        policy_args={},
+        crn: CommonRandomNumbers = None,
+        day=0,
+    ):
+        self.executor = None
+        self._shared = []
+        state = dict(
+            time_windows=time_windows,
+            customers=customers,
+            policy=policy,
+            policy_args=policy_args,
+            crn=crn,
+            day=day,
+        )
+        if workers == 1:
+            self._state = local_state(distance_matrix, time_matrix, state)
+            return
+        try:
+            self._shared = [SharedArray(distance_matrix), SharedArray(time_matrix)]
+            self.executor = worker_pool(workers, *self._shared, state)
+        except BaseException:
+            self.close()
+            raise
+
+    def run(self, s: RoutingSolution, rg, replication=0):
+        """Simulates one replication
+
+        Parameters
+        ----------
+        s : RoutingSolution
+            The solution for a single day for the routes each vehicle travels
+        rg : np.random.Generator
+            The master random stream
+        replication : int
+            Which replication's streams to use from crn. Ignored without crn.
+
+        Returns
+        -------
+        Same as `sim`, with vehicles in the same order as s.routes
+        """
+        seeds = vehicle_seeds(rg, len(s.routes))
+        if self.executor is None:
+            results = [
+                _run_vehicle(self._state, route, seed, replication)
+                for route, seed in zip(s.routes, seeds)
+            ]
+        else:
+            # map keeps the vehicle order, whatever order they finish in
+            results = list(
+                self.executor.map(
+                    _worker_run_vehicle,
+                    s.routes,
+                    seeds,
+                    [replication] * len(s.routes),
+                )
+            )
+        logger.debug("Parallel simulation finished %i vehicles", len(results))
+
+        distances = [r[0] for r in results]
+        times = [r[1] for r in results]
+        futile = np.array([r[2] for r in results])
+        delivered = [d for r in results for d in r[3]]
+        return distances, times, futile, delivered
+
+    def close(self):
+        """Shuts down the workers and frees the shared memory"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        for shared in self._shared:
+            shared.unlink()
+        self._shared = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parallel_sim(
+    s: RoutingSolution,
+    policy,
+    distance_matrix,
+    time_matrix,
+    time_windows,
+    customers,
+    rg,
+    workers=None,
+    policy_args={},
+    replications=None,
+    crn: CommonRandomNumbers = None,
+    day=0,
+):
+    """Runs `sim` with each vehicle in a separate worker process
+
+    See `ParallelSimulator`, which this sets up and closes again. For several replications, either pass replications
+    here, or keep a `ParallelSimulator` yourself, so the workers are only started once.
+
+    Parameters
+    ----------
+    s : RoutingSolution
+        The solution for a single day for the routes each vehicle travels
+    policy : function
+        Called as policy(distance_matrix, time_matrix, time_windows, customers, rg, **policy_args) to make the update function
+    distance_matrix : np.array
+    time_matrix : np.array
+    time_windows : np.array or dict
+    customers : list
+        List of customer objects. Their rg and call_rg are replaced with the vehicle's stream in the workers,
+        or with their streams from crn.
+    rg : np.random.Generator
+        The master random stream
+    workers : int (Optional)
+        The number of worker processes. Defaults to the number of cpus. With 1 everything is run in this process.
+    policy_args : dict (Optional)
+        Extra keyword arguments for the policy
+    replications : int (Optional)
+        If set, runs this many replications with the same workers, and returns a list of their results
+    crn : CommonRandomNumbers (Optional)
+        If set, customers keep their own streams for each replication, see `ParallelSimulator`
+    day : int
+        Which day's streams to use from crn
+
+    Returns
+    -------
+    Same as `sim`, with vehicles in the same order as s.routes. A list of these if replications is set.
+    """
+    with ParallelSimulator(
+        policy,
+        distance_matrix,
+        time_matrix,
+        time_windows,
+        customers,
+        workers,
+        policy_args,
+        crn,
+        day,
+    ) as simulator:
+        if replications is None:
+            return simulator.run(s, rg)
+        return [simulator.run(s, rg, r) for r in range(replications)]
@@ -0,0 +1,163 @@
+from project47.routing import *
+from project47.simulation import sim
+from project47.common_random import CommonRandomNumbers
+from project47.shared_arrays import SharedArray, worker_pool, worker_state, local_state
+from project47.stopping import METRICS, half_width
+from copy import copy
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Key for the stream passed to the policy itself. multiday uses (0, ...), (1, ...) and (2, ...) for customers.
+POLICY_KEY = (3,)
+
+
+def _run_policy(state, name, replication):
+    """Simulates one replication of one policy, returning its metrics
+
+    Every policy gets the same customer streams for a replication, and a fresh copy of the time windows.
+    """
+    policy, policy_args = state["policies"][name]
+    crn = state["crn"]
+    customers = state["customers"]
+    crn.assign(customers, state["day"], replication)
+    rg = crn.stream(state["day"], replication, POLICY_KEY)
+    update_function = policy(
+        state["dm"],
+        state["tm"],
+        copy(state["time_windows"]),
+        customers,
+        rg,
+        **policy_args,
+    )
+    result = sim(state["solution"], update_function)
+    return {
+        metric: f(result, state["solution"]) for metric, f in state["metrics"].items()
+    }
+
+
+def _worker_run_policy(name, replication):
+    return _run_policy(worker_state, name, replication)
+
+
+def compare_policies(
+    s: RoutingSolution,
+    policies,
+    distance_matrix,
+    time_matrix,
+    time_windows,
+    customers,
+    crn: CommonRandomNumbers = None,
+    replications=1,
+    day=0,
+    workers=None,
+    metrics=METRICS,
+):
+    """Evaluates several policies on the same routes
+
+    Comparing policies with separate multiday runs solves the same routing problem once per policy. Instead, solve it
+    once and pass the solution here, which simulates every policy on it. Each replication uses common random numbers,
+    so every policy sees the same customers at home for a given replication, and the differences between policies can
+    be compared replication by replication.
+
+    Replications of each policy are spread over worker processes, with the distance and time matrices in shared memory,
+    as in `parallel_simulation.parallel_sim`. The policies (and their arguments) need to be picklable.
+
+    Parameters
+    ----------
+    s : RoutingSolution
+        The solution for a single day for the routes each vehicle travels
+    policies : dict
+        Maps a name for each policy to the policy function (eg `base_policy`), or to a (policy, policy_args) tuple
+    distance_matrix : np.array
+    time_matrix : np.array
+    time_windows : np.array
+    customers : list
+        List of customer objects. These are copied, so their random streams aren't changed.
+    crn : CommonRandomNumbers (Optional)
+        Where the random streams come from. Defaults to CommonRandomNumbers(0).
+    replications : int
+        The number of replications of each policy
+    day : int
+        Which day's streams to use from crn
+    workers : int (Optional)
+        The number of worker processes. Defaults to the number of cpus. With 1 everything is run in this process.
+    metrics : dict
+        Maps metric names to functions of (result, solution), see stopping.py
+
+    Returns
+    -------
+    dict
+        Maps each policy name to a dict of metric name to an array with the value for each replication
+    """
+    if crn is None:
+        crn = CommonRandomNumbers()
+    policies = {
+        name: policy if isinstance(policy, tuple) else (policy, {})
+        for name, policy in policies.items()
+    }
+    tasks = [(name, r) for r in range(replications) for name in policies]
+    state = dict(
+        solution=s,
+        policies=policies,
+        time_windows=time_windows,
+        customers=customers,
+        crn=crn,
+        day=day,
+        metrics=metrics,
+    )
+    logger.debug("Comparing %i policies, %i replications", len(policies), replications)
+
+    if workers == 1:
+        state = local_state(distance_matrix, time_matrix, state)
+        results = [_run_policy(state, name, r) for name, r in tasks]
+    else:
+        with SharedArray(distance_matrix) as dm, SharedArray(time_matrix) as tm:
+            with worker_pool(workers, dm, tm, state) as executor:
+                results = list(
+                    executor.map(
+                        _worker_run_policy,
+                        [name for name, _ in tasks],
+                        [r for _, r in tasks],
+                    )
+                )
+
+    comparison = {name: {metric: [] for metric in metrics} for name in policies}
+    for (name, _), values in zip(tasks, results):
+        for metric, value in values.items():
+            comparison[name][metric].append(value)
+    return {
+        name: {metric: np.array(v) for metric, v in values.items()}
+        for name, values in comparison.items()
+    }
+
+
+def summarise(comparison, baseline=None, confidence=0.95):
+    """Means and confidence intervals of each metric for each policy
+
+    With a baseline, the intervals are on the difference from the baseline policy, replication by replication.
+    Thanks to the common random numbers, these are much narrower than the intervals on the policies themselves.
+
+    Parameters
+    ----------
+    comparison : dict
+        The result of `compare_policies`
+    baseline : str (Optional)
+        The name of the policy to compare the others to
+    confidence : float
+
+    Returns
+    -------
+    dict
+        Maps each policy name to a dict of metric name to (mean, half width)
+    """
+    summary = {}
+    for name, values in comparison.items():
+        summary[name] = {}
+        for metric, v in values.items():
+            if baseline is not None:
+                v = v - comparison[baseline][metric]
+            summary[name][metric] = (float(np.mean(v)), half_width(v, confidence))
+    return summary
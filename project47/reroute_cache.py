@@ -0,0 +1,180 @@
+from project47.simulation import rerouting_new, wrap_rerouting
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import json
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RerouteCache:
+    """Bounded LRU cache for rerouting results
+
+    Rerouting gets called with the same inputs a lot, across replications and across policies.
+    Each call is a fresh OR-tools solve, so it's worth remembering the answers.
+
+    The key is canonical, so that it doesn't matter what order the remaining locations are in:
+    the start and end locations, the sorted set of locations left to visit, the current time rounded up to
+    a bucket, and a hash of the time windows and travel times between those locations. Hashing the travel
+    times means results from a different day (where the location numbers mean something else) are never reused.
+
+    If a path is given, results are also written to that directory, one small json file per key.
+    This lets multiple processes share results. Files are written to a temporary name and then moved into place,
+    so a reader never sees a half-written file.
+
+    Attributes
+    ----------
+    maxsize : int
+        The number of results to keep in memory
+    time_bucket : int
+        The width of the time buckets. 0 means times must match exactly.
+    path : str
+        Directory for the on-disk cache. None to only cache in memory.
+    hits : int
+        Number of lookups answered from memory
+    disk_hits : int
+        Number of lookups answered from disk
+    misses : int
+        Number of lookups that needed a solve
+    """
+
+    def __init__(self, maxsize=1024, time_bucket=60, path=None):
+        self.maxsize = maxsize
+        self.time_bucket = time_bucket
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+
+    def bucket_time(self, current_time):
+        """Rounds the time up to the end of its bucket
+
+        Rounding up is conservative; a route that is feasible at the end of the bucket is feasible earlier in it as well.
+        """
+        if not self.time_bucket:
+            return current_time
+        return int(np.ceil(current_time / self.time_bucket) * self.time_bucket)
+
+    def key(self, i, route, time_matrix, time_windows, current_time, alternates={}):
+        """Builds the canonical key for a rerouting call. See the class docs for what goes in it."""
+        middle = sorted(set(route[i + 1 : -1]))
+        places = [route[i]] + middle + [route[-1]]
+        for k in middle:
+            places.extend(sorted(alternates.get(k, [])))
+
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(time_matrix[places][:, places]).tobytes())
+        h.update(np.ascontiguousarray(time_windows[places], dtype=float).tobytes())
+        h.update(repr([(k, sorted(alternates.get(k, []))) for k in middle]).encode())
+
+        return (
+            int(route[i]),
+            int(route[-1]),
+            tuple(int(k) for k in middle),
+            self.bucket_time(current_time),
+            h.hexdigest(),
+        )
+
+    def _filename(self, key):
+        return os.path.join(
+            self.path, hashlib.sha1(repr(key).encode()).hexdigest() + ".json"
+        )
+
+    def get(self, key):
+        """Looks up a key, returning None if it isn't cached"""
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return list(self._cache[key])
+        if self.path is not None:
+            try:
+                with open(self._filename(key)) as infile:
+                    value = json.load(infile)
+            except (OSError, ValueError):
+                pass
+            else:
+                self.disk_hits += 1
+                self._store(key, value)
+                return list(value)
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Adds a result to the cache, and to disk if there is an on-disk tier"""
+        value = [int(v) for v in value]
+        self._store(key, value)
+        if self.path is not None:
+            fname = self._filename(key)
+            tmp = "%s.%i.tmp" % (fname, os.getpid())
+            with open(tmp, "w") as outfile:
+                json.dump(value, outfile)
+            os.replace(tmp, fname)
+
+    def _store(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        """Empties the in-memory cache and resets the counters. Doesn't touch the disk."""
+        self._cache.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def memoized_rerouting(cache: RerouteCache, rerouter=rerouting_new):
+    """Wraps a rerouting function so that it checks the cache first
+
+    Parameters
+    ----------
+    cache : RerouteCache
+    rerouter : function
+        The rerouting function to call on a cache miss. Must have the same signature as `rerouting_new`.
+
+    Returns
+    -------
+    function
+        The rerouter to give the policy. Only routes are cached; asking it for the objective always solves.
+    """
+
+    def f(
+        i,
+        route,
+        distance_matrix,
+        time_matrix,
+        time_windows,
+        current_time,
+        alternates={},
+        **kwargs
+    ):
+        key = cache.key(i, route, time_matrix, time_windows, current_time, alternates)
+        res = cache.get(key)
+        if res is None:
+            # Solve at the bucketed time, so every call with the same key gets the same answer
+            res = rerouter(
+                i,
+                route,
+                distance_matrix,
+                time_matrix,
+                time_windows,
+                key[3],
+                alternates,
+                **kwargs
+            )
+            cache.put(key, res)
+        else:
+            logger.debug("Rerouting cache hit")
+        return res
+
+    return wrap_rerouting(f, rerouter)
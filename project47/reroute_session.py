@@ -0,0 +1,199 @@
+from project47.simulation import solve_rerouting, rerouting_new, wrap_rerouting
+from collections import OrderedDict
+import functools
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RerouteSession:
+    """Rerouting state for a single vehicle, reused for every reroute in its day
+
+    `rerouting_new` rebuilds the subproblem from scratch each time; slicing rows out of the full matrices,
+    and scanning the whole alternates dict. A vehicle can only ever visit the locations in its route and
+    their alternates though, so this works out that set of candidate locations once, and keeps the
+    submatrix and index maps for it. Each reroute then only needs the current time and time windows.
+
+    Completed stops, and stops a reroute dropped, are marked inactive. Once less than half the candidates are active, the submatrix is
+    shrunk down to just the active ones, so the cost of a reroute keeps dropping through the day.
+
+    Attributes
+    ----------
+    places : np.array
+        The candidate locations, as indices into the full matrices
+    index : dict
+        Maps a location to its index in places
+    tm : np.array
+        Time matrix between the candidate locations
+    time_windows : np.array
+        nx2, the full time windows. This is a reference, so changes made by the policies are picked up.
+    alternates : dict
+        Maps each candidate location to its alternates, as locations
+    active : np.array
+        Whether each candidate location still needs to be visited
+    """
+
+    def __init__(self, route, time_matrix, time_windows, alternates={}):
+        candidates = []
+        seen = set()
+        for node in list(route) + [
+            a for node in route[1:-1] for a in alternates.get(node, [])
+        ]:
+            if node not in seen:
+                seen.add(node)
+                candidates.append(node)
+        self.alternates = {
+            node: list(alternates[node])
+            for node in candidates
+            if len(alternates.get(node, [])) > 0
+        }
+        self.time_windows = time_windows
+        self._set_places(np.array(candidates, dtype=int), time_matrix)
+
+    def _set_places(self, places, time_matrix, rows=None):
+        """Builds the index map and submatrix. rows selects from time_matrix if it is already a submatrix."""
+        if rows is None:
+            rows = places
+        self.tm = time_matrix[np.ix_(rows, rows)]
+        self.places = places
+        self.index = {int(node): k for k, node in enumerate(places)}
+        self.active = np.ones(len(places), dtype=bool)
+
+    def covers(self, route):
+        """Whether every location in the route is a candidate for this session"""
+        return all(int(node) in self.index for node in route)
+
+    def complete(self, nodes):
+        """Marks locations as visited, shrinking the submatrix once enough are done"""
+        for node in nodes:
+            k = self.index.get(int(node))
+            if k is not None:
+                self.active[k] = False
+        if self.active.sum() < len(self.active) / 2:
+            keep = np.flatnonzero(self.active)
+            self._set_places(self.places[keep], self.tm, keep)
+
+    def retain(self, route):
+        """Marks every location that can no longer be visited along route (anything but its locations and their alternates) as done"""
+        keep = {int(node) for node in route}
+        keep.update(
+            a for node in route[1:-1] for a in self.alternates.get(int(node), [])
+        )
+        self.complete(node for node in self.places.tolist() if node not in keep)
+
+    def reroute(
+        self,
+        i,
+        route,
+        current_time,
+        **kwargs,
+    ):
+        """Same as `rerouting_new`, but using the session's submatrix
+
+        Parameters
+        ----------
+        i : int
+            The current position of the vehicle along the route
+        route : array-like
+            The list of locations we are travelling along
+        current_time : int
+            The current time of day
+        kwargs
+            Passed through to `solve_rerouting`
+
+        Returns
+        -------
+        route : list
+            See `rerouting_new`
+        """
+        logger.debug("Session rerouting started")
+        places_to_visit = [int(node) for node in route[i:]]
+        for node in route[i + 1 : -1]:
+            # Alternates that were already visited have been dropped from the session
+            places_to_visit.extend(
+                k for k in self.alternates.get(node, []) if k in self.index
+            )
+        local = [self.index[node] for node in places_to_visit]
+
+        options = []
+        for j in range(1, len(route[i:]) - 1):
+            original_node = places_to_visit[j]
+            option = [j]
+            for k in self.alternates.get(original_node, []):
+                if k in self.index:
+                    option.append(places_to_visit.index(k))
+            options.append(option)
+
+        sub_route, _ = solve_rerouting(
+            self.tm[np.ix_(local, local)],
+            self.time_windows[places_to_visit],
+            len(route[i:]),
+            options,
+            current_time,
+            **kwargs,
+        )
+        if sub_route is None:
+            return list(route[i:])
+        return [places_to_visit[k] for k in sub_route]
+
+
+def session_rerouting(max_sessions=100, **solver_kwargs):
+    """Rerouting that keeps a `RerouteSession` for each vehicle
+
+    A session is created the first time a vehicle reroutes, and then handed on with the route it returns.
+    The simulation passes that same route object back in next time, so we can find the session again without
+    needing to know which vehicle it is.
+
+    A route that goes straight back to the end can't be rerouted again, so its session is let go. Otherwise we
+    can't tell when a vehicle has finished, so only the max_sessions most recent sessions are kept.
+
+    Parameters
+    ----------
+    max_sessions : int
+        The most sessions to keep at once. Should be at least the number of vehicles, or sessions will be rebuilt.
+    solver_kwargs
+        Passed through to `solve_rerouting`, such as tlim
+
+    Returns
+    -------
+    function
+        The rerouter to give the policy. Objectives are worked out by `rerouting_new`, outside the sessions.
+        `f.stats` counts how many sessions were created and how many reroutes reused one.
+    """
+    sessions = OrderedDict()
+
+    def f(
+        i,
+        route,
+        distance_matrix,
+        time_matrix,
+        time_windows,
+        current_time,
+        alternates={},
+        **kwargs,
+    ):
+        entry = sessions.pop(id(route), None)
+        if entry is not None and entry[0] is route and entry[1].covers(route[i:]):
+            session = entry[1]
+            session.time_windows = time_windows
+            f.stats["reused"] += 1
+        else:
+            session = RerouteSession(route, time_matrix, time_windows, alternates)
+            f.stats["created"] += 1
+        # The end of the route is usually the depot, which is also the start, so don't mark it as done
+        session.complete(
+            node for node in route[:i] if node not in (route[i], route[-1])
+        )
+
+        res = session.reroute(i, route, current_time, **{**solver_kwargs, **kwargs})
+        if len(res) > 2:
+            session.retain(res)
+            sessions[id(res)] = (res, session)
+            if len(sessions) > max_sessions:
+                sessions.popitem(last=False)
+        return res
+
+    f.stats = {"created": 0, "reused": 0}
+    return wrap_rerouting(f, functools.partial(rerouting_new, **solver_kwargs))
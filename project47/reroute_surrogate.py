@@ -0,0 +1,294 @@
+from project47.simulation import rerouting_new, wrap_rerouting
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from collections import deque
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+FEATURES = [
+    "stops",  # Stops left in the route, not counting the current location and the end
+    "dropped",  # Stops the trivial repair drops
+    "dropped_fraction",
+    "first_dropped",  # Where the first dropped stop is, as a fraction of the stops left. 1 if none.
+    "min_slack",  # Smallest time window slack along the repaired route
+    "mean_slack",
+    "waiting",  # Total waiting along the repaired route
+    "alternates",  # Stops left that have alternate locations
+    "current_time",
+]
+
+
+def trivial_repair(i, route, time_matrix, time_windows, current_time):
+    """The rest of the route in the same order, leaving out stops that can no longer be made in time
+
+    This is what rerouting usually comes up with: the policies close the time window of the stop they're giving up on,
+    and the solver drops it and keeps everything else as it was.
+
+    Returns
+    -------
+    route : list
+        The repaired route, starting at route[i]
+    arrival : np.array
+        Service start time at each stop of the repaired route
+    """
+    rest = route[i:]
+    repaired = [rest[0]]
+    arrival = [current_time]
+    time = current_time
+    for k in rest[1:-1]:
+        t = max(time + time_matrix[repaired[-1], k], time_windows[k][0])
+        if t > time_windows[k][1]:
+            continue
+        repaired.append(k)
+        arrival.append(t)
+        time = t
+    repaired.append(rest[-1])
+    arrival.append(time + time_matrix[repaired[-2], rest[-1]])
+    return repaired, np.array(arrival, dtype=float)
+
+
+def reroute_features(i, route, time_matrix, time_windows, current_time, alternates={}):
+    """Describes a rerouting call as a fixed length vector, see FEATURES
+
+    Returns
+    -------
+    features : np.array
+    repaired : list
+        The route from `trivial_repair`
+    """
+    repaired, arrival = trivial_repair(
+        i, route, time_matrix, time_windows, current_time
+    )
+    nodes = np.array(repaired, dtype=int)
+    stops = len(route) - i - 2
+    dropped = stops - (len(repaired) - 2)
+    kept = set(repaired)
+    first = next(
+        (k for k, loc in enumerate(route[i + 1 : -1]) if loc not in kept), stops
+    )
+
+    slack = np.asarray(time_windows)[nodes[1:-1], 1] - arrival[1:-1]
+    travel = np.array(
+        [time_matrix[a, b] for a, b in zip(repaired[:-1], repaired[1:])], dtype=float
+    )
+    waiting = arrival[-1] - current_time - travel.sum()
+    n_alternates = sum(1 for k in route[i + 1 : -1] if len(alternates.get(k, [])) > 0)
+
+    features = np.array(
+        [
+            stops,
+            dropped,
+            dropped / max(stops, 1),
+            first / max(stops, 1),
+            slack.min() if len(slack) > 0 else 0,
+            slack.mean() if len(slack) > 0 else 0,
+            waiting,
+            n_alternates,
+            current_time,
+        ],
+        dtype=float,
+    )
+    return features, repaired
+
+
+class RerouteSurrogate:
+    """Predicts whether a rerouting solve will give anything other than the trivial repair
+
+    Most reroutes just drop the stop the policy gave up on, which `trivial_repair` does without a solver.
+    This keeps a log of the features of each solved call, and whether the solver changed anything beyond the trivial
+    repair. A classifier is fit to the log, and when it is confident the solve won't change anything (the probability
+    of no change is at least threshold), `surrogate_rerouting` uses the trivial repair instead.
+
+    Skipping is only worth it while the predictions are right, so they are checked as we go. Every call that does get
+    solved is a check of the prediction for it, and every `audit_every`th skip is solved anyway. If the accuracy over the
+    last `window` checks drops below `min_accuracy`, we fall back to always solving, while still checking the predictions,
+    until the accuracy recovers.
+
+    Attributes
+    ----------
+    model : sklearn classifier
+        Anything with fit and predict_proba. Defaults to a scaled logistic regression.
+    threshold : float
+        The probability of no change needed to skip the solve
+    min_accuracy : float
+        The accuracy below which we fall back to solving every time
+    window : int
+        The number of recent checks the accuracy is worked out over
+    min_checks : int
+        The number of checks needed before falling back
+    audit_every : int
+        Solve anyway for every this many skips. 0 to never audit.
+    fitted : bool
+        Whether the model has been fit. Every call is solved until it has.
+    fallback : bool
+        Whether we are currently solving every call, because the accuracy was too low
+    features, labels : list
+        The log of solved calls. A label of 1 means the solver changed the route.
+    skipped : int
+        Number of calls answered with the trivial repair
+    solved : int
+        Number of calls passed to the solver
+    checked : int
+        Number of predictions checked against the solver
+    correct : int
+        Number of those that were right
+    """
+
+    def __init__(
+        self,
+        model=None,
+        threshold=0.9,
+        min_accuracy=0.9,
+        window=100,
+        min_checks=20,
+        audit_every=10,
+    ):
+        if model is None:
+            model = make_pipeline(StandardScaler(), LogisticRegression())
+        self.model = model
+        self.threshold = threshold
+        self.min_accuracy = min_accuracy
+        self.min_checks = min_checks
+        self.audit_every = audit_every
+        self.fitted = False
+        self.fallback = False
+        self.features = []
+        self.labels = []
+        self.skipped = 0
+        self.solved = 0
+        self.checked = 0
+        self.correct = 0
+        self._recent = deque(maxlen=window)
+        self._skips = 0
+
+    @property
+    def accuracy(self):
+        """Accuracy over the recent checks, or None if there haven't been any"""
+        if len(self._recent) == 0:
+            return None
+        return sum(self._recent) / len(self._recent)
+
+    def fit(self, features=None, labels=None):
+        """Fits the model, to the log of solved calls unless other data is given
+
+        Resets the accuracy checks and any fallback, as they were for the old model.
+        Does nothing (apart from logging a warning) if the data only has one outcome, as there is nothing to learn.
+        """
+        X = np.asarray(self.features if features is None else features, dtype=float)
+        y = np.asarray(self.labels if labels is None else labels, dtype=int)
+        if len(np.unique(y)) < 2:
+            logger.warning(
+                "Can't fit reroute surrogate, need examples of both outcomes"
+            )
+            return self
+        self.model.fit(X, y)
+        self.fitted = True
+        self.fallback = False
+        self._recent.clear()
+        return self
+
+    def save_log(self, path):
+        """Saves the log of solved calls to a .npz file, so a surrogate can be trained from many runs"""
+        np.savez(
+            path,
+            features=np.array(self.features, dtype=float).reshape((-1, len(FEATURES))),
+            labels=np.array(self.labels, dtype=int),
+        )
+
+    def load_log(self, path):
+        """Adds calls saved by `save_log` to the log"""
+        data = np.load(path)
+        self.features.extend(data["features"])
+        self.labels.extend(data["labels"].tolist())
+
+    def predict_skip(self, features):
+        """Whether the model is confident the solver won't change anything. None if there is no model yet."""
+        if not self.fitted:
+            return None
+        p = self.model.predict_proba(features[None, :])[0]
+        no_change = (
+            p[list(self.model.classes_).index(0)] if 0 in self.model.classes_ else 0
+        )
+        return bool(no_change >= self.threshold)
+
+    def audit(self):
+        """Whether to solve this skip anyway, to check the prediction"""
+        self._skips += 1
+        return self.audit_every > 0 and self._skips % self.audit_every == 0
+
+    def record(self, features, changed, skip=None):
+        """Adds a solved call to the log, and checks the prediction for it if there was one"""
+        self.solved += 1
+        self.features.append(features)
+        self.labels.append(int(changed))
+        if skip is None:
+            return
+        right = skip != changed
+        self.checked += 1
+        self.correct += right
+        self._recent.append(right)
+        accuracy = self.accuracy
+        if not self.fallback and len(self._recent) >= self.min_checks:
+            if accuracy < self.min_accuracy:
+                logger.warning(
+                    "Reroute surrogate accuracy %.2f too low, solving every call",
+                    accuracy,
+                )
+                self.fallback = True
+        elif self.fallback and accuracy >= self.min_accuracy:
+            logger.info("Reroute surrogate accuracy recovered to %.2f", accuracy)
+            self.fallback = False
+
+
+def surrogate_rerouting(surrogate: RerouteSurrogate, rerouter=rerouting_new):
+    """Wraps a rerouting function so that the surrogate can skip the solve
+
+    Parameters
+    ----------
+    surrogate : RerouteSurrogate
+    rerouter : function
+        The rerouting function to call when the solve isn't skipped. Must have the same signature as `rerouting_new`.
+
+    Returns
+    -------
+    function
+        The rerouter to give the policy. Skipped solves return the trivial repair, and every solve is logged
+        in the surrogate for it to learn from.
+    """
+
+    def f(
+        i,
+        route,
+        distance_matrix,
+        time_matrix,
+        time_windows,
+        current_time,
+        alternates={},
+        **kwargs
+    ):
+        features, repaired = reroute_features(
+            i, route, time_matrix, time_windows, current_time, alternates
+        )
+        skip = surrogate.predict_skip(features)
+        if skip and not surrogate.fallback and not surrogate.audit():
+            logger.debug("Rerouting skipped by surrogate")
+            surrogate.skipped += 1
+            return repaired
+        res = rerouter(
+            i,
+            route,
+            distance_matrix,
+            time_matrix,
+            time_windows,
+            current_time,
+            alternates,
+            **kwargs
+        )
+        surrogate.record(features, list(res) != repaired, skip)
+        return res
+
+    return wrap_rerouting(f, rerouter)
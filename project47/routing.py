@@ -197,6 +197,45 @@ class ORToolsRouting:
 
         return time_dimension, transit_callback_index
 
+    def add_time_dependent_windows(
+        self,
+        travel_times,
+        time_windows: dict,
+        slack_max: int,
+        capacity: int,
+        fix_start_cumul_to_zero: bool,
+        name: str,
+    ):
+        """Adds a time windowed constraint, with travel times that depend on the time of day
+
+        OR-tools transit callbacks only get the two nodes, not the time we leave at. So travel times out of each node
+        are taken from the slice its time window starts in, which is when the vehicle is expected to be there.
+        The resulting matrix is worked out once here, so the callback is still just an index into a matrix.
+
+        Parameters
+        ----------
+        travel_times : TravelTimes
+            See travel_time.py
+        time_windows : dict
+            A dict that is indexed by the location number, returning an 1d array-like structure with [start_window, end_window]
+
+        Otherwise, see add_time_windows.
+        """
+        starts = np.array([time_windows[loc][0] for loc in range(self.locs)])
+        slices = travel_times.slice_index(starts)
+        nodes = np.arange(self.locs)
+        time_matrix = np.rint(
+            travel_times.tensor[slices[:, None], nodes[:, None], nodes[None, :]]
+        ).astype(int)
+        return self.add_time_windows(
+            time_matrix,
+            time_windows,
+            slack_max,
+            capacity,
+            fix_start_cumul_to_zero,
+            name,
+        )
+
     def add_disjunction(self, node, penalty):
         """Allows the solver to drop the node
 
@@ -222,7 +261,7 @@ class ORToolsRouting:
             list(map(self.manager.NodeToIndex, nodes)), penalty, 1
         )
 
-    def solve(self, tlim=10, log=True):
+    def solve(self, tlim=10, log=True, solution_limit=None):
         """Solves the route. If the solution has a better objective, this saves the solution.
 
         Parameters
@@ -231,6 +270,9 @@ class ORToolsRouting:
             The maximum time to run the solver for
         log : bool
             Whether to log the output.
+        solution_limit : int (Optional)
+            Stop after this many solutions have been found. Unlike the time limit, this doesn't depend on how fast the machine is,
+            or what else is running on it, so the result is reproducible. tlim still applies, so set it high enough not to be hit.
 
         Notes
         -----
@@ -243,6 +285,8 @@ class ORToolsRouting:
             self.create_model()
 
         self.search_parameters.time_limit.seconds = tlim
+        if solution_limit is not None:
+            self.search_parameters.solution_limit = solution_limit
         self.search_parameters.log_search = log
 
         sol = self.routing.SolveWithParameters(self.search_parameters)
@@ -0,0 +1,106 @@
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python 3.7. Everything can still be run in a single process, with workers=1.
+    shared_memory = None
+
+# Set in each worker process by init_worker
+worker_state = {}
+
+
+class SharedArray:
+    """A numpy array in shared memory, so worker processes can read it without it being pickled and copied
+
+    Create one in the parent process, and send `spec` to the workers, which get the array back with `attach`.
+    The parent owns the memory, and frees it with `unlink` (or by using this as a context manager).
+    Workers should treat the array as read-only. Needs Python 3.8 or later.
+
+    Attributes
+    ----------
+    array : np.array
+        The parent's view of the shared array
+    spec : tuple
+        (name, shape, dtype), everything a worker needs to attach to the array
+    """
+
+    def __init__(self, a):
+        if shared_memory is None:
+            raise RuntimeError(
+                "Shared memory needs Python 3.8 or later, use workers=1 instead"
+            )
+        a = np.asarray(a)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        self.array = np.ndarray(a.shape, dtype=a.dtype, buffer=self._shm.buf)
+        self.array[...] = a
+        self.spec = (self._shm.name, a.shape, a.dtype.str)
+
+    def unlink(self):
+        """Frees the shared memory. Workers must be finished with it first."""
+        del self.array
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.unlink()
+
+
+def attach(spec):
+    """Gets a shared array in a worker process
+
+    Parameters
+    ----------
+    spec : tuple
+        `SharedArray.spec` from the parent
+
+    Returns
+    -------
+    shm : SharedMemory
+        Needs to be kept alive as long as the array is in use
+    array : np.array
+        Read-only view of the shared array
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    # Workers started by multiprocessing share the parent's resource tracker, so attaching here
+    # doesn't need unregistering. The parent's unlink clears it.
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array.flags.writeable = False
+    return shm, array
+
+
+def init_worker(dm_spec, tm_spec, state):
+    """Sets up a worker process, attaching to the shared distance and time matrices
+
+    worker_state gets everything in state, plus the matrices as dm and tm.
+    """
+    shm_dm, dm = attach(dm_spec)
+    shm_tm, tm = attach(tm_spec)
+    worker_state.update(state, shm=(shm_dm, shm_tm), dm=dm, tm=tm)
+
+
+def worker_pool(workers, distance_matrix, time_matrix, state):
+    """A process pool whose workers each get state, and the matrices from the given `SharedArray`s, in worker_state
+
+    state is pickled once for each worker, rather than with every task.
+    """
+    return ProcessPoolExecutor(
+        workers,
+        initializer=init_worker,
+        initargs=(distance_matrix.spec, time_matrix.spec, state),
+    )
+
+
+def local_state(distance_matrix, time_matrix, state):
+    """What worker_state would be in a worker, for running the tasks in this process instead
+
+    Workers get their own copy of state by pickling, this does the same here. A deep copy also keeps the alternates
+    sets of any customers pointing at the copies.
+    """
+    return dict(deepcopy(state), dm=distance_matrix, tm=time_matrix)
@@ -0,0 +1,109 @@
+import numpy as np
+
+# Outcome codes for each row of a SimRecord
+START = 0  # Vehicle is at the start of its route
+DELIVERED = 1  # Successful delivery
+FUTILE = 2  # Futile delivery
+REROUTE = 3  # Vehicle was given a new route. The row is the start of the new route.
+DEPOT = 4  # Arrived at the depot
+
+STOP_DTYPE = np.dtype(
+    [
+        ("vehicle", np.int32),
+        ("stop", np.int32),
+        ("node", np.int64),
+        ("arrival", np.float64),
+        ("distance", np.float64),
+        ("outcome", np.int8),
+    ]
+)
+
+
+class SimRecord:
+    """Per-stop outcomes of a simulation, stored in a preallocated structured array
+
+    There is one row for the start of each route, and one row for every step a vehicle takes after that.
+    The arrival time and distance in each row are cumulative for that vehicle.
+
+    The array is sized from the route lengths, which is enough unless vehicles reroute.
+    If it fills up, the capacity is doubled, so appending is amortized O(1).
+
+    Attributes
+    ----------
+    data : np.array
+        The underlying structured array, of dtype STOP_DTYPE. Only the first `size` rows are used.
+    size : int
+        The number of rows recorded
+    """
+
+    def __init__(self, capacity=16):
+        self.data = np.zeros(max(int(capacity), 1), dtype=STOP_DTYPE)
+        self.size = 0
+
+    @classmethod
+    def for_routes(cls, routes):
+        """Creates a record big enough for all the routes, assuming no rerouting"""
+        return cls(sum(len(route) for route in routes))
+
+    def append(self, vehicle, stop, node, arrival, distance, outcome):
+        """Records a single row"""
+        if self.size == len(self.data):
+            self.data = np.concatenate((self.data, np.zeros_like(self.data)))
+        self.data[self.size] = (vehicle, stop, node, arrival, distance, outcome)
+        self.size += 1
+
+    def copy(self, spare=0):
+        """A copy of the recorded rows, with room for `spare` more rows before it needs to grow"""
+        record = SimRecord(self.size + spare)
+        record.data[: self.size] = self.rows
+        record.size = self.size
+        return record
+
+    @property
+    def rows(self):
+        """A view of the recorded rows"""
+        return self.data[: self.size]
+
+    def _by_vehicle(self, field, n_vehicles=None):
+        """Splits a field into one array per vehicle, in the order the rows were recorded"""
+        rows = self.rows
+        if n_vehicles is None:
+            n_vehicles = int(rows["vehicle"].max()) + 1 if self.size > 0 else 0
+        order = np.argsort(rows["vehicle"], kind="stable")
+        counts = np.bincount(rows["vehicle"], minlength=n_vehicles)
+        return np.split(rows[field][order], np.cumsum(counts)[:-1])
+
+    def distances(self, n_vehicles=None):
+        """Cumulative distance for each vehicle, in the same format `sim` returns"""
+        return self._by_vehicle("distance", n_vehicles)
+
+    def times(self, n_vehicles=None):
+        """Cumulative time for each vehicle, in the same format `sim` returns"""
+        return self._by_vehicle("arrival", n_vehicles)
+
+    def totals(self, n_vehicles=None):
+        """The total distance and time for each vehicle
+
+        Returns
+        -------
+        distances : np.array
+        times : np.array
+        """
+        rows = self.rows
+        if n_vehicles is None:
+            n_vehicles = int(rows["vehicle"].max()) + 1 if self.size > 0 else 0
+        distances = np.zeros(n_vehicles)
+        times = np.zeros(n_vehicles)
+        # Both are cumulative, so the total is the largest value
+        np.maximum.at(distances, rows["vehicle"], rows["distance"])
+        np.maximum.at(times, rows["vehicle"], rows["arrival"])
+        return distances, times
+
+    def count(self, outcome, n_vehicles=None):
+        """The number of rows with the given outcome for each vehicle"""
+        rows = self.rows
+        if n_vehicles is None:
+            n_vehicles = int(rows["vehicle"].max()) + 1 if self.size > 0 else 0
+        return np.bincount(
+            rows["vehicle"][rows["outcome"] == outcome], minlength=n_vehicles
+        )
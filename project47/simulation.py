@@ -1,17 +1,232 @@
 from project47.routing import *
+from project47.sim_record import *
+from project47.tracing import Tracer
+from project47.alternates import AlternatesIndex
+from project47.time_slack import ForwardSlack, schedule
 import numpy as np
-from copy import copy
-import json
-import os
 import gc
+import functools
+import heapq
+import math
 
 import logging
-from typing import List
+from typing import NamedTuple
 
 logger = logging.getLogger(__name__)
 
 
-def sim(s: RoutingSolution, update_function):
+class StepResult(NamedTuple):
+    """What an update function returns for a single step
+
+    Attributes
+    ----------
+    distance : number
+        Distance travelled this step
+    time : number
+        Time taken this step, including any waiting
+    futile : bool
+        Whether the delivery to the next location failed. Ignored if rerouting.
+    reroute : bool
+        Whether the vehicle has a new route. If not, it moves on to the next location in its current route.
+    route : list
+        The new route, starting at the current location. Only used if reroute is set.
+    """
+
+    distance: float
+    time: float
+    futile: bool
+    reroute: bool = False
+    route: list = None
+
+
+def as_step(result, route):
+    """Converts what an update function returned into a StepResult
+
+    Update functions used to return (distance, time, futile, route), with a reroute being signalled by returning
+    a different route. These are still accepted, the route is only compared if it isn't the same object.
+    """
+    if isinstance(result, StepResult):
+        return result
+    distance, time, futile, route_new = result
+    if route_new is not route and route_new != route:
+        return StepResult(distance, time, futile, True, route_new)
+    return StepResult(distance, time, futile)
+
+
+class SimEvent(NamedTuple):
+    """Something that happened in a simulation, see `sim_events`
+
+    Attributes
+    ----------
+    vehicle : int
+    stop : int
+        The index into the vehicle's current route of where it now is
+    node : int
+        The location it is at
+    time : number
+        Cumulative time for the vehicle
+    distance : number
+        Cumulative distance for the vehicle
+    kind : int
+        What happened, one of the outcome codes from sim_record.py (START, DELIVERED, FUTILE, REROUTE, DEPOT)
+    """
+
+    vehicle: int
+    stop: int
+    node: int
+    time: float
+    distance: float
+    kind: int
+
+
+def vehicle_events(i, route, update_function):
+    """Generates the events for a single vehicle travelling its route
+
+    The update function is only called when the next event is asked for, so the caller controls when the vehicle moves.
+
+    Each vehicle's route is held along with a cursor j, its current position. The update function returns a `StepResult`;
+    normally the cursor just moves on, and on a reroute the remaining route is replaced and the cursor goes back to 0.
+    So steps don't depend on the length of the route.
+    """
+    logger.debug("Vehicle %i", i)
+    total_distance = 0
+    total_time = 0
+    yield SimEvent(i, 0, route[0], total_time, total_distance, START)
+
+    j = 0
+
+    while j < (len(route) - 1):
+        step = as_step(update_function(route, j, total_time), route)
+        total_distance = total_distance + step.distance
+        total_time = total_time + step.time
+        # update the route and the index
+        if step.reroute:
+            j = 0
+            route = step.route
+            outcome = REROUTE
+            # futile[i] += len()
+            # delivered.append(route[j])
+        else:
+            if step.futile:
+                outcome = FUTILE
+            else:
+                if (
+                    route[j + 1] != 0
+                ):  # Getting annoyed at all the depo nodes getting added here. We're only using 0 for depo, so this is fine as a quick hack
+                    outcome = DELIVERED
+                else:
+                    outcome = DEPOT
+            j = j + 1
+        yield SimEvent(i, j, route[j], total_time, total_distance, outcome)
+
+
+def sim_events(
+    s: RoutingSolution, update_function, tracer: Tracer = None, time_order=False
+):
+    """Streaming simulator, generating events as they happen
+
+    Nothing is kept apart from where each vehicle is up to, so memory use doesn't grow as the simulation goes on.
+    Consumers can keep whatever totals they need as the events arrive (see `SimTotals`), and stop early if they want.
+
+    By default vehicles are run one after another, the same as `sim`, so the same random numbers get used.
+    With time_order, events from every vehicle are interleaved in time order instead, with ties going to the lower
+    numbered vehicle. The update functions get called in the same order as in `event_sim`.
+
+    Parameters
+    ----------
+    s : RoutingSolution
+        The solution for a single day for the routes each vehicle travels
+    update_function
+        Calculates the behaviour at each step
+    tracer : Tracer (Optional)
+        If given, every event is also written to this ring buffer, for debugging. See tracing.py.
+    time_order : bool
+        Whether to interleave the vehicles in time order
+
+    Yields
+    ------
+    SimEvent
+        Starting with a START event for each vehicle
+    """
+    vehicles = [
+        vehicle_events(i, route, update_function) for i, route in enumerate(s.routes)
+    ]
+    if time_order:
+        events = _merged(vehicles)
+    else:
+        events = (event for vehicle in vehicles for event in vehicle)
+
+    for event in events:
+        # Don't log here, formatting a message every step is slow even when nothing is logged. Use a tracer instead.
+        if tracer is not None:
+            tracer.append(*event)
+        yield event
+
+
+def _merged(vehicles):
+    """Events from each vehicle in time order
+
+    The heap holds the next event of each vehicle. Once an event is yielded, that vehicle's following step is worked
+    out, which calls the update function at the time of the event, so vehicles move in the same order as `EventSimulator`.
+    """
+    queue = []
+    for i, events in enumerate(vehicles):
+        yield next(events)
+    for i, events in enumerate(vehicles):
+        event = next(events, None)
+        if event is not None:
+            queue.append((event.time, i, event))
+    heapq.heapify(queue)
+    while queue:
+        _, i, event = heapq.heappop(queue)
+        yield event
+        event = next(vehicles[i], None)
+        if event is not None:
+            heapq.heappush(queue, (event.time, i, event))
+
+
+class SimTotals:
+    """Running totals over a stream of simulation events
+
+    Attributes
+    ----------
+    distance : np.array
+        Distance travelled by each vehicle so far
+    time : np.array
+        Time taken by each vehicle so far
+    futile : np.array
+        Futile deliveries by each vehicle
+    delivered : int
+        Successful deliveries so far
+    reroutes : int
+    """
+
+    def __init__(self, n_vehicles):
+        self.distance = np.zeros(n_vehicles)
+        self.time = np.zeros(n_vehicles)
+        self.futile = np.zeros(n_vehicles)
+        self.delivered = 0
+        self.reroutes = 0
+
+    def update(self, event: SimEvent):
+        """Adds an event to the totals"""
+        self.distance[event.vehicle] = event.distance
+        self.time[event.vehicle] = event.time
+        if event.kind == FUTILE:
+            self.futile[event.vehicle] += 1
+        elif event.kind == DELIVERED:
+            self.delivered += 1
+        elif event.kind == REROUTE:
+            self.reroutes += 1
+        return self
+
+
+def sim(
+    s: RoutingSolution,
+    update_function,
+    record: SimRecord = None,
+    tracer: Tracer = None,
+):
     """Simple simulator
 
     TODO: Docs need a rewrite
@@ -19,87 +234,252 @@ def sim(s: RoutingSolution, update_function):
     The current behaviour is to have each vehicle travel along each route individually. Times, distances,
     and the futile deliveries are calculated and recorded according to the provided functions.
 
+    This collects the events from `sim_events`, see there and `vehicle_events` for how each step works.
+
     Vehicles are all assumed to leave at time 0, and travel without breaks.
 
     This can be seen as a discrete event simulation, where events occur at arrivals to each location.
 
+    Every step is written into a SimRecord, which is preallocated from the route lengths. Pass one in
+    to get the per-stop data (node, arrival time, distance, outcome) back out.
+
+    `parallel_simulation.parallel_sim` runs each vehicle in a separate process instead.
+
     Parameters
     ----------
     s : RoutingSolution
         The solution for a single day for the routes each vehicle travels
     update_function
         Calculates the behaviour at each step
+    record : SimRecord (Optional)
+        Where to record each step. A new one is created if this isn't given.
+    tracer : Tracer (Optional)
+        If given, every step is also written to this ring buffer, for debugging. See tracing.py.
 
     Returns
     -------
-    distances : np.array
-        The distance each vehicle travels
-    times : np.array
-        The time each vehicle takes
+    distances : list[np.array]
+        The cumulative distance each vehicle travels, at each step
+    times : list[np.array]
+        The cumulative time each vehicle takes, at each step
     futile : np.array
         The number of futile deliveries for each vehicle
     delivered : list
         A list of all successful deliveries
     """
     logger.debug("Start simulation")
-    times: List[List[int]] = []
-    distances: List[List[int]] = []
+    if record is None:
+        record = SimRecord.for_routes(s.routes)
     futile = np.zeros(len(s.routes))
     delivered = []
 
-    for i, route in enumerate(s.routes):
-        logger.debug("Vehicle %i" % i)
-        times.append([])
-        times[-1].append(0)
-        distances.append([])
-        distances[-1].append(0)
-
-        j = 0
-
-        logger.debug(
-            "Route: %s, distance: %i, time: %i, futile: %s"
-            % (
-                route[j:],
-                distances[-1][-1],
-                times[-1][-1],
-                futile[i],
-            )
-        )
+    for event in sim_events(s, update_function, tracer):
+        record.append(*event)
+        if event.kind == FUTILE:
+            futile[event.vehicle] += 1
+        elif event.kind == DELIVERED:
+            delivered.append(event.node)
 
-        while j < (len(route) - 1):
-            distance, time, isfutile, route_new = update_function(
-                route, j, times[-1][-1]
-            )
-            distances[-1].append(distances[-1][-1] + distance)
-            times[-1].append(times[-1][-1] + time)
-            # compare two routes, update the route and the index
-            if route != route_new:
-                j = 0
-                route = route_new
-                # futile[i] += len()
-                # delivered.append(route[j])
+    logger.debug("End simulation")
+    n = len(s.routes)
+    return record.distances(n), record.times(n), futile, delivered
+
+
+# Event types for the event queue. Keeping the type in the queue means we can add other events
+# (new packages, breaks, etc) without changing the queue structure.
+ARRIVAL = 0
+ROUTE_READY = 1  # An asynchronous reroute has finished
+
+
+class EventSimulator:
+    """Discrete event simulator, with one event queue shared across all vehicles
+
+    `sim` runs each vehicle to completion before starting the next one. This keeps a heap of
+    (time, vehicle, event) items instead, so events are processed in time order across the whole fleet.
+    Scheduling and popping an event is O(log n) in the number of pending events.
+
+    An arrival event means the vehicle has arrived at `route[position]`, and is ready to call the update function
+    to decide what to do next. The update functions are the same closures used by `sim`, so all the policies work unchanged.
+    Ties are broken by vehicle number, then event type.
+
+    If the policy uses an `async_rerouting.AsyncRerouter`, pass it in as well. Reroutes it starts get a route ready event
+    scheduled at the time the new route arrives, and the new route replaces the rest of the vehicle's plan then.
+    Otherwise it solves each reroute before returning, as it has no way to hand the new route over.
+
+    Attributes
+    ----------
+    routes : list
+        The current route for each vehicle. These get replaced when a vehicle reroutes.
+    position : np.array
+        The index into the route of where each vehicle currently is
+    clock : np.array
+        The current time for each vehicle
+    odometer : np.array
+        The distance travelled by each vehicle so far
+    futile : np.array
+        The number of futile deliveries for each vehicle
+    delivered : list
+        All successful deliveries, in the order they happened
+    record : SimRecord
+        Every step taken, in the order they happened
+    queue : list
+        Heap of (time, vehicle, event) tuples
+    pending : dict
+        Maps vehicles to a list of the asynchronous reroute requests they are waiting on
+    tracer : Tracer
+        If not None, every step is also written here. See tracing.py.
+    """
+
+    def __init__(self, s: RoutingSolution, update_function, rerouter=None, tracer=None):
+        n = len(s.routes)
+        self.update_function = update_function
+        self.rerouter = rerouter
+        if rerouter is not None:
+            rerouter.simulator = self
+        self.tracer = tracer
+        self.pending = {}
+        self.routes = [route for route in s.routes]
+        self.position = np.zeros(n, dtype=int)
+        self.clock = np.zeros(n)
+        self.odometer = np.zeros(n)
+        self.futile = np.zeros(n)
+        self.delivered = []
+        self.record = SimRecord.for_routes(s.routes)
+        for i, route in enumerate(self.routes):
+            self.record.append(i, 0, route[0], 0, 0, START)
+            if tracer is not None:
+                tracer.append(i, 0, route[0], 0, 0, START)
+        self.queue = [(0, i, ARRIVAL) for i in range(n) if len(s.routes[i]) > 1]
+        heapq.heapify(self.queue)
+
+    def schedule(self, time, vehicle, event=ARRIVAL):
+        """Adds an event to the queue"""
+        heapq.heappush(self.queue, (time, vehicle, event))
+
+    def step(self):
+        """Processes the next event in the queue
+
+        Returns
+        -------
+        tuple
+            The (time, vehicle, event) that was processed
+        """
+        item = heapq.heappop(self.queue)
+        _, i, event = item
+        if event == ROUTE_READY:
+            self.route_ready(i)
+            return item
+        route = self.routes[i]
+        j = int(self.position[i])
+
+        step = as_step(self.update_function(route, j, self.clock[i]), route)
+        self.odometer[i] += step.distance
+        self.clock[i] += step.time
+        # Same logic as sim, see there for details
+        if step.reroute:
+            j = 0
+            self.routes[i] = route = step.route
+            outcome = REROUTE
+        else:
+            if step.futile:
+                self.futile[i] += 1
+                outcome = FUTILE
+            elif route[j + 1] != 0:
+                self.delivered.append(route[j + 1])
+                outcome = DELIVERED
             else:
-                if isfutile:
-                    futile[i] += 1
-                else:
-                    if (
-                        route[j + 1] != 0
-                    ):  # Getting annoyed at all the depo nodes getting added here. We're only using 0 for depo, so this is fine as a quick hack
-                        delivered.append(route[j + 1])
-                j = j + 1
-
-            logger.debug(
-                "Route: %s, distance: %i, time: %i, futile: %s"
-                % (
-                    route[j:],
-                    distances[-1][-1],
-                    times[-1][-1],
-                    futile[i],
-                )
-            )
+                outcome = DEPOT
+            j = j + 1
+        self.position[i] = j
+        self.record.append(i, j, route[j], self.clock[i], self.odometer[i], outcome)
+        if self.tracer is not None:
+            self.tracer.append(i, j, route[j], self.clock[i], self.odometer[i], outcome)
+
+        hold = False
+        if self.rerouter is not None:
+            for request in self.rerouter.drain():
+                # Anything requested during this step must be for this vehicle
+                self.pending.setdefault(i, []).append(request)
+                self.schedule(request.ready_time, i, ROUTE_READY)
+                hold = request.hold
+        if j < len(route) - 1 and not hold:
+            self.schedule(self.clock[i], i)
+        return item
+
+    def route_ready(self, i):
+        """Swaps in the route from an asynchronous reroute
+
+        The solver started from where the vehicle was when it asked. Since then the vehicle kept going
+        (unless it was holding), so stops it has visited since are removed, and the new route starts from
+        the stop it is currently at or heading to.
+        """
+        self.pending[i].sort(key=lambda r: r.ready_time)
+        request = self.pending[i].pop(0)
+        new_route = request.result()
+        route = self.routes[i]
+        j = int(self.position[i])
+        if j >= len(route) - 1 and not request.hold:
+            return  # Already finished the day
+        visited = set(route[:j])
+        current = route[j]
+        new_route = (
+            [current]
+            + [loc for loc in new_route[1:-1] if loc not in visited and loc != current]
+            + [new_route[-1]]
+        )
+        self.routes[i] = new_route
+        self.position[i] = 0
+        if request.hold:
+            # Vehicle was waiting for the route, so it leaves now
+            self.clock[i] = max(self.clock[i], request.ready_time)
+        self.record.append(i, 0, current, self.clock[i], self.odometer[i], REROUTE)
+        if self.tracer is not None:
+            self.tracer.append(i, 0, current, self.clock[i], self.odometer[i], REROUTE)
+        if request.hold and len(new_route) > 1:
+            self.schedule(self.clock[i], i)
+
+    def run(self, until=None):
+        """Processes events until the queue is empty, or the next event is after `until`"""
+        while self.queue and (until is None or self.queue[0][0] <= until):
+            self.step()
+        return self.results()
+
+    def results(self):
+        """Returns results in the same format as `sim`"""
+        n = len(self.routes)
+        return (
+            self.record.distances(n),
+            self.record.times(n),
+            self.futile,
+            self.delivered,
+        )
 
-    logger.debug("End simulation")
-    return distances, times, futile, delivered
+
+def event_sim(s: RoutingSolution, update_function, tracer: Tracer = None):
+    """Event based simulator
+
+    Runs the same policies as `sim`, but steps every vehicle in time order using `EventSimulator`.
+    The results are the same as `sim`, except that deliveries are listed in the order they happen,
+    and random numbers get drawn in time order rather than vehicle by vehicle.
+
+    Parameters
+    ----------
+    s : RoutingSolution
+        The solution for a single day for the routes each vehicle travels
+    update_function
+        Calculates the behaviour at each step
+    tracer : Tracer (Optional)
+        See `sim`
+
+    Returns
+    -------
+    distances, times, futile, delivered
+        See `sim`
+    """
+    logger.debug("Start event simulation")
+    res = EventSimulator(s, update_function, tracer=tracer).run()
+    logger.debug("End event simulation")
+    return res
 
 
 def default_update_function(distance_matrix, time_matrix, time_windows):
@@ -122,7 +502,7 @@ def default_update_function(distance_matrix, time_matrix, time_windows):
             )
         else:
             futile = True  # why futile is true if it does not have a tw?
-        return next_distance, next_time, futile, route
+        return StepResult(next_distance, next_time, futile)
 
     return h
 
@@ -166,7 +546,7 @@ def base_policy(
         futile = not customers[route[i + 1]].visit(
             time + next_time
         )  # check if the next delivery is going to be futile
-        return next_distance, next_time, futile, route
+        return StepResult(next_distance, next_time, futile)
 
     return h
 
@@ -212,7 +592,7 @@ def wait_policy(
         futile = not customers[route[i + 1]].visit(
             time + next_time
         )  # check if the next delivery is going to be futile
-        return next_distance, next_time, futile, route
+        return StepResult(next_distance, next_time, futile)
 
     return h
 
@@ -232,13 +612,18 @@ def truewait_policy(
     def h(route, i, time):
         next_distance = f(route[i], route[i + 1], time)
         next_time = g(route[i], route[i + 1], time)
-        futile = not customers[route[i + 1]].visit(time + next_time)
-        while time + next_time < time_windows[route[i + 1]][0]:
-            next_time += 5
-            futile = not customers[route[i + 1]].visit(time + next_time)
-            if not futile:
-                break
-        return next_distance, next_time, futile, route
+        arrival = time + next_time
+        window_start = time_windows[route[i + 1]][0]
+        if arrival >= window_start:
+            futile = not customers[route[i + 1]].visit(arrival)
+        else:
+            # Try every 5 seconds until the window opens, including the first try at or after it.
+            # poll jumps straight to the successful try, rather than visiting each time.
+            last = arrival + 5 * math.ceil((window_start - arrival) / 5)
+            success_time, success = customers[route[i + 1]].poll(arrival + 5, last, 5)
+            next_time = success_time - time
+            futile = not success
+        return StepResult(next_distance, next_time, futile)
 
     return h
 
@@ -249,11 +634,18 @@ def estimate_ahead_policy(
     time_windows,
     customers,
     rg=np.random.Generator(np.random.PCG64(123)),
+    rerouter=None,
+    alternates=None,
+    forward_check=False,
 ):
     """Does the most basic behaviour possible
 
     Checks for lateness at each stage. If late, reroute. Should basically just remove the next location, but some reordering of other locations may occur.
 
+    With forward_check, lateness is checked for the whole rest of the route rather than just the next stop, using `time_slack.ForwardSlack`.
+    This reroutes as soon as any later stop becomes infeasible, so there is one reroute early on instead of one at each late stop.
+    Stops are only reported once; if the rerouter keeps a stop that is still infeasible, we don't reroute again for it.
+
     If a new route is returned in the update, no distance or time should elapse, and the current location should be at the start of the route.
 
     Parameters
@@ -268,6 +660,14 @@ def estimate_ahead_policy(
         List of customer objects, with a visit method
     rg : np.RandomGenerator
         Controls the stream of random numbers
+    rerouter : function (Optional)
+        The function to call to reroute. Defaults to `rerouting_new`; anything with the same signature works,
+        such as `reroute_cache.memoized_rerouting`.
+    alternates : AlternatesIndex (Optional)
+        The alternate locations of each customer, see alternates.py. Built from the customers if not given.
+        multiday can pass in the index it builds for the day, see its pass_alternates option.
+    forward_check : bool (Optional)
+        Whether to check all the remaining stops for lateness, see above
 
     Returns
     -------
@@ -277,22 +677,31 @@ def estimate_ahead_policy(
 
     f = default_distance_function(distance_matrix)
     g = default_time_function(time_matrix)
-    customers_list = customers.tolist()
-    alternates = {
-        i: [
-            customers_list.index(a)
-            for a in customers[i].alternates
-            if a != customers[i]
-        ]
-        for i in range(len(customers))
-    }
+    if rerouter is None:
+        rerouter = rerouting_new
+    if alternates is None:
+        alternates = AlternatesIndex.from_customers(customers)
+    slack = None
+    reported = set()
+
+    def late_ahead(route, i, time):
+        """Whether a stop after this one has just become infeasible"""
+        nonlocal slack
+        if slack is None or slack.route is not route:
+            # New route, from the start of a vehicle or a reroute
+            slack = ForwardSlack(route, time_matrix, time_windows, i, time)
+        new = [route[k] for k in slack.infeasible(i, time) if route[k] not in reported]
+        reported.update(new)
+        return len(new) > 0
 
     def h(route, i, time):
+        rerouted = False
         next_distance = f(route[i], route[i + 1], time)
         next_time = g(route[i], route[i + 1], time)
         if time + next_time < time_windows[route[i + 1]][0]:
             next_time = time_windows[route[i + 1]][0] - time
-        if time + next_time > time_windows[route[i + 1]][1]:
+        late = time + next_time > time_windows[route[i + 1]][1]
+        if late or (forward_check and late_ahead(route, i, time)):
             # go straight to depot if the next place is depot after skipping
             if False:  # route[i + 2] == 0:
                 next_distance = f(route[i], route[i + 2], time)
@@ -300,11 +709,11 @@ def estimate_ahead_policy(
                 route = [0]
                 futile = True  # manually set to True to avoid appending depot to the delivery list in the simulation.
                 # This should actually be unnecessary. We can strip those out after the simulation.
-                return next_distance, next_time, futile, route
+                return StepResult(next_distance, next_time, futile, True, route)
             # skip i+1 job and reroute
             else:
                 logger.debug("Late for next delivery")
-                route = rerouting_new(
+                new_route = rerouter(
                     i,
                     route,
                     distance_matrix,
@@ -313,24 +722,44 @@ def estimate_ahead_policy(
                     time,
                     alternates,
                 )
-                # print(route)
-                next_distance = 0  # f(route[0], route[1], time)
-                next_time = 0  # g(route[0], route[1], time)
-                futile = 0  # not customers[route[1]].visit(time + next_time)
+                # Only a reroute if something changed, otherwise we'd keep rerouting forever when it fails
+                rerouted = new_route != route
+                if rerouted:
+                    route = new_route
+                    # print(route)
+                    next_distance = 0  # f(route[0], route[1], time)
+                    next_time = 0  # g(route[0], route[1], time)
+                    futile = 0  # not customers[route[1]].visit(time + next_time)
+                else:
+                    # Nothing changed, so carry on to the next stop, which is futile if we're too late for it
+                    futile = late or not customers[route[i + 1]].visit(time + next_time)
         else:
             futile = not customers[route[i + 1]].visit(time + next_time)
 
-        return next_distance, next_time, futile, route
+        return StepResult(next_distance, next_time, futile, rerouted, route)
 
     return h
 
 
-def calling_policy(distance_matrix, time_matrix, time_windows, customers, rg):
+def calling_policy(
+    distance_matrix,
+    time_matrix,
+    time_windows,
+    customers,
+    rg,
+    rerouter=None,
+    alternates=None,
+    lookahead=1,
+):
     """Does the most basic behaviour possible
 
     Calls the next customer at each stage. If customer is unresponsive, reroute.
     Should basically just remove the next location, but some reordering of other locations may occur.
 
+    With lookahead > 1, the next lookahead customers are called together instead, each at their expected arrival time.
+    Each customer is only called once. Every stop in that window that is unresponsive or expected to be late is dropped in a single reroute,
+    rather than rerouting for each one as we get to it. Stops are only dropped once; if the rerouter keeps one, it's futile when we get there.
+
     There's also some stuff here for waiting if a delivery is futile; not too sure about it though.
 
     If a new route is returned in the update, no distance or time should elapse, and the current location should be at the start of the route.
@@ -347,34 +776,89 @@ def calling_policy(distance_matrix, time_matrix, time_windows, customers, rg):
         List of customer objects, with a visit method, and a call_ahead method.
     rg : np.RandomGenerator
         Controls the stream of random numbers
+    rerouter : function (Optional)
+        The function to call to reroute. Defaults to `rerouting_new`; anything with the same signature works,
+        such as `reroute_cache.memoized_rerouting`.
+    alternates : AlternatesIndex (Optional)
+        The alternate locations of each customer, see alternates.py. Built from the customers if not given.
+        multiday can pass in the index it builds for the day, see its pass_alternates option.
+    lookahead : int (Optional)
+        The number of customers to call at once, see above
 
     Returns
     -------
     function
-        This is a closure, so it returns an update function that can be used in the `sim` function
+        This is a closure, so it returns an update function that can be used in the `sim` function.
+        h.stats counts the calls made and the reroutes.
     """
 
     f = default_distance_function(distance_matrix)
     g = default_time_function(time_matrix)
-    customers_list = customers.tolist()
-    alternates = {
-        i: [
-            customers_list.index(a)
-            for a in customers[i].alternates
-            if a != customers[i]
-        ]
-        for i in range(len(customers))
-    }
+    if rerouter is None:
+        rerouter = rerouting_new
+    if alternates is None:
+        alternates = AlternatesIndex.from_customers(customers)
     time_windows = time_windows
+    called = set()
+    dropped = set()
+
+    def call(loc, arrival_time):
+        h.stats["calls"] += 1
+        return customers[loc].call_ahead(arrival_time)
+
+    def call_batch(route, i, arrival_time):
+        """Calls the next lookahead stops that haven't been called yet, returning the ones that can't be delivered to
+
+        arrival_time is the arrival at route[i + 1], and the rest are estimated from the time matrix.
+        """
+        stops = route[i + 1 : min(i + 1 + lookahead, len(route) - 1)]
+        if len(stops) == 0:
+            return []
+        arrival = schedule(stops, time_matrix, time_windows, arrival_time)
+        failed = []
+        for loc, t in zip(stops, arrival):
+            if loc in dropped:
+                continue
+            if t > time_windows[loc][1]:
+                failed.append(loc)
+            elif loc not in called:
+                called.add(loc)
+                if not call(loc, t):
+                    failed.append(loc)
+        return failed
 
     def h(route, i, time):
+        rerouted = False
         next_distance = f(route[i], route[i + 1], time)
         next_time = g(route[i], route[i + 1], time)
         if time + next_time < time_windows[route[i + 1]][0]:
             next_time = time_windows[route[i + 1]][0] - time
-        if (time + next_time > time_windows[route[i + 1]][1]) or not customers[
-            route[i + 1]
-        ].call_ahead(time + next_time):
+        if lookahead > 1:
+            failed = call_batch(route, i, time + next_time)
+            if len(failed) > 0:
+                logger.debug("%i customers late or unresponsive", len(failed))
+                dropped.update(failed)
+                time_windows[failed, 0] = 0
+                time_windows[failed, 1] = 1
+                h.stats["reroutes"] += 1
+                new_route = rerouter(
+                    i,
+                    route,
+                    distance_matrix,
+                    time_matrix,
+                    time_windows,
+                    time,
+                    alternates,
+                )
+                if new_route != route:
+                    return StepResult(0, 5, 0, True, new_route)
+            # Carry on to the next stop, which is futile if the rerouter kept it after it was dropped
+            futile = route[i + 1] in dropped or not customers[route[i + 1]].visit(
+                time + next_time
+            )
+        elif (time + next_time > time_windows[route[i + 1]][1]) or not call(
+            route[i + 1], time + next_time
+        ):
             # go straight to depot if the next place is depot after skipping
             if False:  # route[i + 2] == 0:
                 next_distance = f(route[i], route[i + 2], time)
@@ -382,14 +866,15 @@ def calling_policy(distance_matrix, time_matrix, time_windows, customers, rg):
                 route = [0]
                 futile = True  # manually set to True to avoid appending depot to the delivery list in the simulation.
                 # This should actually be unnecessary. We can strip those out after the simulation.
-                return next_distance, next_time, futile, route
+                return StepResult(next_distance, next_time, futile, True, route)
             # skip i+1 job and reroute
             else:
                 logger.debug("Late for delivery, or customer unresponsive")
                 time_windows
                 time_windows[route[i + 1], 0] = 0
                 time_windows[route[i + 1], 1] = 1
-                route = rerouting_new(
+                h.stats["reroutes"] += 1
+                new_route = rerouter(
                     i,
                     route,
                     distance_matrix,
@@ -398,37 +883,48 @@ def calling_policy(distance_matrix, time_matrix, time_windows, customers, rg):
                     time,
                     alternates,
                 )
-                next_distance = 0  # f(route[0], route[1], time)
-                next_time = 5  # g(route[0], route[1], time)
-                futile = 0  # not customers[route[1]].visit(time + next_time)
+                rerouted = new_route != route
+                if rerouted:
+                    route = new_route
+                    next_distance = 0  # f(route[0], route[1], time)
+                    next_time = 5  # g(route[0], route[1], time)
+                    futile = 0  # not customers[route[1]].visit(time + next_time)
+                else:
+                    # Nothing changed, so carry on to the next stop, which we're too late for or nobody is in at
+                    futile = True
         else:
 
             futile = not customers[route[i + 1]].visit(time + next_time)
 
-        return next_distance, next_time, futile, route
+        return StepResult(next_distance, next_time, futile, rerouted, route)
 
+    h.stats = {"calls": 0, "reroutes": 0}
     return h
 
 
-def new_tw_policy(distance_matrix, time_matrix, time_windows, customers, rg):
+def new_tw_policy(
+    distance_matrix,
+    time_matrix,
+    time_windows,
+    customers,
+    rg,
+    rerouter=None,
+    alternates=None,
+):
     """Idea is to get new time-windows from the customer, instead of simply calling ahead
 
     Doesn't quite work properly yet.
     """
     f = default_distance_function(distance_matrix)
     g = default_time_function(time_matrix)
-    customers_list = customers.tolist()
-    alternates = {
-        i: [
-            customers_list.index(a)
-            for a in customers[i].alternates
-            if a != customers[i]
-        ]
-        for i in range(len(customers))
-    }
+    if rerouter is None:
+        rerouter = rerouting_new
+    if alternates is None:
+        alternates = AlternatesIndex.from_customers(customers)
     time_windows = time_windows
 
     def h(route, i, time):
+        rerouted = False
         next_distance = f(route[i], route[i + 1], time)
         next_time = g(route[i], route[i + 1], time)
         if time + next_time < time_windows[route[i + 1]][0]:
@@ -438,7 +934,7 @@ def new_tw_policy(distance_matrix, time_matrix, time_windows, customers, rg):
             time_windows[route[i + 1], :] = customers[route[i + 1]].call_ahead_tw(
                 time, options=[[0, 1], [time + next_time, 28800]]
             )
-            route = rerouting_new(
+            new_route = rerouter(
                 i,
                 route,
                 distance_matrix,
@@ -447,9 +943,16 @@ def new_tw_policy(distance_matrix, time_matrix, time_windows, customers, rg):
                 time,
                 alternates,
             )
-            next_distance = 0  # f(route[0], route[1], time)
-            next_time = 5  # g(route[0], route[1], time)
-            futile = 0  # not customers[route[1]].visit(time + next_time)
+            rerouted = new_route != route
+            if rerouted:
+                route = new_route
+                next_distance = 0  # f(route[0], route[1], time)
+                next_time = 5  # g(route[0], route[1], time)
+                futile = 0  # not customers[route[1]].visit(time + next_time)
+            else:
+                # Nothing changed, so carry on to the next stop, which is futile if it's still too late for its window
+                late = time + next_time > time_windows[route[i + 1]][1]
+                futile = late or not customers[route[i + 1]].visit(time + next_time)
         else:
 
             futile = not customers[route[i + 1]].visit(time + next_time)
@@ -458,7 +961,7 @@ def new_tw_policy(distance_matrix, time_matrix, time_windows, customers, rg):
                 time_windows[route[i + 1], :] = customers[route[i + 1]].call_ahead_tw(
                     time + next_time, options=[[0, 1], [time + next_time, 28800]]
                 )
-                route = rerouting_new(
+                new_route = rerouter(
                     i + 1,
                     route,
                     distance_matrix,
@@ -467,9 +970,11 @@ def new_tw_policy(distance_matrix, time_matrix, time_windows, customers, rg):
                     time,
                     alternates,
                 )
+                rerouted = new_route != route
+                route = new_route
                 next_time += 5
 
-        return next_distance, next_time, futile, route
+        return StepResult(next_distance, next_time, futile, rerouted, route)
 
     return h
 
@@ -486,7 +991,12 @@ def default_distance_function(distance_matrix):
 
 
 def default_time_function(time_matrix):
-    """See above. Could probably merge these actually."""
+    """See above. Could probably merge these actually.
+
+    Time dependent travel times (`travel_time.TravelTimes`) are already callable like this, so are used as is.
+    """
+    if callable(time_matrix):
+        return time_matrix
 
     def f(i, j, time):
         return time_matrix[i, j]
@@ -621,6 +1131,7 @@ def rerouting_new(
     fss=routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC,
     lsm=routing_enums_pb2.LocalSearchMetaheuristic.TABU_SEARCH,
     return_obj=False,
+    solution_limit=100,
 ):
     """This function finds the optimal routes from the current location to the end of the route.
 
@@ -642,7 +1153,10 @@ def rerouting_new(
     alternates : dict
         Maps each location index to all other location indices that can be used instead.
         So {1:[2,3]} says that location 1 can be replaced with locations 2 or 3.
-        Obviously only one ends up being in the final route.
+        Obviously only one ends up being in the final route. An `alternates.AlternatesIndex` works here too.
+    tlim, fss, lsm, solution_limit
+        Solver settings, see `solve_rerouting`. By default the solver stops after 100 solutions rather than at the time limit,
+        so runs are reproducible and usually much quicker.
 
     Returns
     -------
@@ -656,44 +1170,161 @@ def rerouting_new(
     # Seems like changing the time window input and recomputing is a more general approach as well, which allows for more reorderings, and
     # easier to support alternate locations.
 
-    for k, v in alternates.items():
+    for k in route[i + 1 : -1]:  # index route to ignore starts and ends
+        v = alternates.get(k, [])
         if (
-            k in route[i + 1 : -1]
-            and len(v) > 0  # index route to ignore starts and ends
+            len(v) > 0
         ):  # Need the length check; appending empty list does datatype conversion
             places_to_visit = np.append(places_to_visit, v)
     places_to_visit = places_to_visit.tolist()
+    position = {}
+    for j, k in enumerate(places_to_visit):
+        position.setdefault(k, j)
 
-    # slice the distances for the places to visit
-    dm = distance_matrix[places_to_visit]
-    dm = dm[:, places_to_visit]
     # slice the times for the places to visit
+    # The distances aren't sliced, as the solver only uses times
     tm = time_matrix[places_to_visit]
     tm = tm[:, places_to_visit]
-    # slice the time windows for the places to visit
-    # Also subtract current time
-    tw = np.clip(time_windows[places_to_visit] - current_time, 0, np.inf)
+
+    options = []
+    for j in range(1, len(route[i:]) - 1):  # Don't include start or end nodes
+        original_node = places_to_visit[j]
+        if original_node in alternates:  # Has alternate locations
+            new_alternate_list = [j]
+            for k in alternates[original_node]:
+                new_alternate_list.append(position[k])
+            options.append(new_alternate_list)
+        else:
+            options.append([j])
+
+    sub_route, obj = solve_rerouting(
+        tm,
+        time_windows[places_to_visit],
+        len(route[i:]),
+        options,
+        current_time,
+        tlim=tlim,
+        fss=fss,
+        lsm=lsm,
+        solution_limit=solution_limit,
+    )
+    if sub_route is None:
+        # Rerouting failed. Just return old route
+        res = route[i:]
+    else:
+        res = [
+            places_to_visit[i] for i in sub_route
+        ]  # I think this does the same as previously? Not too sure. Makes sense though
+    if return_obj:
+        return obj
+    else:
+        return res
+
+
+def wrap_rerouting(f, rerouter):
+    """Makes f into a rerouting function that can stand in for `rerouting_new`, around the rerouter it uses
+
+    Wrappers like `reroute_cache.memoized_rerouting` only deal in routes, so calls asking for the objective (return_obj)
+    go straight to rerouter instead. f is called like `rerouting_new` without return_obj, and its attributes (such as stats)
+    are kept on the result.
+    """
+
+    @functools.wraps(f)
+    def g(
+        i,
+        route,
+        distance_matrix,
+        time_matrix,
+        time_windows,
+        current_time,
+        alternates={},
+        return_obj=False,
+        **kwargs
+    ):
+        if return_obj:
+            return rerouter(
+                i,
+                route,
+                distance_matrix,
+                time_matrix,
+                time_windows,
+                current_time,
+                alternates,
+                return_obj=True,
+                **kwargs
+            )
+        return f(
+            i,
+            route,
+            distance_matrix,
+            time_matrix,
+            time_windows,
+            current_time,
+            alternates,
+            **kwargs
+        )
+
+    return g
+
+
+def solve_rerouting(
+    tm,
+    tw,
+    n_route,
+    options,
+    current_time,
+    tlim=5,
+    fss=routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC,
+    lsm=routing_enums_pb2.LocalSearchMetaheuristic.TABU_SEARCH,
+    solution_limit=100,
+):
+    """Solves a rerouting subproblem that has already been sliced out of the full matrices
+
+    This is the solver part of `rerouting_new`, split out so other ways of building the subproblem can share it.
+
+    Parameters
+    ----------
+    tm : array-like
+        mxm time matrix for the places to visit. The current location is 0, and the end of the route is n_route - 1.
+        Anything after n_route - 1 is an alternate location.
+    tw : array-like
+        mx2 time windows for the places to visit, in absolute time. They get shifted by the current time here.
+    n_route : int
+        The number of locations left in the route, including the current location and the end
+    options : list[list[int]]
+        For each location in the middle of the route, the indices of it and its alternates. Only one of each gets visited.
+    current_time : int
+        The current time of day
+    solution_limit : int
+        Stop after this many solutions. The default is enough for the small subproblems rerouting gives, and keeps the results
+        the same from run to run (and from machine to machine), as long as tlim isn't hit first. None to only use tlim.
+
+    Returns
+    -------
+    route : list
+        The new route as indices into the subproblem, or None if solving failed
+    objective : number
+        The solver objective
+    """
+    # Subtract current time from the time windows
+    tw = np.clip(tw - current_time, 0, np.inf)
 
     # The start location is route[i], which becomes 0 in the subset
     # The end location is route[-1]. Will be the size of the submatrix - 1 (cause 0 based indexing), as it's the last location that gets indexed.
     # This assumes the end location doesn't change, which makes sense.
     N = tw.shape[0]
-    r = ORToolsRouting(N, 1, starts=[0], ends=[len(route[i:]) - 1])
+    r = ORToolsRouting(N, 1, starts=[0], ends=[n_route - 1])
 
     dim, ind = r.add_time_windows(
         tm, tw, 28800, 28800 - current_time, False, "time"
     )  # Assumes the default option of daylength = 28800
     r.routing.SetArcCostEvaluatorOfAllVehicles(ind)
 
-    for j in range(1, len(route[i:]) - 1):  # Don't include start or end nodes
-        original_node = places_to_visit[j]
-        if original_node in alternates:  # Has alternate locations
-            new_alternate_list = [j]
-            for k in alternates[original_node]:
-                new_alternate_list.append(places_to_visit.index(k))
-            r.add_option(new_alternate_list, 10000)
+    for option in options:
+        if len(option) > 1:
+            r.add_option(option, 10000)
         else:
-            r.add_disjunction(j, 10000)
+            r.add_disjunction(option[0], 10000)
 
     # I've worked out these parameters are generally the fastest. Greedy descent is problematic in that it
     # can't escape local optima, but we should generally be close enough to optimal that it doesn't matter.
@@ -701,25 +1332,19 @@ def rerouting_new(
     r.search_parameters.local_search_metaheuristic = lsm
     r.search_parameters.use_cp_sat = True
     s = r.solve(
-        tlim=tlim, log=logger.getEffectiveLevel() <= 0
+        tlim=tlim, log=logger.getEffectiveLevel() <= 0, solution_limit=solution_limit
     )  # This solves the problem, logging if level is debug or less
     if s is None:
         logger.warning("Rerouting Failed")
-        # Rerouting failed. Just return old route
-        res = route[i:]
+        res = None
     else:
         logger.debug("Rerouting Successful")
-        res = [
-            places_to_visit[i] for i in s.routes[0]
-        ]  # I think this does the same as previously? Not too sure. Makes sense though
+        res = s.routes[0]
     obj = r.objective
     del r
     del s
     gc.collect()
-    if return_obj:
-        return obj
-    else:
-        return res
+    return res, obj
 
 
 import time
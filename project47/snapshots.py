@@ -0,0 +1,291 @@
+from project47.routing import *
+from project47.simulation import EventSimulator
+from project47.sim_record import REROUTE
+from project47.shared_arrays import SharedArray, worker_pool, worker_state, local_state
+from numpy.random import Generator, PCG64
+from copy import copy
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """The state of an `EventSimulator` part way through a day, that several continuations can be run from
+
+    To compare options at some point in the day (eg reroute now, or carry on and wait), run the simulator up to that
+    point, take a snapshot, and then run a branch for each option. Each branch only simulates the rest of the day.
+
+    Everything a branch could change is captured: the routes, positions, clocks and odometers of the vehicles,
+    the event queue, the time windows (which `calling_policy` and `new_tw_policy` edit), and the state of every random
+    generator the customers and policy use. Every branch starts from the same generator states, so the options are compared
+    on the same random outcomes (common random numbers).
+
+    Routes are never edited in place (a reroute replaces the whole list), so the snapshot and its branches share
+    the route lists and only copy the outer list. The distance and time matrices aren't part of the snapshot at all;
+    they are passed to each branch, which only reads them.
+
+    The update function is a closure, so its internal state can't be copied. Each branch builds a new one from a policy,
+    so anything the policy keeps to itself (caches, stats) starts from scratch.
+
+    Attributes
+    ----------
+    time : number
+        The time of the next event to process, or when the last vehicle finished if there are none
+    routes, position, clock, odometer, futile, delivered, queue
+        The `EventSimulator` state, see there
+    record : SimRecord
+        Every step up to the snapshot
+    time_windows : np.array
+        nx2 time windows at the time of the snapshot
+    customers : list
+        The customer objects. Their generators are replaced in each branch, so the snapshot doesn't depend on them.
+    generators : list
+        The bit generator state of each distinct generator used
+    customer_generators : np.array
+        nx2 index into generators of each customer's rg and call_rg
+    rg_index : int
+        Index into generators of the generator passed to the policy
+    """
+
+    def __init__(
+        self,
+        routes,
+        position,
+        clock,
+        odometer,
+        futile,
+        delivered,
+        queue,
+        record,
+        time_windows,
+        customers,
+        generators,
+        customer_generators,
+        rg_index,
+    ):
+        self.routes = routes
+        self.position = position
+        self.clock = clock
+        self.odometer = odometer
+        self.futile = futile
+        self.delivered = delivered
+        self.queue = queue
+        self.record = record
+        self.time_windows = time_windows
+        self.customers = customers
+        self.generators = generators
+        self.customer_generators = customer_generators
+        self.rg_index = rg_index
+        if queue:
+            self.time = queue[0][0]
+        else:
+            self.time = clock.max() if len(clock) > 0 else 0
+
+    @classmethod
+    def take(cls, simulator: EventSimulator, time_windows, customers, rg):
+        """Snapshots the simulator as it is now
+
+        Parameters
+        ----------
+        simulator : EventSimulator
+            Run up to the point of interest, eg with `run(until=...)` or `step`
+        time_windows : np.array
+            The time windows the update function is using
+        customers : list
+            The customers the update function is using
+        rg : np.random.Generator
+            The generator passed to the policy
+
+        Raises
+        ------
+        ValueError
+            If any vehicles are waiting on an asynchronous reroute, as the solver can't be copied
+        """
+        if any(simulator.pending.values()):
+            raise ValueError("Can't snapshot while asynchronous reroutes are pending")
+
+        # Customers usually share a generator, so only save each one once
+        index = {}
+        generators = []
+
+        def generator_index(g):
+            if id(g) not in index:
+                index[id(g)] = len(generators)
+                generators.append(g.bit_generator.state)
+            return index[id(g)]
+
+        customer_generators = np.array(
+            [(generator_index(c.rg), generator_index(c.call_rg)) for c in customers],
+            dtype=int,
+        ).reshape((-1, 2))
+        return cls(
+            list(simulator.routes),
+            simulator.position.copy(),
+            simulator.clock.copy(),
+            simulator.odometer.copy(),
+            simulator.futile.copy(),
+            list(simulator.delivered),
+            list(simulator.queue),
+            simulator.record.copy(),
+            np.array(time_windows, copy=True),
+            customers,
+            generators,
+            customer_generators,
+            generator_index(rg),
+        )
+
+    def restore(self, update_function, routes={}, tracer=None):
+        """An `EventSimulator` that carries on from the snapshot with the given update function
+
+        Parameters
+        ----------
+        update_function
+            Calculates the behaviour at each step, as for `sim`
+        routes : dict (Optional)
+            New routes for some vehicles, replacing the rest of their current route. Each must start where the vehicle
+            currently is, route[position].
+        tracer : Tracer (Optional)
+            See `EventSimulator`
+        """
+        simulator = EventSimulator(RoutingSolution([]), update_function, tracer=tracer)
+        simulator.routes = list(self.routes)
+        simulator.position = self.position.copy()
+        simulator.clock = self.clock.copy()
+        simulator.odometer = self.odometer.copy()
+        simulator.futile = self.futile.copy()
+        simulator.delivered = list(self.delivered)
+        simulator.queue = list(self.queue)
+        # Room for the rest of the routes, as in SimRecord.for_routes
+        spare = sum(
+            len(route) - j for route, j in zip(self.routes, self.position.tolist())
+        )
+        simulator.record = self.record.copy(spare)
+
+        waiting = {event[1] for event in self.queue}
+        for i, route in routes.items():
+            simulator.routes[i] = route
+            simulator.position[i] = 0
+            simulator.record.append(
+                i, 0, route[0], simulator.clock[i], simulator.odometer[i], REROUTE
+            )
+            if i not in waiting and len(route) > 1:
+                # The vehicle had finished, so it needs starting again
+                simulator.schedule(simulator.clock[i], i)
+        return simulator
+
+    def branch(
+        self,
+        policy,
+        distance_matrix,
+        time_matrix,
+        policy_args={},
+        routes={},
+        tracer=None,
+    ):
+        """Starts a continuation of the day from the snapshot
+
+        The branch gets its own copy of the time windows, customers with new generators set back to their state at the
+        snapshot, and a new update function from the policy. So running it doesn't change the snapshot or any other branch.
+
+        Parameters
+        ----------
+        policy : function
+            Called as policy(distance_matrix, time_matrix, time_windows, customers, rg, **policy_args)
+        distance_matrix : np.array
+        time_matrix : np.array
+        policy_args : dict (Optional)
+            Extra keyword arguments for the policy
+        routes : dict (Optional)
+            New routes for some vehicles, see `restore`
+        tracer : Tracer (Optional)
+
+        Returns
+        -------
+        EventSimulator
+            Ready to `run` from the snapshot
+        """
+        generators = []
+        for state in self.generators:
+            g = Generator(PCG64())
+            g.bit_generator.state = state
+            generators.append(g)
+        customers = branch_customers(
+            self.customers, generators, self.customer_generators
+        )
+        update_function = policy(
+            distance_matrix,
+            time_matrix,
+            np.array(self.time_windows, copy=True),
+            customers,
+            generators[self.rg_index],
+            **policy_args,
+        )
+        return self.restore(update_function, routes, tracer)
+
+
+def branch_customers(customers, generators, customer_generators):
+    """Shallow copies of the customers, using the given generators
+
+    Alternates sets are shared by every customer in the group, so the copies share new sets of the copies.
+    """
+    copies = [copy(c) for c in customers]
+    copy_of = {id(c): k for k, c in enumerate(customers)}
+    groups = {}
+    for c, (rg, call_rg) in zip(copies, customer_generators.tolist()):
+        c.rg = generators[rg]
+        c.call_rg = generators[call_rg]
+        if id(c.alternates) not in groups:
+            groups[id(c.alternates)] = set(
+                copies[copy_of[id(a)]] if id(a) in copy_of else a for a in c.alternates
+            )
+        c.alternates = groups[id(c.alternates)]
+    if isinstance(customers, np.ndarray):
+        result = np.empty(len(copies), dtype=object)
+        result[:] = copies
+        return result
+    return copies
+
+
+def _run_branch(state, kwargs):
+    return (
+        state["snapshot"]
+        .branch(distance_matrix=state["dm"], time_matrix=state["tm"], **kwargs)
+        .run()
+    )
+
+
+def _worker_run_branch(kwargs):
+    return _run_branch(worker_state, kwargs)
+
+
+def run_branches(snapshot, branches, distance_matrix, time_matrix, workers=None):
+    """Runs several continuations from a snapshot, each in a separate worker process
+
+    The snapshot is sent to each worker once, and the matrices are put in shared memory, as in
+    `parallel_simulation.parallel_sim`. As with that, the policies and their arguments need to be picklable.
+
+    Parameters
+    ----------
+    snapshot : Snapshot
+    branches : list[dict]
+        Keyword arguments for `Snapshot.branch` for each continuation (policy, and optionally policy_args and routes)
+    distance_matrix : np.array
+    time_matrix : np.array
+    workers : int (Optional)
+        The number of worker processes. Defaults to the number of cpus. With 1 everything is run in this process.
+
+    Returns
+    -------
+    list
+        The results of each branch for the whole day (including before the snapshot), in the same format as `sim`
+    """
+    logger.debug("Running %i branches from time %s", len(branches), snapshot.time)
+    state = dict(snapshot=snapshot)
+    if workers == 1:
+        state = local_state(distance_matrix, time_matrix, state)
+        return [_run_branch(state, kwargs) for kwargs in branches]
+    with SharedArray(distance_matrix) as dm, SharedArray(time_matrix) as tm:
+        with worker_pool(workers, dm, tm, state) as executor:
+            return list(executor.map(_worker_run_branch, branches))
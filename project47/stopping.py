@@ -0,0 +1,138 @@
+from scipy.stats import t
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def futile_metric(result, solution):
+    """Total futile deliveries across all vehicles"""
+    return float(np.sum(result[2]))
+
+
+def distance_metric(result, solution):
+    """Total distance travelled across all vehicles"""
+    return float(sum(d[-1] for d in result[0] if len(d)))
+
+
+def undelivered_metric(result, solution):
+    """Packages that were on a route but weren't delivered"""
+    attempted = sum(len(route) - 2 for route in solution.routes if len(route) > 2)
+    return float(attempted - len(result[3]))
+
+
+METRICS = {
+    "futile": futile_metric,
+    "distance": distance_metric,
+    "undelivered": undelivered_metric,
+}
+
+
+def half_width(values, confidence=0.95):
+    """Half width of the t confidence interval on the mean. Infinite with fewer than two values."""
+    n = len(values)
+    if n < 2:
+        return np.inf
+    return t.ppf((1 + confidence) / 2, n - 1) * np.std(values, ddof=1) / np.sqrt(n)
+
+
+class SequentialStopping:
+    """Runs replications until the confidence intervals are tight enough
+
+    A fixed number of replications wastes time on days where every replication comes out about the same,
+    and isn't enough on days with a lot of variation. Instead this runs replications in batches, and stops
+    once the confidence interval on the mean of every metric is within its target half width, or the cap is reached.
+
+    Attributes
+    ----------
+    targets : dict
+        Maps a metric name (a key of METRICS, or of metrics) to the largest acceptable half width
+    batch : int
+        The number of replications to run at a time
+    max_replications : int
+        Stop here even if the targets aren't met
+    min_replications : int
+        Don't stop before this, as the variance estimate isn't much use with only a few replications
+    confidence : float
+    metrics : dict
+        Maps metric names to functions taking a simulation result and the routing solution, returning a number
+    history : list
+        The number of replications used each time `run` was called
+    """
+
+    def __init__(
+        self,
+        targets={"futile": 1},
+        batch=10,
+        max_replications=1000,
+        min_replications=None,
+        confidence=0.95,
+        metrics=METRICS,
+    ):
+        if batch < 1 or max_replications < 1:
+            raise ValueError("Need at least one replication in a batch, and in total")
+        self.targets = targets
+        self.batch = batch
+        self.max_replications = max_replications
+        self.min_replications = batch if min_replications is None else min_replications
+        self.confidence = confidence
+        self.metrics = metrics
+        self.history = []
+
+    def done(self, values):
+        """Whether the results so far are precise enough
+
+        Parameters
+        ----------
+        values : dict
+            Maps each metric name to the list of values so far
+        """
+        n = len(next(iter(values.values())))
+        if n >= self.max_replications:
+            return True
+        if n < self.min_replications:
+            return False
+        return all(
+            half_width(values[name], self.confidence) <= target
+            for name, target in self.targets.items()
+        )
+
+    def run(self, run_batch, solution):
+        """Runs replications until `done`
+
+        Parameters
+        ----------
+        run_batch : function
+            Takes the index of the first replication and the number to run, returns a list of simulation results.
+            This is where the batch can be run in parallel, see `batch_simulation.batch_sim`.
+        solution : RoutingSolution
+            The routes being simulated, passed on to the metrics
+
+        Returns
+        -------
+        list
+            All the simulation results
+
+        Raises
+        ------
+        ValueError
+            If run_batch returns no results, as otherwise this would never finish
+        """
+        results = []
+        values = {name: [] for name in self.targets}
+        while not results or not self.done(values):
+            n = min(self.batch, self.max_replications - len(results))
+            batch = list(run_batch(len(results), n))
+            if len(batch) == 0:
+                raise ValueError(
+                    "Batch of %i replications from %i gave no results"
+                    % (n, len(results))
+                )
+            for result in batch:
+                results.append(result)
+                for name in self.targets:
+                    values[name].append(self.metrics[name](result, solution))
+        self.history.append(len(results))
+        logger.debug("Stopped after %i replications", len(results))
+        return results
@@ -0,0 +1,93 @@
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def schedule(route, time_matrix, time_windows, current_time):
+    """Arrival times along a route, waiting for time windows to open if early
+
+    Waiting at one stop delays all later stops by the same amount, so the arrival time at stop k is
+    the travel time to k plus the largest wait needed at or before k. This lets us do it without a python loop.
+
+    Parameters
+    ----------
+    route : array-like
+        Locations to visit, starting at the current location
+    time_matrix : np.array
+        nxn matrix of times
+    time_windows : np.array
+        nx2 matrix of time windows
+    current_time : number
+        The time at route[0]
+
+    Returns
+    -------
+    np.array
+        Arrival time at each location in the route
+    """
+    route = np.asarray(route, dtype=int)
+    travel = np.concatenate(([0], np.cumsum(time_matrix[route[:-1], route[1:]])))
+    travel = travel + current_time
+    early = np.asarray(time_windows)[route, 0] - travel
+    early[0] = 0
+    return travel + np.maximum.accumulate(np.maximum(early, 0))
+
+
+class ForwardSlack:
+    """How late a vehicle can run before stops further along its route can't be made
+
+    Works out the planned arrival at each stop once, along with how much slack each stop has before its time window closes.
+    If the vehicle then turns up late by d at a stop, the delay shrinks by any waiting it would have done later on,
+    so a later stop k becomes infeasible when d is more than its slack plus the waits in between. The smallest of these
+    over the rest of the route (the forward slack) says whether anything at all has become infeasible, which is a single comparison.
+
+    Building this is linear in the length of the route, and only needs doing again when the route or time windows change.
+
+    Attributes
+    ----------
+    route : list
+    arrival : np.array
+        Planned arrival (service start) time at each position in the route. Positions before start are not used.
+    slack : np.array
+        Time window end minus planned arrival, plus the waiting up to that position
+    forward : np.array
+        forward[k] is the smallest slack at or after position k
+    waits : np.array
+        Cumulative waiting time up to each position
+    """
+
+    def __init__(self, route, time_matrix, time_windows, start, current_time):
+        self.route = route
+        n = len(route)
+        self.arrival = np.zeros(n)
+        self.arrival[start:] = schedule(
+            route[start:], time_matrix, time_windows, current_time
+        )
+        nodes = np.asarray(route, dtype=int)
+        travel = np.zeros(n)
+        travel[start + 1 :] = time_matrix[nodes[start:-1], nodes[start + 1 :]]
+        wait = np.zeros(n)
+        wait[start + 1 :] = (
+            self.arrival[start + 1 :] - self.arrival[start:-1] - travel[start + 1 :]
+        )
+        self.waits = np.cumsum(wait)
+        self.slack = np.asarray(time_windows)[nodes, 1] - self.arrival + self.waits
+        self.slack[:start] = np.inf
+        self.forward = np.minimum.accumulate(self.slack[::-1])[::-1]
+
+    def infeasible(self, i, current_time):
+        """Positions after i that can't be reached in time, if the vehicle is at route[i] at current_time
+
+        Returns
+        -------
+        np.array
+            Positions in the route, in order. Empty if everything is still feasible.
+        """
+        if i + 1 >= len(self.route):
+            return np.array([], dtype=int)
+        delay = current_time - self.arrival[i] + self.waits[i]
+        if delay <= self.forward[i + 1]:
+            return np.array([], dtype=int)
+        return np.flatnonzero(self.slack[i + 1 :] < delay) + i + 1
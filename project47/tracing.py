@@ -0,0 +1,77 @@
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Same columns as a SimRecord row, plus a sequence number so the order survives wrapping around
+TRACE_DTYPE = np.dtype(
+    [
+        ("seq", np.int64),
+        ("vehicle", np.int32),
+        ("stop", np.int32),
+        ("node", np.int64),
+        ("time", np.float64),
+        ("distance", np.float64),
+        ("event", np.int8),
+    ]
+)
+
+
+class Tracer:
+    """Ring buffer of simulation events, for debugging
+
+    Formatting a log message on every step is slow, even when nothing reads the log. Instead, pass one of these to `sim`
+    (or `EventSimulator`), which writes each step as a row into a preallocated structured array. When no tracer is passed,
+    the only cost is checking for None.
+
+    Once the buffer is full the oldest rows are overwritten, so a long run keeps the most recent `capacity` events.
+    Events use the outcome codes from sim_record.py.
+
+    Attributes
+    ----------
+    buffer : np.array
+        The raw storage, with TRACE_DTYPE
+    count : int
+        The total number of events recorded, including any that have been overwritten
+    """
+
+    def __init__(self, capacity=65536):
+        self.buffer = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.count = 0
+
+    def append(self, vehicle, stop, node, time, distance, event):
+        row = self.buffer[self.count % len(self.buffer)]
+        row["seq"] = self.count
+        row["vehicle"] = vehicle
+        row["stop"] = stop
+        row["node"] = node
+        row["time"] = time
+        row["distance"] = distance
+        row["event"] = event
+        self.count += 1
+
+    @property
+    def dropped(self):
+        """The number of events that have been overwritten"""
+        return max(0, self.count - len(self.buffer))
+
+    @property
+    def rows(self):
+        """The events still in the buffer, oldest first"""
+        if self.count <= len(self.buffer):
+            return self.buffer[: self.count]
+        k = self.count % len(self.buffer)
+        return np.concatenate((self.buffer[k:], self.buffer[:k]))
+
+    def dump(self, path):
+        """Saves the events to a .npy file, see `load_trace`"""
+        np.save(path, self.rows)
+        logger.debug(
+            "Dumped %i trace events to %s", min(self.count, len(self.buffer)), path
+        )
+
+
+def load_trace(path):
+    """Reads events saved with `Tracer.dump`, as a structured array"""
+    return np.load(path)
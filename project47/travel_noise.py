@@ -0,0 +1,95 @@
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LognormalNoise:
+    """Random travel times, as mean one lognormal multipliers on the time matrix
+
+    Every arc gets its own multiplier, drawn once per replication, so travelling the same arc twice in a day takes
+    the same time. The spread can be the same everywhere, or depend on a road class for each arc (eg motorways
+    vary less than city streets).
+
+    All the multipliers a replication needs are drawn in one vectorized call, as float32, rather than drawing a
+    random number at each step of the simulation. `batch_simulation.batch_sim` takes one of these directly;
+    for `sim`, use `times` to get a time matrix to pass to the policy. Both give each arc a single multiplier per replication,
+    but sim draws the whole matrix, and batch_sim only the arcs in the routes, so the same rg gives different values.
+
+    Attributes
+    ----------
+    sigma : float or np.array
+        The standard deviation of the log of the multiplier. An array gives the value for each road class.
+    classes : np.array
+        nxn integer road class of each arc, indexing into sigma. None if sigma is a single value.
+    """
+
+    def __init__(self, sigma=0.2, classes=None):
+        self.sigma = np.asarray(sigma, dtype=np.float32)
+        self.classes = classes
+
+    def sample_arcs(self, i, j, rg, size=()):
+        """Draws multipliers for the arcs i -> j
+
+        Parameters
+        ----------
+        i, j : np.array
+            The ends of each arc
+        rg : np.random.Generator
+        size : tuple
+            Extra leading dimensions, eg (replications,)
+
+        Returns
+        -------
+        np.array
+            float32 multipliers, with shape size + i.shape
+        """
+        i = np.asarray(i, dtype=int)
+        j = np.asarray(j, dtype=int)
+        sigma = self.sigma if self.classes is None else self.sigma[self.classes[i, j]]
+        z = rg.standard_normal(tuple(size) + i.shape, dtype=np.float32)
+        # Subtracting sigma^2 / 2 makes the mean 1, so the expected travel time is the time matrix
+        return np.exp(sigma * z - sigma * sigma / 2)
+
+    def sample_matrix(self, n, rg):
+        """Draws a multiplier for every arc between n locations"""
+        i, j = np.indices((n, n))
+        return self.sample_arcs(i, j, rg)
+
+    def times(self, time_matrix, rg):
+        """A time matrix with a fresh sample of noise, for a single replication of `sim`"""
+        return NoisyTimes(time_matrix, self.sample_matrix(len(time_matrix), rg))
+
+
+class NoisyTimes:
+    """Travel times with sampled noise, for passing to the policies in place of a time matrix
+
+    The policies move vehicles using `default_time_function`, which uses the noisy times as this is callable.
+    Indexing it gives the plain time matrix, so anything planning ahead (time window checks, rerouting) uses
+    the expected times, as a real driver would.
+
+    Attributes
+    ----------
+    time_matrix : np.array
+        nxn expected travel times
+    multipliers : np.array
+        nxn float32 multipliers
+    """
+
+    def __init__(self, time_matrix, multipliers):
+        self.time_matrix = np.asarray(time_matrix)
+        self.multipliers = multipliers
+
+    @property
+    def shape(self):
+        return self.time_matrix.shape
+
+    def __call__(self, i, j, time):
+        return self.time_matrix[i, j] * self.multipliers[i, j]
+
+    def __getitem__(self, key):
+        return self.time_matrix[key]
+
+    def __len__(self):
+        return len(self.time_matrix)
@@ -0,0 +1,101 @@
+import numpy as np
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TravelTimes:
+    """Time of day dependent travel times
+
+    The day is split into slices of equal width, with a full time matrix for each slice, stored as a single
+    (slices x n x n) tensor. Looking up a travel time is then just working out the slice and indexing,
+    so it's constant time no matter how many slices there are.
+
+    Objects of this class are callable with the same signature as the functions from `simulation.default_time_function`,
+    and `default_time_function` returns them as they are. So they can be passed to any of the policies in place of the time matrix.
+    Indexing it directly (tt[i, j], or with np.ix_) gives the static matrix, so code that doesn't know about the time of day still works.
+
+    Attributes
+    ----------
+    tensor : np.array
+        (slices x n x n) travel times. Can be a np.memmap for large n.
+    slice_width : number
+        The length of time each slice covers. Times past the last slice use the last slice.
+    static : np.array
+        The nxn matrix used when no time is given. Defaults to the first slice.
+    """
+
+    def __init__(self, tensor, slice_width, static=None):
+        self.tensor = tensor
+        self.slice_width = slice_width
+        self.static = tensor[0] if static is None else static
+
+    @classmethod
+    def from_matrix(
+        cls, time_matrix, factors, slice_width, path=None, dtype=np.float32
+    ):
+        """Builds the tensor by scaling a single time matrix by a factor for each slice
+
+        Parameters
+        ----------
+        time_matrix : np.array
+            nxn matrix of free flow times
+        factors : array-like
+            The multiplier for each slice, eg 1.5 for the peak hours
+        slice_width : number
+        path : str (Optional)
+            If given, the tensor is written to this .npy file and memory-mapped, rather than kept in memory
+        dtype : np.dtype
+            float32 by default, to halve the size. Travel times don't need more precision than that.
+        """
+        factors = np.asarray(factors, dtype=dtype)
+        time_matrix = np.asarray(time_matrix)
+        shape = (len(factors),) + time_matrix.shape
+        if path is None:
+            tensor = np.empty(shape, dtype=dtype)
+        else:
+            tensor = np.lib.format.open_memmap(
+                path, mode="w+", dtype=dtype, shape=shape
+            )
+        # One slice at a time, so the full tensor never needs to be in memory
+        for s, factor in enumerate(factors):
+            tensor[s] = time_matrix * factor
+        if path is not None:
+            tensor.flush()
+        return cls(tensor, slice_width, np.asarray(time_matrix, dtype=dtype))
+
+    @classmethod
+    def load(cls, path, slice_width, mmap=True):
+        """Loads a tensor saved with `save` or `from_matrix`. With mmap, slices are only read from disk as needed."""
+        return cls(np.load(path, mmap_mode="r" if mmap else None), slice_width)
+
+    def save(self, path):
+        np.save(path, self.tensor)
+
+    @property
+    def shape(self):
+        return self.static.shape
+
+    def slice_index(self, time):
+        """The slice each time falls in. Works on single times or arrays of them."""
+        s = np.floor_divide(time, self.slice_width).astype(int)
+        return np.clip(s, 0, len(self.tensor) - 1)
+
+    def matrix(self, time):
+        """The nxn time matrix for the slice at the given time"""
+        return self.tensor[self.slice_index(time)]
+
+    def __call__(self, i, j, time):
+        s = int(time // self.slice_width)
+        if s >= len(self.tensor):
+            s = len(self.tensor) - 1
+        elif s < 0:
+            s = 0
+        return self.tensor[s, i, j]
+
+    def __getitem__(self, key):
+        return self.static[key]
+
+    def __len__(self):
+        return len(self.static)
@@ -0,0 +1,81 @@
+from project47.routing import RoutingSolution
+from project47.customer import Customer
+from project47.local_repair import late_stops
+from numpy.random import Generator, PCG64
+import numpy as np
+import pytest
+
+# Travel times for the small problem. Distances are twice these.
+TIMES = np.array(
+    [
+        [0, 10, 20, 30, 10],
+        [10, 0, 20, 30, 10],
+        [20, 20, 0, 30, 40],
+        [30, 30, 30, 0, 40],
+        [10, 10, 40, 40, 0],
+    ]
+)
+
+
+@pytest.fixture
+def small_problem():
+    """Makes a depot and four customers, on two routes by default
+
+    This is a function, so tests can make fresh copies (with the same random stream) to run things more than once.
+    It returns s, distances, times, windows, customers, rg.
+    """
+
+    def make(responsiveness=1, call_responsiveness=1, windows=None, routes=None):
+        rg = Generator(PCG64(123))
+        if windows is None:
+            windows = [[0, 10000], [0, 100], [50, 100], [0, 20], [0, 100]]
+        if routes is None:
+            routes = [[0, 1, 2, 0], [0, 3, 4, 0]]
+        customers = np.array(
+            [Customer(0, 0, 1, 1, rg=rg)]
+            + [
+                Customer(0, 0, responsiveness, call_responsiveness, rg=rg)
+                for _ in range(1, 5)
+            ]
+        )
+        return (
+            RoutingSolution(routes),
+            TIMES * 2,
+            TIMES.copy(),
+            np.array(windows, dtype=float),
+            customers,
+            rg,
+        )
+
+    return make
+
+
+@pytest.fixture
+def keep_route():
+    """Stands in for a reroute that fails, giving back the rest of the route as it was"""
+
+    def f(i, route, dm, tm, tw, current_time, alternates={}, **kwargs):
+        return list(route[i:])
+
+    return f
+
+
+@pytest.fixture
+def counting_rerouter():
+    """Makes stand ins for rerouting_new, that drop any stops they'd be late for
+
+    Each one comes with a list of the (i, current_time) it was called with.
+    """
+
+    def make():
+        calls = []
+
+        def f(i, route, dm, tm, tw, current_time, alternates={}, **kwargs):
+            calls.append((i, current_time))
+            remaining = list(route[i:])
+            late = late_stops(remaining, tm, tw, current_time)
+            return [loc for k, loc in enumerate(remaining) if k not in late]
+
+        return f, calls
+
+    return make
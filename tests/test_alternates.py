@@ -0,0 +1,68 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.alternates import *
+from project47.customer import Customer
+
+SOLVER = {
+    "fss": routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC,
+    "lsm": routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT,
+}
+
+
+def setup_customers():
+    customers = np.array([Customer() for _ in range(6)])
+    customers[1].add_alternate(customers[4])
+    customers[4].add_alternate(customers[5])
+    customers[2].add_alternate(Customer())  # Not in the list
+    return customers
+
+
+def test_index():
+    customers = setup_customers()
+    index = AlternatesIndex.from_customers(customers)
+    assert index.groups() == [[0], [1, 4, 5], [2], [3]]
+    assert index[4] == [1, 5]
+    assert index[3] == []
+    assert index.get(10, []) == []
+    assert index.group(5).tolist() == [1, 4, 5]
+
+    # Same as the dict the policies used to build
+    expected = {
+        i: [
+            customers.tolist().index(a)
+            for a in c.alternates
+            if a != c and a in customers
+        ]
+        for i, c in enumerate(customers)
+    }
+    assert {k: sorted(v) for k, v in expected.items()} == dict(index)
+
+
+def test_groups_from_end():
+    customers = np.array([Customer() for _ in range(5)])
+    customers[0].add_alternate(customers[3])
+    customers[1].add_alternate(customers[4])
+    index = AlternatesIndex.from_customers(customers)
+    assert index.groups() == [[0, 3], [1, 4], [2]]
+
+    # The order multiday used to work them out in
+    groups = []
+    temp = customers.tolist()
+    while len(temp) > 0:
+        c = temp.pop()
+        groups.append(sorted(customers.tolist().index(a) for a in c.alternates))
+        temp = [a for a in temp if a not in c.alternates]
+    assert index.groups(from_end=True) == groups == [[1, 4], [0, 3], [2]]
+
+
+def test_rerouting_with_index():
+    customers = setup_customers()
+    times = np.ones((6, 6), dtype=int) * 10
+    windows = np.array([[0.0, 10000.0]] * 6)
+    windows[1] = [0, 5]  # Too late for 1, but 4 and 5 are alternates
+
+    index = AlternatesIndex.from_customers(customers)
+    route = rerouting_new(0, [0, 1, 2, 0], times, times, windows, 0, index, **SOLVER)
+    assert route[0] == 0 and route[-1] == 0
+    assert 2 in route
+    assert len(set(route[1:-1]) & {4, 5}) == 1
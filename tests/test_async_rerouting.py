@@ -0,0 +1,109 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.async_rerouting import *
+from project47.customer import Customer
+import threading
+
+
+def reversing_rerouter(
+    i, route, distance_matrix, time_matrix, time_windows, current_time, alternates={}
+):
+    """Drops location 2 and reverses the rest"""
+    middle = [loc for loc in route[i + 1 : -1] if loc != 2]
+    return [route[i]] + middle[::-1] + [route[-1]]
+
+
+def gated(gate):
+    """reversing_rerouter, that doesn't finish until gate.wait() returns"""
+
+    def f(*args, **kwargs):
+        gate.wait()
+        return reversing_rerouter(*args, **kwargs)
+
+    return f
+
+
+TIMES = np.ones((5, 5)) * 10
+# Location 2 is too late by the time either vehicle gets to 1
+WINDOWS = np.array([[0.0, 1000.0]] * 5)
+WINDOWS[2] = [0, 5]
+CUSTOMERS = np.array([Customer() for _ in range(5)])
+SOLUTION = RoutingSolution([[0, 1, 2, 3, 4, 0], [0, 1, 2, 3, 4, 0]])
+
+
+def test_async_keeps_moving():
+    s, times, windows, customers = SOLUTION, TIMES, WINDOWS.copy(), CUSTOMERS
+    # Both vehicles reroute at the same time, so the solves overlap. Otherwise neither gets past the barrier.
+    gate = threading.Barrier(2, timeout=30)
+    rerouter = AsyncRerouter(gated(gate), latency=5)
+    policy = estimate_ahead_policy(times, times, windows, customers, rerouter=rerouter)
+    e = EventSimulator(s, policy, rerouter)
+
+    distances, times, futile, delivered = e.run()
+    assert not gate.broken
+    assert rerouter.requests == 2
+
+    # Interim route skips 2 and heads for 3. The new route arrives on the way, so is swapped in at 3, and 4 is next.
+    rows = e.record.rows[e.record.rows["vehicle"] == 0]
+    assert rows["node"].tolist() == [0, 1, 1, 3, 3, 4, 0]
+    assert rows["outcome"].tolist() == [
+        START,
+        DELIVERED,
+        REROUTE,
+        DELIVERED,
+        REROUTE,
+        DELIVERED,
+        DEPOT,
+    ]
+    assert sorted(delivered) == [1, 1, 3, 3, 4, 4]
+
+
+def test_async_hold():
+    s, times, windows, customers = SOLUTION, TIMES, WINDOWS.copy(), CUSTOMERS
+    rerouter = AsyncRerouter(reversing_rerouter, latency=100, hold=True)
+    policy = estimate_ahead_policy(times, times, windows, customers, rerouter=rerouter)
+    e = EventSimulator(s, policy, rerouter)
+    distances, times, futile, delivered = e.run()
+
+    rows = e.record.rows[e.record.rows["vehicle"] == 0]
+    assert rows["node"].tolist() == [0, 1, 1, 1, 4, 3, 0]
+    # Waited at 1 for the route
+    assert rows["arrival"][3] == 110
+    assert times[0][-1] == 140
+
+
+def test_async_interim_route():
+    s, times, windows, customers = SOLUTION, TIMES, WINDOWS.copy(), CUSTOMERS
+    gate = threading.Event()
+    rerouter = AsyncRerouter(gated(gate))
+    EventSimulator(s, None, rerouter)
+
+    # The interim route comes back while the solver is still going, with the late stop removed
+    route = rerouter(1, [0, 1, 2, 3, 4, 0], times, times, windows, 10)
+    (request,) = rerouter.drain()
+    assert route == [1, 3, 4, 0]
+    assert not request.future.done()
+
+    gate.set()
+    assert request.result() == [1, 4, 3, 0]
+    assert request.ready_time == 70
+    rerouter.shutdown()
+
+
+def test_async_without_event_simulator():
+    s, times, windows, customers = SOLUTION, TIMES, WINDOWS.copy(), CUSTOMERS
+    expected = sim(
+        s,
+        estimate_ahead_policy(
+            times, times, windows.copy(), customers, rerouter=reversing_rerouter
+        ),
+    )
+
+    # Nothing would swap the new routes in, so they're solved straight away
+    rerouter = AsyncRerouter(reversing_rerouter)
+    policy = estimate_ahead_policy(times, times, windows, customers, rerouter=rerouter)
+    distances, times, futile, delivered = sim(s, policy)
+    assert delivered == expected[3]
+    assert all(np.allclose(d, e) for d, e in zip(distances, expected[0]))
+    assert rerouter.requests == 0
+    assert rerouter.drain() == []
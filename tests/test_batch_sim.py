@@ -0,0 +1,56 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.batch_simulation import *
+
+
+def with_presence(customers):
+    """2 and 4 are out for the first 25, and everyone is out from 50 to 75"""
+    for i in range(1, 5):
+        customers[i].presence = np.array([i % 2, 1, 0, 1])
+        customers[i].presence_interval = 25
+    return customers
+
+
+ROUTES = [[0, 1, 2, 0], [0, 3, 4, 0], [0, 0]]
+
+
+def test_batch_matches_sim(small_problem):
+    for wait, policy in [(False, base_policy), (True, wait_policy)]:
+        s, dm, tm, tw, customers, rg = small_problem(routes=ROUTES)
+        with_presence(customers)
+        expected = sim(s, policy(dm, tm, tw, customers, rg))
+        results = batch_sim(s, dm, tm, tw, customers, rg, replications=3, wait=wait)
+
+        assert len(results) == 3
+        for distances, times, futile, delivered in results:
+            assert all(np.allclose(d, e) for d, e in zip(distances, expected[0]))
+            assert all(np.allclose(t, e) for t, e in zip(times, expected[1]))
+            assert np.allclose(futile, expected[2])
+            assert delivered == expected[3]
+
+
+def test_batch_statistics(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(0.5, routes=ROUTES)
+    with_presence(customers)
+    results = batch_sim(s, dm, tm, tw, customers, rg, replications=4000)
+    futile = np.array([r[2] for r in results])
+
+    s, dm, tm, tw, customers, rg = small_problem(0.5, routes=ROUTES)
+    with_presence(customers)
+    sim_futile = np.array(
+        [sim(s, base_policy(dm, tm, tw, customers, rg))[2] for _ in range(4000)]
+    )
+
+    assert np.allclose(futile.mean(axis=0), sim_futile.mean(axis=0), atol=0.1)
+
+
+def test_batch_dict_windows(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(routes=ROUTES)
+    with_presence(customers)
+    expected = batch_sim(s, dm, tm, tw, customers, rg, wait=True)
+    s, dm, tm, tw, customers, rg = small_problem(routes=ROUTES)
+    with_presence(customers)
+    windows = {i: list(window) for i, window in enumerate(tw)}
+    results = batch_sim(s, dm, tm, windows, customers, rg, wait=True)
+    assert all(np.allclose(t, e) for t, e in zip(results[0][1], expected[0][1]))
+    assert results[0][3] == expected[0][3]
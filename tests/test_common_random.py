@@ -0,0 +1,50 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.common_random import *
+from project47.customer import Customer
+
+
+def test_streams():
+    crn = CommonRandomNumbers(1)
+    a = crn.stream(0, 0, (1, 0, 3)).random(5)
+    assert np.allclose(a, crn.stream(0, 0, (1, 0, 3)).random(5))
+    assert not np.allclose(a, crn.stream(0, 1, (1, 0, 3)).random(5))
+    assert not np.allclose(a, crn.stream(1, 0, (1, 0, 3)).random(5))
+    assert not np.allclose(a, crn.stream(0, 0, (1, 0, 3), CALL).random(5))
+
+
+def test_same_outcomes_across_policies():
+    times = np.ones((6, 6)) * 10
+    windows = np.array([[0.0, 10000.0]] * 6)
+    customers = [
+        Customer(responsiveness=0.5, call_responsiveness=0.5) for _ in range(6)
+    ]
+    crn = CommonRandomNumbers(1)
+    delivered = []
+    for routes in [[[0, 1, 2, 3, 4, 5, 0]], [[0, 5, 3, 1, 0], [0, 2, 4, 0]]]:
+        crn.assign(customers, 0, 0)
+        delivered.append(
+            sorted(
+                sim(
+                    RoutingSolution(routes),
+                    base_policy(times, times, windows, customers),
+                )[3]
+            )
+        )
+    # Visit order and vehicles are different, but each customer is home or not in both
+    assert delivered[0] == delivered[1]
+    assert 0 < len(delivered[0]) < 5
+
+
+def test_calls_dont_change_visits():
+    customers = [
+        Customer(responsiveness=0.5, call_responsiveness=0.5) for _ in range(6)
+    ]
+    crn = CommonRandomNumbers(2)
+    crn.assign(customers, 0, 0)
+    visits = [c.visit(0) for c in customers]
+
+    crn.assign(customers, 0, 0)
+    for c in customers:
+        c.call_ahead(0)
+    assert [c.visit(0) for c in customers] == visits
@@ -0,0 +1,49 @@
+from project47.customer import Customer
+from numpy.random import Generator, PCG64
+import numpy as np
+
+
+def polling_visits(c, first, last, step=5):
+    """What poll replaces, visiting at every step"""
+    t = first
+    while True:
+        if c.visit(t):
+            return t, True
+        if t + step > last:
+            return t, False
+        t += step
+
+
+def test_next_present_slots():
+    c = Customer(presence=np.array([0, 1, 1, 0, 0, 1, 0]))
+    assert c.next_present_slots().tolist() == [1, 1, 2, 5, 5, 5, 7]
+    c.presence = np.array([1, 0])
+    assert c.next_present_slots().tolist() == [0, 2]
+
+
+def test_poll_present():
+    # Always answers when present, so poll should land on the first present time
+    c = Customer(presence=np.array([0, 0, 1, 0, 1]), presence_interval=100)
+    for first in [0, 3, 150, 201, 290]:
+        assert c.poll(first, 400, 5) == polling_visits(c, first, 400, 5)
+    assert c.poll(0, 150, 5) == (150, False)
+    assert c.poll(0, 600, 7) == (203, True)
+
+
+def test_poll_distribution():
+    presence = np.array([0, 1, 0, 1, 1, 0, 1, 0])
+    results = []
+    for f in [polling_visits, Customer.poll]:
+        c = Customer(
+            responsiveness=0.1,
+            presence=presence,
+            presence_interval=37,
+            rg=Generator(PCG64(1)),
+        )
+        results.append(np.array([f(c, 12, 250, 5) for _ in range(20000)]))
+    old, new = results
+    assert np.isclose(old[:, 1].mean(), new[:, 1].mean(), atol=0.02)
+    assert np.isclose(old[:, 0].mean(), new[:, 0].mean(), atol=2)
+    # Successes only happen while present
+    times = new[new[:, 1] == 1, 0].astype(int)
+    assert presence[times // 37].all()
@@ -0,0 +1,129 @@
+from project47.day_log import *
+from project47.multiday_simulation import collect_data
+import numpy as np
+
+
+def day_data(day):
+    solution = RoutingSolution([[0, 3, 1, 0], [0, 0]])
+    distances = [np.array([0, 2.5, 4, 7.9]), np.array([0])]
+    times = [np.array([0, 10, 20, 30.5]), np.array([0])]
+    futile = np.array([1, 0])
+    delivered = [3, 0]
+    arrival_days = np.array([0, 0, day, day])
+    time_windows = np.array([[0, 100], [10, 20], [30, 40], [50, 60]])
+    return (
+        day,
+        solution,
+        distances,
+        times,
+        futile,
+        delivered,
+        arrival_days,
+        time_windows,
+        [2, 0],
+        [1, 0],
+        0,
+    )
+
+
+def test_collect_data():
+    data = collect_data(*day_data(2))
+    assert data == {
+        "day": 2,
+        "number_of_packages": 3,
+        "number_of_vehicles": 2,
+        "distances": [7.9, 0],
+        "times": [30.5, 0],
+        "deliveries_attempted": [2, 0],
+        "futile_deliveries": [1, 0],
+        "delivered_packages": {"days_taken": [0], "time_window": [[50, 60]]},
+        "undelivered_packages": {
+            "days_taken": [2, 0],
+            "time_window": [[10, 20], [30, 40]],
+        },
+        "collection_point_packages": [2, 0],
+        "collection_point_removed_packages": [1, 0],
+        "collection_dist": 0,
+    }
+
+
+def test_day_log(tmp_path):
+    log = DayLog()
+    for day in range(3):
+        log.append(*day_data(day))
+    log.set_replications(1, 2)
+    assert len(log) == 3
+
+    tables = log.tables()
+    assert tables["packages"]["days_taken"].dtype == np.int32
+    assert tables["vehicles"]["record"].tolist() == [0, 0, 1, 1, 2, 2]
+    assert tables["records"]["replications"].tolist() == [0, 2, 2]
+
+    data = log.to_json()
+    assert data[1] == dict(collect_data(*day_data(1)), replications=2)
+    assert log.record(2) == data[2]
+    assert "replications" not in data[0]
+
+    # More days can be added after the chunks are joined
+    log.append(*day_data(3))
+    log.save(tmp_path / "log.npz")
+    loaded = DayLog.load(tmp_path / "log.npz")
+    assert len(loaded) == 4
+    assert loaded.to_json() == log.to_json()
+
+
+def test_day_log_number_types():
+    data = day_data(0)
+    # Integer distances and times stay integers, floats aren't cut down to them
+    log = DayLog()
+    log.append(*data[:2], [[0, 3, 7], [0]], [[0, 10, 30], [0]], *data[4:])
+    assert log.record(0)["distances"] == [7, 0]
+    assert type(log.record(0)["times"][0]) is int
+    log.append(*data)
+    assert log.record(1)["distances"] == [7.9, 0]
+    assert log.tables()["vehicles"]["time"].dtype == np.float64
+
+    assert collect_data(
+        1,
+        RoutingSolution([[0, 1, 2, 0]]),
+        [[0.0, 12.7, 25.9]],
+        [[0, 3.4, 7.8]],
+        np.array([0]),
+        [1, 2],
+        np.array([0, 0, 0]),
+        np.array([[0, 100]] * 3),
+        [],
+        [],
+        0,
+    )["times"] == [7.8]
+
+
+def test_collect_sim_results():
+    from project47.simulation import sim, base_policy
+    from project47.customer import Customer
+    import json
+
+    rg = np.random.Generator(np.random.PCG64(123))
+    s = RoutingSolution([[0, 1, 2, 0], [0, 0]])
+    windows = np.array([[0, 100]] * 3)
+    customers = [Customer(rg=rg) for _ in range(3)]
+    arrival_days = np.zeros(3, dtype=int)
+
+    log = DayLog()
+    for dm, collection_dist in [
+        (np.array([[0, 2, 3], [2, 0, 4], [3, 4, 0]]), 0)
+    ] * 2 + [(np.array([[0, 2.5, 3], [2.5, 0, 4], [3, 4, 0]]), 1.5)]:
+        # sim gives float arrays, even for integer matrices
+        results = sim(s, base_policy(dm, dm, windows, customers, rg))
+        args = (0, s, *results, arrival_days, windows, [], [], collection_dist)
+        data = collect_data(*args)
+        log.append(*args)
+        assert json.loads(json.dumps(data)) == data
+
+    data = log.to_json()
+    assert json.dumps(data[0]["distances"]) == "[9, 0]"
+    assert json.dumps(data[0]["times"]) == "[9, 0]"
+    assert json.dumps(data[0]["collection_dist"]) == "0"
+    assert json.dumps(data[2]["distances"]) == "[9.5, 0.0]"
+    assert json.dumps(data[2]["collection_dist"]) == "1.5"
+    assert collect_data(*args) == data[2]
@@ -0,0 +1,89 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.local_repair import *
+
+
+def fake_rerouter(
+    i,
+    route,
+    distance_matrix,
+    time_matrix,
+    time_windows,
+    current_time,
+    alternates={},
+    **kwargs
+):
+    return ["solver"]
+
+
+TIMES = np.array(
+    [
+        [0, 1, 2, 3, 1],
+        [1, 0, 2, 9, 1],
+        [2, 2, 0, 3, 4],
+        [3, 9, 3, 0, 4],
+        [1, 1, 4, 4, 0],
+    ]
+)
+# Only location 3 has a tight window
+WINDOWS = np.array(
+    [[0.0, 10000.0], [0.0, 10000.0], [0.0, 10000.0], [2.0, 3.0], [0.0, 10000.0]]
+)
+
+
+def test_schedule():
+    times, windows = TIMES, WINDOWS.copy()
+    windows[2] = [10, 20]
+    assert np.allclose(schedule([0, 1, 2, 3, 0], times, windows, 0), [0, 1, 10, 13, 16])
+    assert late_stops([0, 1, 2, 3, 0], times, windows, 0).tolist() == [3]
+
+
+def test_repair_drops_late_stop():
+    times, windows = TIMES, WINDOWS.copy()
+    f = repair_rerouting(fake_rerouter)
+
+    # Location 3 can't be reached in time, so gets dropped
+    route = f(1, [0, 1, 3, 2, 4, 0], times, times, windows, 5)
+    assert route[0] == 1 and route[-1] == 0
+    assert sorted(route[1:-1]) == [2, 4]
+    assert len(late_stops(route, times, windows, 5)) == 0
+    assert f.stats == {"repair": 1, "solver": 0}
+
+
+def test_repair_falls_back():
+    times, windows = TIMES, WINDOWS.copy()
+    windows[2] = [0, 1]
+    windows[4] = [0, 1]
+    f = repair_rerouting(fake_rerouter, max_drops=1)
+
+    # Two stops would need dropping, so the solver is used
+    assert f(0, [0, 2, 4, 0], times, times, windows, 5) == ["solver"]
+    # Stops with alternates are left for the solver
+    assert f(0, [0, 2, 1, 0], times, times, windows, 5, {2: [3]}) == ["solver"]
+    assert f.stats == {"repair": 0, "solver": 2}
+
+
+def test_improve_route():
+    times = np.array(
+        [
+            [0, 1, 5, 5],
+            [5, 0, 1, 5],
+            [5, 5, 0, 1],
+            [1, 5, 5, 0],
+        ]
+    )
+    windows = np.array([[0.0, 100.0]] * 4)
+    assert improve_route([0, 2, 1, 3, 0], times, windows, 0) == [0, 1, 2, 3, 0]
+
+
+def test_repair_min_slack():
+    times, windows = TIMES, WINDOWS.copy()
+    windows[4] = [0, 12]
+
+    # The repaired route only has 1 to spare at location 4
+    assert route_slack([1, 2, 4, 0], times, windows, 5) == 1
+    f = repair_rerouting(fake_rerouter, min_slack=1)
+    assert f(1, [0, 1, 3, 2, 4, 0], times, times, windows, 5) != ["solver"]
+    f = repair_rerouting(fake_rerouter, min_slack=2)
+    assert f(1, [0, 1, 3, 2, 4, 0], times, times, windows, 5) == ["solver"]
+    assert f.stats == {"repair": 0, "solver": 1}
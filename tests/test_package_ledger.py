@@ -0,0 +1,93 @@
+from project47.package_ledger import *
+import numpy as np
+
+
+def test_ledger_insert_remove():
+    ledger = PackageLedger(capacity=2)
+    ids = ledger.insert(
+        3,
+        time_windows=[[0, 10], [5, 15], [10, 20]],
+        arrival_days=0,
+        customers=list("abc"),
+    )
+    assert ids.tolist() == [0, 1, 2]
+    ids = ledger.insert(2, time_windows=[0, 100], arrival_days=1, customers=["d", "e"])
+    assert ids.tolist() == [3, 4]
+    assert ledger.capacity >= 5
+    assert ledger["time_windows"].tolist() == [
+        [0, 10],
+        [5, 15],
+        [10, 20],
+        [0, 100],
+        [0, 100],
+    ]
+    assert ledger["arrival_days"].tolist() == [0, 0, 0, 1, 1]
+    assert ledger["customers"].tolist() == list("abcde")
+
+    remap = ledger.remove([1, 3])
+    assert remap.tolist() == [0, -1, 1, -1, 2]
+    assert len(ledger) == 3
+    assert ledger["customers"].tolist() == list("ace")
+    assert ledger.ids_at([0, 1, 2]).tolist() == [0, 2, 4]
+    assert ledger.positions_of([4, 3, 0, 7]).tolist() == [2, -1, 0, -1]
+
+    mask = np.array([True, False, True])
+    ledger.add("futile_count", mask, 1)
+    assert ledger["futile_count"].tolist() == [1, 0, 1]
+
+
+def test_ledger_compact():
+    ledger = PackageLedger()
+    ledger.insert(10, arrival_days=np.arange(10), customers=list(range(10)))
+    ledger.keep(np.arange(10) % 5 == 0)
+    # Only 8/10 removed, so this doesn't need doing yet
+    assert not ledger.compact(min_garbage=0.9)
+    assert ledger.compact(min_garbage=0.5)
+    assert ledger.size == 2
+    assert ledger["arrival_days"].tolist() == [0, 5]
+    assert ledger.data["customers"][2] is None
+    # Ids survive compaction, and new packages carry on from them
+    assert ledger.positions_of([5]).tolist() == [1]
+    assert ledger.insert(1, customers=[10]).tolist() == [10]
+    assert ledger.ids_at(slice(None)).tolist() == [0, 5, 10]
+
+
+def test_multiday_keeps_edited_windows():
+    from project47.multiday_simulation import multiday
+    from project47.customer import Customer
+    from project47.routing import RoutingSolution
+
+    def sample_generator(rg):
+        # Nobody is ever home, so every package carries over to the next day
+        customers = [Customer(0, 0, 0, 1, rg=rg) for _ in range(3)]
+        return customers, np.array([[0, 28800]] * 3)
+
+    def dist_and_time(customers):
+        dm = np.ones((len(customers), len(customers)), dtype=int)
+        return dm, dm
+
+    seen = []
+
+    def route_optimizer(depots, dm, tm, tw, day, arrival_days, futile_count, alt):
+        seen.append(np.array(tw, copy=True))
+        return RoutingSolution([list(range(len(dm))) + [0]]), []
+
+    def simulator(routes, dm, tm, time_windows, customers, rg):
+        # Like calling_policy, closes the window of a package it gives up on
+        time_windows[1] = [0, 1]
+        return [[0] * len(routes.routes[0])], [[0] * len(routes.routes[0])], [0], []
+
+    multiday(
+        np.array([[0], [0]]),
+        sample_generator,
+        dist_and_time,
+        route_optimizer,
+        simulator,
+        2,
+        0,
+        28800,
+        seed=1,
+    )
+    assert seen[0][1].tolist() == [0, 28800]
+    assert seen[1][1].tolist() == [0, 1]
+    assert seen[1][2].tolist() == [0, 28800]
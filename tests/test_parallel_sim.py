@@ -0,0 +1,107 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.parallel_simulation import *
+from project47.alternates import AlternatesIndex
+
+# Vehicle 2 visits the same customers again, and vehicle 3 has nowhere to go
+ROUTES = [[0, 1, 2, 0], [0, 3, 4, 0], [0, 4, 1, 3, 0], [0, 0]]
+
+
+def test_parallel_matches_sim(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(routes=ROUTES)
+    expected = sim(s, base_policy(dm, tm, tw, customers, rg))
+    distances, times, futile, delivered = parallel_sim(
+        s, base_policy, dm, tm, tw, customers, rg, workers=2
+    )
+    assert all(np.allclose(d, e) for d, e in zip(distances, expected[0]))
+    assert all(np.allclose(t, e) for t, e in zip(times, expected[1]))
+    assert np.allclose(futile, expected[2])
+    assert delivered == expected[3]
+
+
+def test_parallel_reproducible(small_problem):
+    results = []
+    for workers in [1, 2, 3]:
+        s, dm, tm, tw, customers, rg = small_problem(0.5, routes=ROUTES)
+        results.append(
+            parallel_sim(s, base_policy, dm, tm, tw, customers, rg, workers=workers)
+        )
+    for distances, times, futile, delivered in results[1:]:
+        assert np.allclose(futile, results[0][2])
+        assert delivered == results[0][3]
+        assert all(np.allclose(t, e) for t, e in zip(times, results[0][1]))
+
+
+def alternates_policy(distance_matrix, time_matrix, time_windows, customers, rg):
+    """Delivers only to customers with alternates, so the result depends on the alternates being kept"""
+    alternates = AlternatesIndex.from_customers(customers)
+
+    def h(route, i, time):
+        return StepResult(
+            distance_matrix[route[i], route[i + 1]],
+            time_matrix[route[i], route[i + 1]],
+            len(alternates[route[i + 1]]) == 0,
+        )
+
+    return h
+
+
+def test_parallel_alternates(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(routes=ROUTES)
+    customers[1].add_alternate(customers[3])
+    results = [
+        parallel_sim(s, alternates_policy, dm, tm, tw, customers, rg, workers=workers)
+        for workers in [1, 2]
+    ]
+    for distances, times, futile, delivered in results:
+        assert futile.tolist() == [2, 2, 2, 1]
+        assert sorted(delivered) == [1, 1, 3, 3]
+
+
+def test_parallel_replications(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(0.5, routes=ROUTES)
+    results = parallel_sim(
+        s, base_policy, dm, tm, tw, customers, rg, workers=2, replications=3
+    )
+
+    # The same as separate calls, with the pool only started once
+    s, dm, tm, tw, customers, rg = small_problem(0.5, routes=ROUTES)
+    with ParallelSimulator(base_policy, dm, tm, tw, customers, workers=1) as p:
+        expected = [p.run(s, rg) for _ in range(3)]
+    assert len(results) == 3
+    for result, e in zip(results, expected):
+        assert np.allclose(result[2], e[2])
+        assert result[3] == e[3]
+
+
+def test_parallel_common_random(small_problem):
+    from project47.common_random import CommonRandomNumbers
+
+    s, dm, tm, tw, customers, rg = small_problem(0.5)
+    crn = CommonRandomNumbers(1)
+    results = [
+        parallel_sim(
+            s,
+            base_policy,
+            dm,
+            tm,
+            tw,
+            customers,
+            rg,
+            workers=workers,
+            replications=4,
+            crn=crn,
+            day=3,
+        )
+        for workers in [1, 2]
+    ]
+    # Customers keep their own streams, so each replication matches sim with them assigned
+    outcomes = set()
+    for r in range(4):
+        crn.assign(customers, 3, r)
+        expected = sim(s, base_policy(dm, tm, tw.copy(), customers, rg))
+        for result in results:
+            assert np.allclose(result[r][2], expected[2])
+            assert result[r][3] == expected[3]
+        outcomes.add(tuple(expected[3]))
+    assert len(outcomes) > 1
@@ -0,0 +1,34 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.policy_comparison import *
+
+
+def test_compare_policies(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(
+        0.5, windows=[[0, 10000], [0, 100], [50, 100], [0, 100], [0, 100]]
+    )
+    policies = {
+        "base": base_policy,
+        "base again": (base_policy, {}),
+        "wait": wait_policy,
+    }
+    inline = compare_policies(
+        s, policies, dm, tm, tw, customers, replications=20, workers=1
+    )
+    parallel = compare_policies(
+        s, policies, dm, tm, tw, customers, replications=20, workers=2
+    )
+    for name in policies:
+        for metric in METRICS:
+            assert np.allclose(inline[name][metric], parallel[name][metric])
+            assert len(inline[name][metric]) == 20
+
+    # Same random numbers for every policy, so the same policy gets the same results
+    assert np.array_equal(inline["base"]["futile"], inline["base again"]["futile"])
+    assert np.var(inline["base"]["futile"]) > 0
+    # Visits are at the same time under both policies, apart from waiting for stop 2
+    assert np.allclose(inline["wait"]["distance"], inline["base"]["distance"])
+
+    summary = summarise(inline, baseline="base")
+    assert summary["base again"]["futile"] == (0, 0)
+    assert summary["wait"]["distance"][0] == 0
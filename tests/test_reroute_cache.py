@@ -0,0 +1,44 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.reroute_cache import *
+
+
+def test_cache_hits(counting_rerouter):
+    times = np.arange(36).reshape((6, 6))
+    windows = np.array([[0.0, 10000.0]] * 6)
+    cache = RerouteCache(maxsize=2, time_bucket=60)
+    rerouter, calls = counting_rerouter()
+    f = memoized_rerouting(cache, rerouter)
+
+    r1 = f(1, [0, 1, 2, 3, 4, 0], times, times, windows, 10)
+    # Same remaining set in a different order, in the same time bucket
+    r2 = f(0, [1, 3, 2, 4, 0], times, times, windows, 50)
+    assert r1 == r2 == [1, 2, 3, 4, 0]
+    assert calls == [(1, 60)]  # Solved at the end of the bucket
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Different time bucket, and different windows, are misses
+    f(1, [0, 1, 2, 3, 4, 0], times, times, windows, 70)
+    windows[3, 1] = 100
+    f(1, [0, 1, 2, 3, 4, 0], times, times, windows, 10)
+    assert cache.misses == 3
+    assert len(cache) == 2  # First result was evicted
+
+    f(1, [0, 1, 2, 3, 4, 0], times, times, windows, 10)
+    assert cache.hits == 2
+
+
+def test_disk_cache(counting_rerouter, tmp_path):
+    times = np.arange(25).reshape((5, 5))
+    windows = np.array([[0.0, 10000.0]] * 5)
+    rerouter, calls = counting_rerouter()
+
+    f = memoized_rerouting(RerouteCache(path=str(tmp_path)), rerouter)
+    f(0, [0, 1, 2, 0], times, times, windows, 0)
+
+    # A new cache (eg in a different process) picks up the result from disk
+    cache = RerouteCache(path=str(tmp_path))
+    g = memoized_rerouting(cache, rerouter)
+    assert g(0, [0, 2, 1, 0], times, times, windows, 0) == [0, 1, 2, 0]
+    assert len(calls) == 1
+    assert cache.disk_hits == 1
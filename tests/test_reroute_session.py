@@ -0,0 +1,81 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.reroute_session import *
+
+# Greedy descent stops at a local optimum, rather than running until the time limit
+solver_kwargs = {
+    "tlim": 5,
+    "fss": routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC,
+    "lsm": routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT,
+}
+
+
+# Random times from 1 to 20
+TIMES = np.random.Generator(np.random.PCG64(123)).random((12, 12))
+TIMES = (TIMES * 20).astype(int) + 1
+# Location 3 closes before any vehicle can get there
+WINDOWS = np.array([[0.0, 1000.0]] * 12)
+WINDOWS[3] = [0, 5]
+
+
+def test_session_matches_rerouting():
+    times, windows = TIMES, WINDOWS.copy()
+    route = [0, 1, 2, 3, 4, 5, 6, 7, 8, 0]
+
+    expected = rerouting_new(2, route, times, times, windows, 10, **solver_kwargs)
+    session = RerouteSession(route, times, windows)
+    assert session.reroute(2, route, 10, **solver_kwargs) == expected
+    assert 3 not in expected
+
+
+def test_session_reused():
+    times, windows = TIMES, WINDOWS.copy()
+    f = session_rerouting(**solver_kwargs)
+
+    route = f(2, [0, 1, 2, 3, 4, 5, 6, 7, 8, 0], times, times, windows, 10, {4: [9]})
+    assert route[0] == 2 and route[-1] == 0
+    windows[route[3]] = [0, 1]
+    route2 = f(2, route, times, times, windows, 50, {4: [9]})
+    assert route2[0] == route[2]
+    assert f.stats == {"created": 1, "reused": 1}
+
+    # A different route object starts a new session
+    f(0, [0, 5, 6, 0], times, times, windows, 0)
+    assert f.stats["created"] == 2
+
+
+def test_session_shrinks():
+    times, windows = TIMES, WINDOWS.copy()
+    route = [0, 1, 2, 3, 4, 5, 6, 7, 8, 0]
+    session = RerouteSession(route, times, windows, {8: [9], 9: [8]})
+    assert len(session.places) == 10
+    session.complete([1, 2, 3, 4, 5, 6])
+    assert sorted(session.places.tolist()) == [0, 7, 8, 9]
+    assert np.allclose(session.tm, times[np.ix_(session.places, session.places)])
+
+
+def test_session_retain():
+    times, windows = TIMES, WINDOWS.copy()
+    route = [0, 1, 2, 3, 4, 5, 6, 7, 8, 0]
+    session = RerouteSession(route, times, windows, {8: [9], 9: [8]})
+
+    # 3 and 5 were dropped, so can't be visited any more, but 9 is an alternate of 8
+    session.retain([2, 4, 6, 7, 8, 0])
+    active = session.places[session.active].tolist()
+    assert sorted(active) == [0, 2, 4, 6, 7, 8, 9]
+
+
+def test_session_bounded():
+    times, windows = TIMES, WINDOWS.copy()
+    f = session_rerouting(max_sessions=1, **solver_kwargs)
+
+    route = f(2, [0, 1, 2, 3, 4, 5, 6, 7, 8, 0], times, times, windows, 10)
+    f(0, [0, 5, 6, 0], times, times, windows, 0)
+    # Only the most recent session is kept
+    f(1, route, times, times, windows, 50)
+    assert f.stats == {"created": 3, "reused": 0}
+
+    # Routes that just go back to the end aren't kept at all
+    end = f(0, [5, 0], times, times, windows, 100)
+    f(0, end, times, times, windows, 100)
+    assert f.stats == {"created": 5, "reused": 0}
@@ -0,0 +1,84 @@
+from project47.reroute_surrogate import *
+import numpy as np
+
+# Stop 2 is closed
+WINDOWS = [[0, 10000], [0, 100], [0, 1], [0, 100], [0, 100]]
+
+
+def test_trivial_repair(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(windows=WINDOWS)
+    route, arrival = trivial_repair(0, [0, 1, 2, 3, 0], tm, tw, 0)
+    assert route == [0, 1, 3, 0]
+    assert np.allclose(arrival, [0, 10, 40, 70])
+
+    features, repaired = reroute_features(1, [0, 1, 2, 3, 0], tm, tw, 10)
+    assert repaired == [1, 3, 0]
+    assert len(features) == len(FEATURES)
+    assert features[FEATURES.index("dropped")] == 1
+
+
+class CountingRerouter:
+    """Stand in for rerouting_new. Gives the trivial repair if anything is dropped, otherwise reverses the stops."""
+
+    def __init__(self, flip=False):
+        self.calls = 0
+        self.flip = flip
+
+    def __call__(self, i, route, dm, tm, tw, current_time, alternates={}, **kwargs):
+        self.calls += 1
+        repaired, _ = trivial_repair(i, route, tm, tw, current_time)
+        if (len(repaired) < len(route) - i) != self.flip:
+            return repaired
+        return [route[i]] + route[i + 1 : -1][::-1] + [route[-1]]
+
+
+def calls(f, tm, tw, n=40):
+    # Alternate between a call that drops stop 2, and one that doesn't drop anything
+    for k in range(n):
+        if k % 2 == 0:
+            f(0, [0, 1, 2, 3, 0], tm, tm, tw, 0)
+        else:
+            f(0, [0, 1, 3, 4, 0], tm, tm, tw, 0)
+
+
+def test_surrogate_skips(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(windows=WINDOWS)
+    surrogate = RerouteSurrogate(audit_every=5)
+    rerouter = CountingRerouter()
+    f = surrogate_rerouting(surrogate, rerouter)
+
+    # Nothing to predict with yet, so everything is solved and logged
+    calls(f, tm, tw)
+    assert rerouter.calls == 40
+    assert surrogate.labels == [0, 1] * 20
+
+    surrogate.fit()
+    rerouter.calls = 0
+    calls(f, tm, tw)
+    # Half the calls are skipped, apart from every 5th skip
+    assert surrogate.skipped == 16
+    assert rerouter.calls == 24
+    assert surrogate.accuracy == 1
+    assert not surrogate.fallback
+
+
+def test_surrogate_fallback(small_problem, tmp_path):
+    s, dm, tm, tw, customers, rg = small_problem(windows=WINDOWS)
+    surrogate = RerouteSurrogate(audit_every=2, min_checks=10)
+    f = surrogate_rerouting(surrogate, CountingRerouter())
+    calls(f, tm, tw)
+    surrogate.save_log(tmp_path / "log.npz")
+
+    # Train a new surrogate from the saved log, and then the solver's behaviour changes
+    surrogate = RerouteSurrogate(audit_every=2, min_checks=10)
+    surrogate.load_log(tmp_path / "log.npz")
+    surrogate.fit()
+    rerouter = CountingRerouter(flip=True)
+    f = surrogate_rerouting(surrogate, rerouter)
+    calls(f, tm, tw)
+    assert surrogate.fallback
+    assert surrogate.accuracy < 0.9
+    # Once fallen back, every call gets solved
+    rerouter.calls = 0
+    calls(f, tm, tw, 10)
+    assert rerouter.calls == 10
@@ -124,6 +124,26 @@ def test_two_disjunctions():
     assert r.objective == 13
 
 
+def test_solution_limit():
+    rg = np.random.default_rng(0)
+    points = rg.random((20, 2)) * 1000
+    times = np.sqrt(((points[:, None] - points[None]) ** 2).sum(-1)).astype(int)
+    windows = np.array([[0, 28800]] * 20)
+
+    routes = []
+    for _ in range(2):
+        r = ORToolsRouting(20, 1)
+        dim, ind = r.add_time_windows(times, windows, 28800, 28800, False, "time")
+        r.search_parameters.local_search_metaheuristic = (
+            routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+        )
+        s = r.solve(tlim=10, log=False, solution_limit=50)
+        # Stops at the solution limit rather than the time limit, with the same answer each time
+        assert r.routing.solver().Solutions() == 50
+        routes.append(s.routes)
+    assert routes[0] == routes[1]
+
+
 if __name__ == "__main__":
     print("sf")
     test_two_disjunctions()
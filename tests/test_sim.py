@@ -1,5 +1,6 @@
 from project47.routing import *
 from project47.simulation import *
+from project47.tracing import *
 
 
 def test_simple_sim():
@@ -24,5 +25,242 @@ def test_simple_sim():
     assert delivered == []
 
 
+def test_sim_record():
+    distances = np.array([[0, 2, 2, 1], [2, 0, 4, 3], [2, 4, 0, 5], [1, 3, 5, 0]])
+    s = RoutingSolution([[0, 1, 2, 0], [0, 3, 0]])
+    windows = {0: [0, 100], 1: [0, 100], 2: [0, 5], 3: [0, 100]}
+
+    record = SimRecord(2)  # Too small, so it has to grow
+    distance, time, futile, delivered = sim(
+        s, default_update_function(distances, distances, windows), record
+    )
+
+    rows = record.rows
+    assert record.size == 7
+    assert rows["vehicle"].tolist() == [0, 0, 0, 0, 1, 1, 1]
+    assert rows["node"].tolist() == [0, 1, 2, 0, 0, 3, 0]
+    assert rows["outcome"].tolist() == [START, DELIVERED, FUTILE, DEPOT] + [
+        START,
+        DELIVERED,
+        DEPOT,
+    ]
+    assert np.allclose(record.totals()[0], [8, 2])
+    assert np.allclose(record.count(FUTILE), futile)
+    assert np.allclose(distance[0], [0, 2, 6, 8])
+
+
+def test_event_sim():
+    distances = np.array([[0, 2, 2, 1], [2, 0, 4, 3], [2, 4, 0, 5], [1, 3, 5, 0]])
+    s = RoutingSolution([[0, 1, 2, 0], [0, 3, 0]])
+    windows = np.array([[0, 100], [0, 100], [0, 5], [0, 100]])
+
+    expected = sim(s, default_update_function(distances, distances, windows))
+    distance, time, futile, delivered = event_sim(
+        s, default_update_function(distances, distances, windows)
+    )
+
+    assert all(np.allclose(d, e) for d, e in zip(distance, expected[0]))
+    assert all(np.allclose(t, e) for t, e in zip(time, expected[1]))
+    assert np.allclose(futile, expected[2])
+    assert sorted(delivered) == sorted(expected[3])
+
+    # Events come out of the queue in time order across vehicles
+    e = EventSimulator(s, default_update_function(distances, distances, windows))
+    order = []
+    while e.queue:
+        order.append(e.step())
+    assert [t for t, _, _ in order] == sorted(t for t, _, _ in order)
+    assert [v for _, v, _ in order] == [0, 1, 1, 0, 0]
+
+
+def test_tracer(tmp_path):
+    times = np.ones((4, 4)) * 10
+    windows = {i: [0, 10000] for i in range(4)}
+    s = RoutingSolution([[0, 1, 2, 3, 0], [0, 3, 0]])
+    tracer = Tracer(capacity=4)
+    sim(s, default_update_function(times, times, windows), tracer=tracer)
+
+    # 8 events, only the last 4 kept
+    assert tracer.count == 8
+    assert tracer.dropped == 4
+    assert tracer.rows["seq"].tolist() == [4, 5, 6, 7]
+    assert tracer.rows["node"].tolist() == [0, 0, 3, 0]
+    assert tracer.rows["event"].tolist() == [DEPOT, START, DELIVERED, DEPOT]
+
+    path = str(tmp_path / "trace.npy")
+    tracer.dump(path)
+    assert (load_trace(path) == tracer.rows).all()
+
+
+def test_step_result():
+    times = np.ones((4, 4)) * 10
+    windows = {i: [0, 10000] for i in range(4)}
+    s = RoutingSolution([[0, 1, 2, 3, 0]])
+    legacy = default_update_function(times, times, windows)
+
+    def skip_two(route, i, time):
+        if route[i + 1] == 2:
+            return StepResult(0, 5, False, True, [route[i]] + list(route[i + 2 :]))
+        return as_step(legacy(route, i, time), route)
+
+    record = SimRecord.for_routes(s.routes)
+    distances, t, futile, delivered = sim(s, skip_two, record)
+    assert delivered == [1, 3]
+    assert np.allclose(t[0], [0, 10, 15, 25, 35])
+    assert record.rows["outcome"].tolist() == [
+        START,
+        DELIVERED,
+        REROUTE,
+        DELIVERED,
+        DEPOT,
+    ]
+
+    # Legacy tuples returning the same route object are never compared
+    assert as_step((1, 2, False, s.routes[0]), s.routes[0]) == StepResult(1, 2, False)
+    assert as_step((1, 2, False, [0, 3, 0]), s.routes[0]).reroute
+
+
+def drop_closed(i, route, dm, tm, tw, current_time, alternates={}, **kwargs):
+    """Quick stand in for rerouting_new, that drops stops with closed time windows"""
+    return [route[i]] + [k for k in route[i + 1 : -1] if tw[k][1] > 1] + [route[-1]]
+
+
+def test_calling_lookahead():
+    from project47.customer import Customer
+
+    rg = np.random.Generator(np.random.PCG64(123))
+    tm = np.full((5, 5), 10) - 10 * np.eye(5, dtype=int)
+    s = RoutingSolution([[0, 1, 2, 3, 4, 0]])
+    # 2 and 4 never answer the phone
+    customers = [Customer(0, 0, 1, 1 - (k % 2 == 0 and k > 0), rg=rg) for k in range(5)]
+
+    reroutes = {}
+    for lookahead in [1, 4]:
+        tw = np.array([[0, 1000]] * 5)
+        h = calling_policy(
+            tm, tm, tw, customers, rg, rerouter=drop_closed, lookahead=lookahead
+        )
+        distance, time, futile, delivered = sim(s, h)
+        assert delivered == [1, 3]
+        assert h.stats["calls"] == (5 if lookahead == 1 else 4)
+        reroutes[lookahead] = h.stats["reroutes"]
+    # One reroute for both of them, rather than one each
+    assert reroutes == {1: 2, 4: 1}
+
+
+def test_calling_lookahead_consistent():
+    from project47.customer import Customer
+
+    rg = np.random.Generator(np.random.PCG64(123))
+    tm = np.full((5, 5), 10) - 10 * np.eye(5, dtype=int)
+    s = RoutingSolution([[0, 1, 2, 3, 4, 0]])
+    customers = [Customer(0, 0, 1, 0.5, rg=rg) for k in range(5)]
+
+    delivered = {}
+    for lookahead in [1, 3]:
+        counts = np.zeros(5)
+        for _ in range(2000):
+            tw = np.array([[0, 1000]] * 5)
+            h = calling_policy(
+                tm, tm, tw, customers, rg, rerouter=drop_closed, lookahead=lookahead
+            )
+            counts[sim(s, h)[3]] += 1
+        delivered[lookahead] = counts / 2000
+    # Each customer answers half the time, either way
+    assert np.allclose(delivered[1][1:], 0.5, atol=0.05)
+    assert np.allclose(delivered[3][1:], 0.5, atol=0.05)
+
+
+def test_calling_unchanged_route(keep_route):
+    from project47.customer import Customer
+
+    rg = np.random.Generator(np.random.PCG64(123))
+    tm = np.full((9, 9), 10) - 10 * np.eye(9, dtype=int)
+    s = RoutingSolution([list(range(9)) + [0]])
+    # 3 never answers the phone
+    customers = [Customer(0, 0, 1, int(k != 3), rg=rg) for k in range(9)]
+
+    for lookahead in [1, 3]:
+        tw = np.array([[0, 1000]] * 9)
+        h = calling_policy(
+            tm, tm, tw, customers, rg, rerouter=keep_route, lookahead=lookahead
+        )
+        distance, time, futile, delivered = sim(s, h)
+        # The reroute didn't change anything, so 3 is still travelled to, and is futile
+        assert distance[0][-1] == 90
+        assert futile.tolist() == [1]
+        assert delivered == [1, 2, 4, 5, 6, 7, 8]
+        # 3 isn't dropped again at each stop it's still ahead of. With lookahead 1, the first reroute is just from
+        # the route being cut down to start at the current stop.
+        assert h.stats["reroutes"] == (2 if lookahead == 1 else 1)
+
+
+def test_new_tw_unchanged_route(keep_route):
+    from project47.customer import Customer
+
+    rg = np.random.Generator(np.random.PCG64(123))
+    tm = np.full((4, 4), 10) - 10 * np.eye(4, dtype=int)
+    s = RoutingSolution([[0, 1, 2, 3, 0]])
+    # Nobody answers the phone, so a late stop gets a closed window
+    customers = [Customer(0, 0, 1, 0, rg=rg) for k in range(4)]
+    tw = np.array([[0, 1000]] * 4)
+    tw[2] = [0, 15]
+
+    h = new_tw_policy(tm, tm, tw, customers, rg, rerouter=keep_route)
+    distance, time, futile, delivered = sim(s, h)
+    # 2 is still travelled to, and is futile rather than delivered
+    assert distance[0][-1] == 40
+    assert futile.tolist() == [1]
+    assert delivered == [1, 3]
+
+
+def test_wrap_rerouting():
+    def rerouter(i, route, dm, tm, tw, current_time, alternates={}, **kwargs):
+        return -1 if kwargs.get("return_obj", False) else list(route[i:])
+
+    def f(i, route, dm, tm, tw, current_time, alternates={}, **kwargs):
+        assert "return_obj" not in kwargs
+        f.stats["calls"] += 1
+        return [route[i], route[-1]]
+
+    f.stats = {"calls": 0}
+    g = wrap_rerouting(f, rerouter)
+    assert g(1, [0, 1, 2, 0], None, None, None, 0) == [1, 0]
+    # Objectives come from the wrapped rerouter
+    assert g(1, [0, 1, 2, 0], None, None, None, 0, {}, return_obj=True) == -1
+    assert g.stats == {"calls": 1}
+
+
+def test_sim_events():
+    distances = np.array([[0, 2, 2, 1], [2, 0, 4, 3], [2, 4, 0, 5], [1, 3, 5, 0]])
+    s = RoutingSolution([[0, 1, 2, 0], [0, 3, 0]])
+    windows = np.array([[0, 100], [0, 100], [0, 5], [0, 100]])
+
+    record = SimRecord()
+    expected = sim(s, default_update_function(distances, distances, windows), record)
+    events = list(sim_events(s, default_update_function(distances, distances, windows)))
+    assert [tuple(e) for e in events] == [tuple(r) for r in record.rows]
+    assert events[2] == SimEvent(0, 2, 2, 6, 6, FUTILE)
+
+    # Interleaved in time order, like event_sim
+    events = sim_events(
+        s, default_update_function(distances, distances, windows), time_order=True
+    )
+    totals = SimTotals(2)
+    order = []
+    events_list = []
+    for event in events:
+        events_list.append(event)
+        totals.update(event)
+        order.append((event.time, event.vehicle))
+    assert order == [(0, 0), (0, 1), (1, 1), (2, 0), (2, 1), (6, 0), (8, 0)]
+    assert np.allclose(totals.distance, [8, 2])
+    assert np.allclose(totals.futile, expected[2])
+    assert totals.delivered == len(expected[3])
+    delivered = [e.node for e in events_list if e.kind == DELIVERED]
+    expected = event_sim(s, default_update_function(distances, distances, windows))
+    assert delivered == expected[3]
+
+
 if __name__ == "__main__":
     test_simple_sim()
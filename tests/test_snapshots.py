@@ -0,0 +1,60 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.snapshots import *
+
+WINDOWS = [[0, 10000], [0, 100], [0, 100], [0, 100], [0, 100]]
+
+
+def skip_next(i, route, dm, tm, tw, current_time, alternates={}, **kwargs):
+    """Quick stand in for rerouting_new, that just drops the next stop"""
+    return route[i : i + 1] + route[i + 2 :]
+
+
+def same_results(a, b):
+    assert all(np.allclose(x, y) for x, y in zip(a[0], b[0]))
+    assert all(np.allclose(x, y) for x, y in zip(a[1], b[1]))
+    assert np.allclose(a[2], b[2])
+    assert a[3] == b[3]
+
+
+def test_branch_matches_full_run(small_problem):
+    for policy, args in [(base_policy, {}), (calling_policy, {"rerouter": skip_next})]:
+        s, dm, tm, tw, customers, rg = small_problem(0.5, 0.5, WINDOWS)
+        expected = EventSimulator(
+            s, policy(dm, tm, tw.copy(), customers, rg, **args)
+        ).run()
+
+        s, dm, tm, tw, customers, rg = small_problem(0.5, 0.5, WINDOWS)
+        simulator = EventSimulator(s, policy(dm, tm, tw, customers, rg, **args))
+        simulator.run(until=15)
+        snapshot = Snapshot.take(simulator, tw, customers, rg)
+        assert snapshot.time > 15
+
+        # Branches don't change the snapshot, so they all get the same results
+        for _ in range(2):
+            same_results(snapshot.branch(policy, dm, tm, args).run(), expected)
+        same_results(simulator.run(), expected)
+
+
+def test_branch_routes(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(0.5, 0.5, WINDOWS)
+    simulator = EventSimulator(s, base_policy(dm, tm, tw, customers, rg))
+    simulator.step()
+    snapshot = Snapshot.take(simulator, tw, customers, rg)
+    # Vehicle 0 is at 1, vehicle 1 is still at the depot
+    distances, times, futile, delivered = snapshot.branch(
+        base_policy, dm, tm, routes={0: [1, 0]}
+    ).run()
+    assert np.allclose(times[0], [0, 10, 10, 20])
+
+
+def test_run_branches(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(0.5, 0.5, WINDOWS)
+    simulator = EventSimulator(s, base_policy(dm, tm, tw, customers, rg))
+    simulator.run(until=15)
+    snapshot = Snapshot.take(simulator, tw, customers, rg)
+    branches = [dict(policy=base_policy), dict(policy=wait_policy)]
+    inline = run_branches(snapshot, branches, dm, tm, workers=1)
+    parallel = run_branches(snapshot, branches, dm, tm, workers=2)
+    for a, b in zip(inline, parallel):
+        same_results(a, b)
@@ -0,0 +1,103 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.batch_simulation import *
+from project47.stopping import *
+from project47.customer import Customer
+
+# Nothing is ever late, so only the responsiveness matters
+OPEN = [[0, 10000]] * 5
+
+
+def test_half_width():
+    assert half_width([1]) == np.inf
+    assert half_width([2, 2, 2]) == 0
+    # t with 3 degrees of freedom is 3.182
+    assert np.isclose(
+        half_width([1, 2, 3, 4]), 3.182 * np.std([1, 2, 3, 4], ddof=1) / 2, atol=1e-3
+    )
+
+
+def test_stops_early_without_variance(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(1, windows=OPEN)
+    stopping = SequentialStopping({"futile": 0.1, "undelivered": 0.1}, batch=5)
+
+    def run_batch(first, n):
+        return batch_sim(s, dm, tm, tw, customers, rg, n)
+
+    results = stopping.run(run_batch, s)
+    assert len(results) == 5
+    assert undelivered_metric(results[0], s) == 0
+
+
+def test_runs_until_precise(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(0.5, windows=OPEN)
+    stopping = SequentialStopping({"futile": 0.2}, batch=5, max_replications=1000)
+
+    def run_batch(first, n):
+        return batch_sim(s, dm, tm, tw, customers, rg, n)
+
+    results = stopping.run(run_batch, s)
+    futile = [futile_metric(r, s) for r in results]
+    assert 10 < len(results) < 1000
+    assert len(results) % 5 == 0
+    assert half_width(futile) <= 0.2
+
+    stopping.max_replications = 12
+    assert len(stopping.run(run_batch, s)) == 12
+    assert stopping.history == [len(results), 12]
+
+
+def test_stopping_needs_results(small_problem):
+    s, dm, tm, tw, customers, rg = small_problem(1, windows=OPEN)
+    for kwargs in [{"max_replications": 0}, {"batch": 0}]:
+        try:
+            SequentialStopping(**kwargs)
+            assert False
+        except ValueError:
+            pass
+
+    stopping = SequentialStopping(batch=5)
+    try:
+        stopping.run(lambda first, n: [], s)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_multiday_replications():
+    from project47.multiday_simulation import multiday
+
+    def sample_generator(rg):
+        return [Customer(rg=rg) for _ in range(3)], np.array([[0, 28800]] * 3)
+
+    def dist_and_time(customers):
+        dm = np.ones((len(customers), len(customers)), dtype=int)
+        return dm, dm
+
+    def route_optimizer(depots, dm, tm, tw, day, arrival_days, futile_count, alt):
+        return RoutingSolution([list(range(len(dm))) + [0]]), []
+
+    def simulator(routes, dm, tm, time_windows, customers, rg):
+        return sim(routes, base_policy(dm, tm, time_windows, customers, rg))
+
+    for stopping in [None, SequentialStopping(batch=2, max_replications=2)]:
+        data = multiday(
+            np.array([[0], [0]]),
+            sample_generator,
+            dist_and_time,
+            route_optimizer,
+            simulator,
+            2,
+            0,
+            28800,
+            seed=1,
+            replications=3,
+            stopping=stopping,
+        )
+        # Only recorded when it's chosen by the stopping rule
+        if stopping is None:
+            assert len(data) == 6
+            assert all("replications" not in d for d in data)
+        else:
+            assert len(data) == 4
+            assert [d["replications"] for d in data] == [2] * 4
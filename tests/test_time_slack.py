@@ -0,0 +1,71 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.time_slack import *
+from project47.local_repair import late_stops
+from project47.customer import Customer
+
+
+def test_matches_schedule():
+    rg = np.random.default_rng(1)
+    times = rg.integers(1, 20, (8, 8))
+    windows = np.zeros((8, 2))
+    windows[:, 0] = rg.integers(0, 40, 8)
+    windows[:, 1] = windows[:, 0] + rg.integers(5, 60, 8)
+    route = [0, 3, 1, 6, 2, 5, 4, 7]
+    windows[route[-1]] = [0, 10000]
+
+    slack = ForwardSlack(route, times, windows, 1, 10)
+    for i in range(1, 7):
+        for delay in [-5, 0, 3, 10, 30]:
+            t = slack.arrival[i] + delay
+            expected = late_stops(route[i:], times, windows, t) + i
+            assert slack.infeasible(i, t).tolist() == expected.tolist()
+
+
+def test_forward_check(counting_rerouter):
+    times = np.ones((6, 6)) * 10
+    windows = np.array([[0.0, 10000.0]] * 6)
+    windows[3] = [0, 25]
+    windows[5] = [0, 35]
+    customers = np.array([Customer() for _ in range(6)])
+    s = RoutingSolution([[0, 1, 2, 3, 4, 5, 0]])
+
+    rerouter, calls = counting_rerouter()
+    policy = estimate_ahead_policy(times, times, windows, customers, rerouter=rerouter)
+    delivered = sim(s, policy)[3]
+    # Only finds out at 2, when 3 is next
+    assert calls == [(2, 20)]
+    assert delivered == [1, 2, 4]
+
+    rerouter, calls = counting_rerouter()
+    policy = estimate_ahead_policy(
+        times, times, windows, customers, rerouter=rerouter, forward_check=True
+    )
+    delivered = sim(s, policy)[3]
+    # Sees both are late before leaving the depot, and reroutes once
+    assert calls == [(0, 0)]
+    assert delivered == [1, 2, 4]
+
+
+def test_forward_check_unchanged_route(keep_route):
+    times = np.ones((5, 5)) * 10
+    windows = np.array([[0.0, 10000.0]] * 5)
+    windows[3] = [0, 25]
+    customers = np.array([Customer() for _ in range(5)])
+    s = RoutingSolution([[0, 1, 2, 3, 4, 0]])
+
+    for forward_check in [False, True]:
+        policy = estimate_ahead_policy(
+            times,
+            times,
+            windows.copy(),
+            customers,
+            rerouter=keep_route,
+            forward_check=forward_check,
+        )
+        distances, times_taken, futile, delivered = sim(s, policy)
+        # Every stop is still travelled to, and 3 is futile rather than delivered
+        assert distances[0][-1] == 50
+        assert times_taken[0][-1] == 50
+        assert futile.tolist() == [1]
+        assert delivered == [1, 2, 4]
@@ -0,0 +1,82 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.batch_simulation import *
+from project47.travel_noise import *
+from project47.customer import Customer
+from numpy.random import Generator, PCG64
+
+
+def test_lognormal_noise():
+    rg = Generator(PCG64(123))
+    noise = LognormalNoise(0.3)
+    m = noise.sample_arcs([0, 1, 2], [1, 2, 0], rg, (20000,))
+    assert m.shape == (20000, 3)
+    assert m.dtype == np.float32
+    assert np.allclose(m.mean(axis=0), 1, atol=0.02)
+    assert np.allclose(np.log(m).std(axis=0), 0.3, atol=0.02)
+
+    # Class 0 arcs have no noise at all
+    classes = np.array([[0, 1], [1, 0]])
+    noise = LognormalNoise([0, 0.5], classes)
+    m = noise.sample_matrix(2, rg)
+    assert np.allclose(np.diag(m), 1)
+    assert not np.allclose(m[0, 1], 1)
+
+
+def test_noisy_times_sim():
+    rg = Generator(PCG64(123))
+    tm = np.array([[0, 10, 20], [10, 0, 10], [20, 10, 0]])
+    tw = np.array([[0, 1000], [0, 1000], [0, 1000]])
+    customers = [Customer(0, 0, 1, 1, rg=rg) for _ in range(3)]
+    s = RoutingSolution([[0, 1, 2, 0]])
+
+    times = LognormalNoise(0.2).times(tm, rg)
+    assert times[0, 1] == 10
+    distances, time, futile, delivered = sim(
+        s, base_policy(tm, times, tw, customers, rg)
+    )
+    expected = np.cumsum([0] + [times(i, j, 0) for i, j in [(0, 1), (1, 2), (2, 0)]])
+    assert np.allclose(time[0], expected)
+    assert not np.allclose(time[0], [0, 10, 20, 40])
+
+
+def test_batch_noise():
+    rg = Generator(PCG64(123))
+    tm = np.array([[0, 10, 20], [10, 0, 10], [20, 10, 0]])
+    # Stop 2 is only there for the first 25 minutes
+    tw = np.array([[0, 1000], [0, 1000], [0, 1000]])
+    customers = [Customer(0, 0, 1, 1, rg=rg)] + [
+        Customer(0, 0, 1, 1, presence=np.array([1, 0]), presence_interval=25, rg=rg)
+        for _ in range(2)
+    ]
+    s = RoutingSolution([[0, 1, 2, 0]])
+
+    results = batch_sim(
+        s, tm, tm, tw, customers, rg, replications=4000, noise=LognormalNoise(0.3)
+    )
+    times = np.array([r[1][0] for r in results])
+    assert times.shape == (4000, 4)
+    assert np.allclose(times.mean(axis=0), [0, 10, 20, 40], rtol=0.02)
+    # Every replication is consistent with its own arrival times
+    missed = np.array([2 not in r[3] for r in results])
+    assert np.array_equal(missed, times[:, 2] >= 25)
+    assert 0 < missed.mean() < 1
+
+
+def test_batch_noise_per_arc():
+    rg = Generator(PCG64(123))
+    tm = np.array([[0, 10, 20], [10, 0, 10], [20, 10, 0]])
+    tw = np.array([[0, 1000], [0, 1000], [0, 1000]])
+    customers = [Customer(0, 0, 1, 1, rg=rg) for _ in range(3)]
+    # Both vehicles travel 0 -> 1 and back, and the second goes round again
+    s = RoutingSolution([[0, 1, 0], [0, 1, 0, 1, 0]])
+
+    results = batch_sim(
+        s, tm, tm, tw, customers, rg, replications=100, noise=LognormalNoise(0.3)
+    )
+    for r in results:
+        first, second = map(np.array, r[1])
+        # The same arcs take the same time in a replication, as they do with NoisyTimes in sim
+        assert np.allclose(second[:3], first)
+        assert np.allclose(second[3:] - second[2], first[1:])
+    assert len(set(r[1][0][1] for r in results)) > 1
@@ -0,0 +1,50 @@
+from project47.routing import *
+from project47.simulation import *
+from project47.travel_time import *
+from project47.customer import Customer
+
+
+def test_lookup():
+    times = np.full((3, 3), 10) - 10 * np.eye(3, dtype=int)
+    tt = TravelTimes.from_matrix(times, [1, 3, 2], 100)
+    assert tt.tensor.dtype == np.float32
+    assert tt(0, 1, 0) == 10
+    assert tt(0, 1, 150) == 30
+    assert tt(0, 1, 250) == 20
+    assert tt(0, 1, 10000) == 20  # Past the end uses the last slice
+    assert tt[0, 1] == 10  # Static fallback
+    assert np.allclose(tt.matrix(120), times * 3)
+    assert default_time_function(tt) is tt
+
+
+def test_memmap(tmp_path):
+    times = np.full((3, 3), 10) - 10 * np.eye(3, dtype=int)
+    path = str(tmp_path / "tt.npy")
+    tt = TravelTimes.from_matrix(times, [1, 3, 2], 100, path=path)
+    loaded = TravelTimes.load(path, 100)
+    assert isinstance(loaded.tensor, np.memmap)
+    assert np.allclose(loaded.tensor, tt.tensor)
+    assert loaded(2, 0, 199) == 30
+
+
+def test_sim_peak():
+    times = np.ones((3, 3)) * 10
+    tt = TravelTimes.from_matrix(times, [1, 3, 2], 25)
+    windows = np.array([[0.0, 10000.0]] * 3)
+    customers = [Customer() for _ in range(3)]
+    s = RoutingSolution([[0, 1, 2, 1, 2, 0]])
+    distances, t, futile, delivered = sim(s, base_policy(times, tt, windows, customers))
+    # Leaves at 20 before the peak, 30 in the peak, then 60 after it
+    assert np.allclose(t[0], [0, 10, 20, 30, 60, 80])
+
+
+def test_time_dependent_routing():
+    times = np.full((3, 3), 10) - 10 * np.eye(3, dtype=int)
+    tt = TravelTimes.from_matrix(times, [1, 3, 2], 100)
+    windows = np.array([[0.0, 10000.0], [0.0, 100.0], [100.0, 200.0]])
+    r = ORToolsRouting(3, 1)
+    dim, ind = r.add_time_dependent_windows(tt, windows, 100, 1000, False, "time")
+    s = r.solve(tlim=1, log=False)
+    assert s.routes == [[0, 1, 2, 0]]
+    # Leaving 2 is in the peak
+    assert r.objective == 50